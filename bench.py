@@ -0,0 +1,336 @@
+"""Đo hiệu năng các đường xử lý chính của thuha.py, chạy offline với translator và TTS giả lập
+
+    python bench.py                                  # chạy đầy đủ, in bảng kết quả
+    python bench.py --quick --output bench.json      # kích thước nhỏ, ghi kết quả JSON
+    python bench.py --baseline bench.json            # so với lần chạy trước, lỗi nếu chậm hơn quá ngưỡng
+    python bench.py --only history,quiz              # chỉ chạy một số nhóm
+"""
+import argparse
+import functools
+import io
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from streamlit import logger as streamlit_logger
+
+import thuha
+
+# Thư mục tạm cho database và cache của lần chạy, tạo trong main()
+WORK_DIR = None
+
+RUSSIAN_STEMS = ['книг', 'дом', 'город', 'работ', 'человек', 'врем', 'слов', 'мир', 'дел', 'жизн',
+                 'рук', 'глаз', 'вопрос', 'сторон', 'страх', 'земл', 'голов', 'друг', 'пут', 'дорог']
+RUSSIAN_ENDINGS = ['', 'а', 'ы', 'у', 'ом', 'ами', 'ах', 'е', 'и', 'ой']
+CHINESE_WORDS = ['我们', '研究', '学习', '中国', '历史', '文化', '经济', '发展', '问题', '社会',
+                 '语言', '科学', '技术', '老师', '学生', '今天', '明天', '工作', '生活', '国家']
+
+
+class StubTranslator(thuha.Translator):
+    """Translator giả: trả về ngay, không cần mạng"""
+    supports_batch = True
+
+    def translate(self, text):
+        return "\n".join(f"nghĩa của {line}" for line in text.split("\n"))
+
+
+def stub_synthesize(text, lang, path):
+    """TTS giả: ghi một file MP3 nhỏ cố định"""
+    with open(path, 'wb') as fp:
+        fp.write(b'ID3' + b'\0' * 2048)
+
+
+def russian_text(num_words, rng):
+    return " ".join(rng.choice(RUSSIAN_STEMS) + rng.choice(RUSSIAN_ENDINGS) + rng.choice(['', str(rng.randint(0, 50))])
+                    for _ in range(num_words))
+
+
+def chinese_text(num_words, rng):
+    return "".join(rng.choice(CHINESE_WORDS) + ("。" if rng.random() < 0.1 else "") for _ in range(num_words))
+
+
+def make_pdf(pages):
+    """PDF tối giản, mỗi trang một dòng chữ ASCII (font Helvetica chuẩn)"""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>"]
+    kids = " ".join(f"{3 + 2 * i} 0 R" for i in range(len(pages)))
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>".encode())
+    font_id = 3 + 2 * len(pages)
+    for i, text in enumerate(pages):
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {4 + 2 * i} 0 R "
+                       f"/Resources << /Font << /F1 {font_id} 0 R >> >> >>".encode())
+        stream = f"BT /F1 10 Tf 40 750 Td ({text}) Tj ET".encode()
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for i, obj in enumerate(objects):
+        offsets.append(len(out))
+        out += f"{i + 1} 0 obj\n".encode() + obj + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return out
+
+
+def make_docx(paragraphs):
+    docx = thuha.lazy_import('docx')
+    document = docx.Document()
+    for paragraph in paragraphs:
+        document.add_paragraph(paragraph)
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+def measure(func, repeat, setup=None):
+    """Chạy func repeat lần (setup chạy trước mỗi lần, không tính giờ), trả về thời gian theo giây"""
+    times = []
+    for _ in range(repeat):
+        args = setup() if setup else ()
+        start = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start)
+    return {'median': statistics.median(times), 'min': min(times), 'runs': repeat}
+
+
+def use_database(name):
+    """Chuyển thuha sang một file database mới trong thư mục tạm"""
+    thuha.DB_PATH = os.path.join(WORK_DIR, f'{name}.db')
+    thuha.init_database()
+
+
+def seed_history(num_rows, rng, language='russian', batch_size=10000):
+    """Ghi thẳng num_rows dòng learning_history (không qua hàm được đo)"""
+    now = thuha.datetime.now()
+    with thuha.db_connection() as conn:
+        for start in range(0, num_rows, batch_size):
+            rows = []
+            for i in range(start, min(start + batch_size, num_rows)):
+                correct, wrong = rng.randint(0, 5), rng.randint(0, 5)
+                when = now - thuha.timedelta(days=rng.random() * 60)
+                due = now + thuha.timedelta(days=rng.random() * 60 - 30)
+                rows.append((language, f'слово{i}', f'nghĩa {i}', correct, wrong, when, due))
+            conn.executemany('''INSERT INTO learning_history
+                                (language, word, translation, correct_count, wrong_count, last_reviewed, due_at)
+                                VALUES (?, ?, ?, ?, ?, ?, ?)''', rows)
+
+
+def bench_extract(sizes, repeat, rng):
+    results = {}
+    for pages in sizes['pdf_pages']:
+        data = make_pdf([" ".join(f"word{rng.randint(0, 5000)}" for _ in range(60)) for _ in range(pages)])
+        results[f'extract_text_from_pdf[pages={pages}]'] = measure(
+            thuha.extract_text_from_pdf, repeat, setup=lambda: (io.BytesIO(data),))
+    for paragraphs in sizes['docx_paragraphs']:
+        data = make_docx([russian_text(40, rng) for _ in range(paragraphs)])
+        results[f'extract_text_from_docx[paragraphs={paragraphs}]'] = measure(
+            thuha.extract_text_from_docx, repeat, setup=lambda: (io.BytesIO(data),))
+    for num_words in sizes['text_words']:
+        data = russian_text(num_words, rng).encode('utf-8')
+        results[f'extract_text_from_txt[words={num_words}]'] = measure(
+            thuha.extract_text_from_txt, repeat, setup=lambda: (io.BytesIO(data),))
+    return results
+
+
+def bench_words(sizes, repeat, rng):
+    results = {}
+    for num_words in sizes['text_words']:
+        text = russian_text(num_words, rng)
+        results[f'extract_words[russian,words={num_words}]'] = measure(
+            lambda: thuha.extract_words('russian', text), repeat)
+        text = chinese_text(num_words, rng)
+        # Lần đầu nạp từ điển jieba, không tính vào kết quả
+        thuha.extract_words('chinese', text[:100])
+        results[f'extract_words[chinese,words={num_words}]'] = measure(
+            lambda: thuha.extract_words('chinese', text), repeat)
+    return results
+
+
+def bench_translate(sizes, repeat, rng):
+    results = {}
+    use_database('translate')
+    counter = iter(range(sys.maxsize))
+    for num_words in sizes['translate_words']:
+        # Mỗi lần chạy dùng từ mới để không trúng bộ nhớ dịch của lần trước
+        def fresh_words():
+            run = next(counter)
+            return ([f'слово{run}x{i}' for i in range(num_words)],)
+        results[f'translate_words[cold,words={num_words}]'] = measure(
+            lambda words: thuha.translate_words('russian', words, translator_factory=StubTranslator),
+            repeat, setup=fresh_words)
+        warm_words = fresh_words()[0]
+        thuha.translate_words('russian', warm_words, translator_factory=StubTranslator)
+        thuha.get_write_queue(thuha.DB_PATH).flush()  # bộ nhớ dịch được ghi nền, chờ ghi xong
+        results[f'translate_words[cached,words={num_words}]'] = measure(
+            lambda: thuha.translate_words('russian', warm_words, translator_factory=StubTranslator), repeat)
+    return results
+
+
+def bench_quiz(sizes, repeat, rng):
+    results = {}
+    for deck_size in sizes['quiz_deck']:
+        translations = {f'слово{i}': f'nghĩa số {rng.randint(0, deck_size)}' for i in range(deck_size)}
+        results[f'Deck[deck={deck_size}]'] = measure(
+            lambda: thuha.Deck(thuha.Deck.make_id('russian', translations), 'russian', translations), repeat)
+        deck = thuha.Deck(thuha.Deck.make_id('russian', translations), 'russian', translations)
+        results[f'create_quiz[deck={deck_size}]'] = measure(
+            lambda: thuha.create_quiz(deck, 30), repeat)
+        thuha.create_quiz(deck, 1, hard=True)
+        results[f'create_quiz[hard,deck={deck_size}]'] = measure(
+            lambda: thuha.create_quiz(deck, 30, hard=True), repeat)
+    return results
+
+
+def bench_tts(sizes, repeat, rng):
+    cache = thuha.AudioCache(os.path.join(WORK_DIR, 'tts_bench'), thuha.TTS_CACHE_MAX_BYTES,
+                             synthesize=stub_synthesize)
+    counter = iter(range(sys.maxsize))
+    return {
+        'text_to_speech[miss]': measure(lambda: cache.fetch(f'слово{next(counter)}', 'ru'), repeat),
+        'text_to_speech[hit]': measure(lambda: cache.fetch('слово0', 'ru'), repeat),
+    }
+
+
+def bench_history(sizes, repeat, rng):
+    results = {}
+    for num_rows in sizes['history_rows']:
+        use_database(f'history_{num_rows}')
+        seed_history(num_rows, rng)
+        quiz_results = [(f'слово{rng.randrange(num_rows)}', 'nghĩa', rng.random() < 0.5) for _ in range(30)]
+        results[f'save_to_history[rows={num_rows}]'] = measure(
+            lambda: thuha.save_to_history('russian', f'слово{rng.randrange(num_rows)}', 'nghĩa', True).result(),
+            repeat)
+        results[f'save_results_to_history[30 results,rows={num_rows}]'] = measure(
+            lambda: thuha.save_results_to_history('russian', quiz_results).result(), repeat)
+        results[f'get_learning_stats[rows={num_rows}]'] = measure(
+            lambda: thuha.get_learning_stats('russian'), repeat)
+        results[f'get_due_words[rows={num_rows}]'] = measure(
+            lambda: thuha.get_due_words('russian', thuha.DUE_REVIEW_DEFAULT), repeat)
+        results[f'get_history_page[rows={num_rows}]'] = measure(
+            lambda: thuha.get_history_page('russian', "🏆 Đúng nhiều nhất"), repeat)
+    return results
+
+
+BENCHMARKS = {
+    'extract': bench_extract,
+    'words': bench_words,
+    'translate': bench_translate,
+    'quiz': bench_quiz,
+    'tts': bench_tts,
+    'history': bench_history,
+}
+
+SIZES = {
+    'quick': {
+        'pdf_pages': [10, 50],
+        'docx_paragraphs': [100, 1000],
+        'text_words': [10000, 50000],
+        'translate_words': [100, 1000],
+        'quiz_deck': [1000, 10000],
+        'history_rows': [1000, 10000],
+    },
+    'full': {
+        'pdf_pages': [10, 100, 500],
+        'docx_paragraphs': [100, 1000, 10000],
+        'text_words': [10000, 100000, 1000000],
+        'translate_words': [100, 1000, 10000],
+        'quiz_deck': [1000, 10000, 50000],
+        'history_rows': [1000, 10000, 100000, 1000000],
+    },
+}
+
+
+def compare(results, baseline, threshold, min_delta):
+    """Trả về danh sách mục chậm hơn baseline quá ngưỡng (bỏ qua chênh lệch tuyệt đối nhỏ hơn min_delta)"""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get('results', {}).get(name)
+        if before is None:
+            continue
+        delta = result['median'] - before['median']
+        if delta > min_delta and result['median'] > before['median'] * (1 + threshold):
+            regressions.append((name, before['median'], result['median']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Đo hiệu năng thuha.py (offline)")
+    parser.add_argument('--quick', action='store_true', help="Dùng kích thước nhỏ (chạy nhanh, cho CI)")
+    parser.add_argument('--repeat', type=int, default=5, help="Số lần chạy mỗi mục (lấy trung vị)")
+    parser.add_argument('--only', help=f"Chỉ chạy các nhóm, cách nhau bởi dấu phẩy: {', '.join(BENCHMARKS)}")
+    parser.add_argument('--output', help="Ghi kết quả ra file JSON")
+    parser.add_argument('--baseline', help="File JSON của lần chạy trước để so sánh")
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help="Tỷ lệ chậm hơn baseline tối đa cho phép (mặc định 0.25 = 25%%)")
+    parser.add_argument('--min-delta', type=float, default=0.001,
+                        help="Bỏ qua chênh lệch nhỏ hơn số giây này (nhiễu đo)")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    groups = args.only.split(',') if args.only else list(BENCHMARKS)
+    unknown = [group for group in groups if group not in BENCHMARKS]
+    if unknown:
+        parser.error(f"nhóm không tồn tại: {', '.join(unknown)}")
+
+    # Hàm Streamlit chạy ngoài app chỉ in cảnh báo, không cần hiện
+    streamlit_logger.set_log_level(logging.ERROR)
+    # Translator giả không cần giới hạn request/giây, không muốn đo thời gian chờ của bộ giới hạn
+    thuha.translate_batch = functools.partial(thuha.translate_batch, requests_per_second=0)
+
+    # Database và file tạm riêng: không đụng dữ liệu thật, không tra từ điển offline
+    global WORK_DIR
+    WORK_DIR = tempfile.mkdtemp(prefix='thuha_bench_')
+    thuha.DICTIONARY_DIR = os.path.join(WORK_DIR, 'dictionaries')
+
+    sizes = SIZES['quick' if args.quick else 'full']
+    rng = random.Random(args.seed)
+    results = {}
+    try:
+        for group in groups:
+            for name, result in BENCHMARKS[group](sizes, args.repeat, rng).items():
+                results[name] = result
+                print(f"{name:<55} {result['median'] * 1000:>10.2f} ms (min {result['min'] * 1000:.2f} ms)")
+    finally:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'created_at': thuha.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'max_processes': thuha.MAX_PROCESSES,
+            'quick': args.quick,
+            'repeat': args.repeat,
+            'groups': groups,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as fp:
+            json.dump(report, fp, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as fp:
+            baseline = json.load(fp)
+        regressions = compare(results, baseline, args.threshold, args.min_delta)
+        for name, before, after in regressions:
+            print(f"CHẬM HƠN: {name}: {before * 1000:.2f} ms -> {after * 1000:.2f} ms "
+                  f"(+{(after / before - 1) * 100:.0f}%)")
+        if regressions:
+            return 1
+        print(f"Không có mục nào chậm hơn baseline quá {args.threshold:.0%}.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
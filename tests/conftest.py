@@ -0,0 +1,18 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import thuha  # noqa: E402
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """Database học tập mới trong thư mục tạm, đã chạy đủ migration"""
+    path = str(tmp_path / 'learning_history.db')
+    monkeypatch.setattr(thuha, 'DB_PATH', path)
+    thuha.init_database()
+    yield path
+    thuha.get_write_queue(path).close()
@@ -0,0 +1,114 @@
+import os
+import threading
+
+import pytest
+
+import thuha
+
+
+class StubSynthesizer:
+    """Thay cho gTTS: ghi size byte vào file, đếm số lần gọi theo từ"""
+
+    def __init__(self, size=100):
+        self.size = size
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, text, lang, path):
+        with self._lock:
+            self.calls.append((text, lang))
+        with open(path, 'wb') as fp:
+            fp.write(b'x' * self.size)
+
+
+def make_cache(tmp_path, synthesize, max_bytes=10000, executor=None):
+    return thuha.AudioCache(str(tmp_path / 'tts'), max_bytes, synthesize=synthesize, executor=executor)
+
+
+def test_fetch_miss_then_hit(tmp_path):
+    synth = StubSynthesizer()
+    cache = make_cache(tmp_path, synth)
+
+    assert cache.get('книга', 'ru') is None
+    path = cache.fetch('книга', 'ru')
+    assert os.path.getsize(path) == 100
+    assert cache.fetch('книга', 'ru') == path
+    assert cache.get('книга', 'ru') == path
+    assert synth.calls == [('книга', 'ru')]
+    # Cùng chữ, khác ngôn ngữ là file khác
+    assert cache.fetch('книга', 'zh-CN') != path
+
+
+def test_evicts_least_recently_used_by_size(tmp_path):
+    cache = make_cache(tmp_path, StubSynthesizer(size=100), max_bytes=250)
+    path_a = cache.fetch('a', 'ru')
+    path_b = cache.fetch('b', 'ru')
+    cache.get('a', 'ru')  # a được dùng gần hơn b
+    path_c = cache.fetch('c', 'ru')
+
+    assert not os.path.exists(path_b)
+    assert cache.get('b', 'ru') is None
+    assert os.path.exists(path_a) and os.path.exists(path_c)
+    assert cache.get('a', 'ru') == path_a
+
+
+def test_rebuilds_index_from_disk(tmp_path):
+    synth = StubSynthesizer(size=100)
+    first = make_cache(tmp_path, synth)
+    path_a = first.fetch('a', 'ru')
+    os.utime(path_a, (1, 1))  # a cũ nhất theo thời gian sửa
+    first.fetch('b', 'ru')
+
+    reopened = make_cache(tmp_path, synth, max_bytes=250)
+    assert reopened.get('b', 'ru') is not None
+    assert len(synth.calls) == 2
+    reopened.fetch('c', 'ru')
+    # Thứ tự LRU khôi phục từ thời gian sửa: a bị xóa trước
+    assert not os.path.exists(path_a)
+    assert reopened.get('b', 'ru') is not None
+
+
+def test_concurrent_claims_share_one_synthesis(tmp_path):
+    started = threading.Event()
+    release = threading.Event()
+    synth = StubSynthesizer()
+
+    def slow_synthesize(text, lang, path):
+        started.set()
+        release.wait(5)
+        synth(text, lang, path)
+
+    cache = make_cache(tmp_path, slow_synthesize)
+    results = []
+    worker = threading.Thread(target=lambda: results.append(cache.fetch('книга', 'ru')))
+    worker.start()
+    assert started.wait(5)
+
+    future = cache._claim('книга', 'ru')
+    assert cache.status('книга', 'ru') == ('pending', future)
+    release.set()
+    worker.join(5)
+
+    assert future.result(5) == results[0]
+    assert synth.calls == [('книга', 'ru')]
+
+
+def test_failed_synthesis_removes_temp_file(tmp_path):
+    def failing_synthesize(text, lang, path):
+        with open(path, 'wb') as fp:
+            fp.write(b'half')
+        raise RuntimeError("mất mạng")
+
+    cache = make_cache(tmp_path, failing_synthesize)
+    with pytest.raises(RuntimeError):
+        cache.fetch('книга', 'ru')
+
+    assert os.listdir(cache.directory) == []
+    assert cache.get('книга', 'ru') is None
+    assert cache.status('книга', 'ru') == ('failed', "mất mạng")
+
+    # Thử lại thành công thì xóa trạng thái lỗi
+    cache.synthesize = StubSynthesizer()
+    assert cache.status('книга', 'ru')[0] == 'failed'
+    path = cache.fetch('книга', 'ru')
+    assert cache.status('книга', 'ru') == ('ready', path)
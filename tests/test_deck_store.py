@@ -0,0 +1,44 @@
+import thuha
+
+
+def translations(n, prefix='слово'):
+    return {f'{prefix}{i}': f'nghĩa {i % 5}' for i in range(n)}
+
+
+def test_deck_shares_meanings_and_keeps_order():
+    deck = thuha.Deck('id', 'russian', {'книга': 'sách', 'книги': 'sách', 'дом': 'nhà'})
+
+    assert deck.answers == ('sách', 'nhà')
+    assert list(deck.items()) == [('книга', 'sách'), ('книги', 'sách'), ('дом', 'nhà')]
+    assert deck.translation(2) == 'nhà'
+
+
+def test_same_content_gives_the_same_deck():
+    store = thuha.DeckStore(1 << 20)
+    deck = store.put('russian', translations(10))
+
+    assert store.put('russian', translations(10)) is deck
+    assert store.put('chinese', translations(10)).deck_id != deck.deck_id
+    assert store.get(deck.deck_id) is deck
+
+
+def test_evicted_deck_is_rebuilt_from_the_database(db_path):
+    first_items = translations(50, 'первый')
+    first = thuha.Deck(thuha.Deck.make_id('russian', first_items), 'russian', first_items)
+    # Kho chỉ đủ chỗ cho một bộ từ: tạo bộ thứ hai thì bộ thứ nhất bị xóa khỏi bộ nhớ
+    store = thuha.DeckStore(first.estimate_size(), load=thuha.load_deck, save=thuha.save_deck)
+    first = store.put('russian', first_items)
+    second = store.put('russian', translations(50, 'второй'))
+    assert store._lookup(first.deck_id) is None
+
+    reloaded = store.get(first.deck_id)
+    assert reloaded is not first
+    assert (reloaded.deck_id, reloaded.language) == (first.deck_id, 'russian')
+    assert list(reloaded.items()) == list(first.items())
+    # Dựng lại bộ thứ nhất đẩy bộ thứ hai ra, bộ thứ hai cũng được dựng lại khi cần
+    assert list(store.get(second.deck_id).items()) == list(second.items())
+
+
+def test_unknown_deck_is_none(db_path):
+    store = thuha.DeckStore(1 << 20, load=thuha.load_deck, save=thuha.save_deck)
+    assert store.get('không có') is None
@@ -0,0 +1,77 @@
+import os
+import time
+
+import pytest
+
+import thuha
+
+
+def write_source(path, lines):
+    path.write_text("\n".join(lines) + "\n", encoding='utf-8')
+    return str(path)
+
+
+def test_compiled_index_finds_every_word(tmp_path):
+    words = [f'слово{i}' for i in range(500)]
+    source = write_source(tmp_path / 'ru-vi.tsv', ['# chú thích', ''] + [f'{w}\tnghĩa {w}' for w in words])
+    index_path = str(tmp_path / 'ru-vi.idx')
+
+    assert thuha.compile_dictionary(source, index_path) == 500
+    dictionary = thuha.DictionaryTranslator(index_path)
+    assert all(dictionary.lookup(w) == f'nghĩa {w}' for w in words)
+    assert dictionary.lookup('  СЛОВО7 ') == 'nghĩa слово7'
+    assert dictionary.lookup('нет') is None
+    with pytest.raises(LookupError):
+        dictionary.translate('нет')
+
+
+def test_first_meaning_wins_and_cedict_lines_are_parsed(tmp_path):
+    source = write_source(tmp_path / 'zh-CN-vi.u8', [
+        '學習 学习 [xue2 xi2] /học tập/học/',
+        'книга\tsách',
+        'Книга\tcuốn sách',
+    ])
+    index_path = str(tmp_path / 'zh-CN-vi.idx')
+    thuha.compile_dictionary(source, index_path)
+    dictionary = thuha.DictionaryTranslator(index_path)
+
+    assert dictionary.lookup('学习') == 'học tập; học'
+    assert dictionary.lookup('книга') == 'sách'
+
+
+def test_invalid_index_is_rejected(tmp_path):
+    path = tmp_path / 'bad.idx'
+    path.write_bytes(b'not an index')
+    with pytest.raises(ValueError):
+        thuha.DictionaryTranslator(str(path))
+
+
+def test_load_dictionary_recompiles_when_source_changes(tmp_path, monkeypatch):
+    monkeypatch.setattr(thuha, 'DICTIONARY_DIR', str(tmp_path))
+    source = tmp_path / 'ru-vi.tsv'
+    write_source(source, ['книга\tsách'])
+    assert thuha.load_dictionary('ru').lookup('книга') == 'sách'
+
+    write_source(source, ['книга\tquyển sách', 'дом\tnhà'])
+    later = time.time() + 10
+    os.utime(source, (later, later))
+    dictionary = thuha.load_dictionary('ru')
+    assert dictionary.lookup('книга') == 'quyển sách'
+    assert dictionary.lookup('дом') == 'nhà'
+    assert thuha.load_dictionary('zh-CN') is None
+
+
+def test_translate_words_only_calls_network_for_dictionary_misses(db_path, tmp_path, monkeypatch):
+    monkeypatch.setattr(thuha, 'DICTIONARY_DIR', str(tmp_path))
+    write_source(tmp_path / 'ru-vi.tsv', ['книга\tsách'])
+    requests = []
+
+    class Network(thuha.Translator):
+        def translate(self, text):
+            requests.append(text)
+            return 'vi:' + text
+
+    result = thuha.translate_words('russian', ['книга', 'дом'], translator_factory=Network,
+                                   on_progress=lambda done, total: None)
+    assert result == {'книга': 'sách', 'дом': 'vi:дом'}
+    assert requests == ['дом']
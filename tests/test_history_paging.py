@@ -0,0 +1,43 @@
+import pytest
+
+import thuha
+
+
+@pytest.fixture
+def history(db_path):
+    # Nhiều dòng trùng khóa sắp xếp: cùng lô ghi (cùng last_reviewed) và cùng số lần đúng
+    thuha.save_results_to_history('russian', [(f'слово{i:02d}', f'nghĩa {i}', i % 3 == 0) for i in range(23)]).result(5)
+    thuha.save_results_to_history('russian', [('100%_дом', 'nhà', True), ('книга', 'sách', False)]).result(5)
+    thuha.save_results_to_history('chinese', [('学习', 'học', True)]).result(5)
+
+
+def all_pages(sort, **kwargs):
+    rows, after = thuha.get_history_page('russian', sort, limit=4, **kwargs)
+    pages = [rows]
+    while after is not None:
+        rows, after = thuha.get_history_page('russian', sort, after=after, limit=4, **kwargs)
+        pages.append(rows)
+    return pages
+
+
+@pytest.mark.parametrize('sort', list(thuha.HISTORY_SORTS))
+def test_pages_cover_every_row_once_in_order(history, sort):
+    pages = all_pages(sort)
+    rows = [row for page in pages for row in page]
+    columns, descending = thuha.HISTORY_SORTS[sort]
+
+    assert all(len(page) == 4 for page in pages[:-1])
+    assert len(rows) == len({row['id'] for row in rows}) == 25
+    keys = [tuple(row[column] for column in columns) for row in rows]
+    assert keys == sorted(keys, reverse=descending)
+
+
+def test_filters_and_search_run_in_sql(history):
+    mastered = [row['word'] for page in all_pages("🔤 Theo chữ cái", accuracy_filter="Đã thuộc") for row in page]
+    assert mastered == ['100%_дом'] + [f'слово{i:02d}' for i in range(0, 23, 3)]
+
+    # % và _ trong từ khóa tìm kiếm được hiểu theo nghĩa đen
+    rows, after = thuha.get_history_page('russian', "🔤 Theo chữ cái", search="0%_")
+    assert [row['word'] for row in rows] == ['100%_дом'] and after is None
+    rows, _ = thuha.get_history_page('russian', "🔤 Theo chữ cái", search="sách")
+    assert [(row['word'], row['accuracy']) for row in rows] == [('книга', 0)]
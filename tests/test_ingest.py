@@ -0,0 +1,92 @@
+import sqlite3
+
+import pytest
+
+import thuha
+
+
+def write_text(path, text):
+    path.write_text(text, encoding='utf-8')
+    return str(path)
+
+
+def test_ingest_file_reads_serially_without_touching_settings(tmp_path, monkeypatch):
+    path = write_text(tmp_path / 'a.txt', "Книга лежит на столе. Книгу читаю, книги люблю. " * 2000)
+    monkeypatch.setattr(thuha, 'MAX_PROCESSES', 4)
+    monkeypatch.setattr(thuha, 'PARALLEL_TOKENIZE_MIN_CHARS', 1000)
+
+    def no_pool():
+        raise AssertionError("_ingest_file không được tạo nhóm process lồng nhau")
+
+    monkeypatch.setattr(thuha, 'get_process_pool', no_pool)
+    result = thuha._ingest_file(path, 'russian', max_words=10, min_count=1)
+
+    assert thuha.MAX_PROCESSES == 4
+    assert [stat.word for stat in result['words']][:1] == ['книга']
+    assert result['words'][0].count == 6000
+
+
+def test_language_accepts_short_aliases(monkeypatch):
+    seen = []
+    monkeypatch.setattr(thuha, 'cmd_ingest', lambda args: seen.append(args.language) or 0)
+    for value in ('ru', 'zh', 'russian'):
+        assert thuha.run_cli(['ingest', 'docs', '--language', value]) == 0
+    assert seen == ['russian', 'chinese', 'russian']
+
+
+class StubTranslator(thuha.Translator):
+    supports_batch = True
+    requests = []
+
+    def translate(self, text):
+        StubTranslator.requests.append(text)
+        return "\n".join("vi:" + line for line in text.split("\n"))
+
+
+@pytest.fixture
+def ingest(db_path, tmp_path, monkeypatch):
+    monkeypatch.setattr(thuha, 'DICTIONARY_DIR', str(tmp_path / 'dictionaries'))
+    monkeypatch.setattr(thuha, 'GoogleBackend', lambda *args, **kwargs: StubTranslator())
+    monkeypatch.setattr(StubTranslator, 'requests', [])
+
+    def run(*args):
+        return thuha.run_cli(['ingest', *args, '--language', 'ru', '--workers', '1', '--batch-files', '1'])
+    return run
+
+
+def history_words(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return sorted(row[0] for row in conn.execute("SELECT word FROM learning_history"))
+
+
+def test_forms_are_merged_across_batches(ingest, db_path, tmp_path):
+    docs = tmp_path / 'docs'
+    docs.mkdir()
+    write_text(docs / 'a.txt', "Книга на столе. Книга новая. Дом большой.")
+    write_text(docs / 'b.txt', "Читаю книгу. Вижу дома.")
+
+    assert ingest(str(docs)) == 0
+    # Mỗi file là một lô: книгу và дома ở lô sau thuộc các từ đã ghi ở lô trước
+    assert history_words(db_path) == sorted(['книга', 'столе', 'новая', 'дом', 'большой', 'читаю', 'вижу'])
+
+
+def test_rerun_skips_ingested_files_and_retries_failed_ones(ingest, db_path, tmp_path):
+    docs = tmp_path / 'docs'
+    docs.mkdir()
+    write_text(docs / 'a.txt', "Книга на столе.")
+    (docs / 'b.pdf').write_bytes(b"not a pdf")
+
+    assert ingest(str(docs)) == 1
+    assert history_words(db_path) == ['книга', 'столе']
+    requests = len(StubTranslator.requests)
+
+    # Lần chạy lại: a.txt đã nạp được bỏ qua, b.pdf lỗi được đọc lại
+    assert ingest(str(docs)) == 1
+    assert len(StubTranslator.requests) == requests
+    assert set(thuha.get_ingested_files('russian')) == {str(docs / 'a.txt')}
+
+    # File đã sửa được nạp lại
+    write_text(docs / 'a.txt', "Книга на столе. Город большой.")
+    (docs / 'b.pdf').unlink()
+    assert ingest(str(docs)) == 0
+    assert history_words(db_path) == ['большой', 'город', 'книга', 'столе']
@@ -0,0 +1,96 @@
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import thuha
+
+
+def test_fresh_database_reaches_latest_version(db_path):
+    thuha.init_database()  # chạy lại không làm gì
+    with sqlite3.connect(db_path) as conn:
+        versions = [row[0] for row in conn.execute("SELECT version FROM schema_version ORDER BY version")]
+    assert versions == [version for version, _, _ in thuha.MIGRATIONS]
+
+
+def test_legacy_database_is_upgraded(tmp_path, monkeypatch):
+    # Database của bản đầu tiên: không có cột language, có từ trùng
+    path = str(tmp_path / 'legacy.db')
+    with sqlite3.connect(path) as conn:
+        conn.execute('''CREATE TABLE learning_history
+                        (id INTEGER PRIMARY KEY AUTOINCREMENT, word TEXT, translation TEXT,
+                         correct_count INTEGER DEFAULT 0, wrong_count INTEGER DEFAULT 0,
+                         last_reviewed TIMESTAMP, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+        conn.execute('''CREATE TABLE study_sessions
+                        (id INTEGER PRIMARY KEY AUTOINCREMENT, session_type TEXT, score INTEGER,
+                         total_questions INTEGER, session_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+        conn.executemany("INSERT INTO learning_history (word, translation, correct_count, wrong_count) "
+                         "VALUES (?, ?, ?, ?)", [('книга', 'sách', 2, 1), ('книга', 'sách', 1, 0),
+                                                 ('дом', 'nhà', 0, 3)])
+    monkeypatch.setattr(thuha, 'DB_PATH', path)
+    thuha.init_database()
+
+    with sqlite3.connect(path) as conn:
+        rows = conn.execute('''SELECT language, word, correct_count, wrong_count, last_reviewed, due_at,
+                                      last_reviewed = created_at
+                               FROM learning_history ORDER BY word''').fetchall()
+        assert [row[:4] for row in rows] == [('russian', 'дом', 0, 3), ('russian', 'книга', 3, 1)]
+        assert all(row[4] is not None and row[5] is not None and row[6] for row in rows)
+        assert thuha.check_language_stats(conn.cursor()) == []
+    assert thuha.get_learning_stats('russian') == {'total_words': 2, 'total_correct': 3, 'total_wrong': 4,
+                                                   'mastered_words': 1}
+    thuha.get_write_queue(path).close()
+
+
+def test_migrated_timestamps_use_local_time(tmp_path, monkeypatch):
+    path = str(tmp_path / 'utc.db')
+    monkeypatch.setattr(thuha, 'DB_PATH', path)
+    monkeypatch.setattr(thuha, 'MIGRATIONS', thuha.MIGRATIONS[:5])
+    thuha.init_database()
+    with sqlite3.connect(path) as conn:
+        conn.execute("INSERT INTO learning_history (language, word, translation, created_at) "
+                     "VALUES ('russian', 'книга', 'sách', '2024-01-01 00:00:00')")
+    monkeypatch.undo()
+    monkeypatch.setattr(thuha, 'DB_PATH', path)
+    thuha.init_database()
+
+    with sqlite3.connect(path) as conn:
+        expected = conn.execute("SELECT datetime('2024-01-01 00:00:00', 'localtime')").fetchone()[0]
+        row = conn.execute("SELECT created_at, last_reviewed, due_at FROM learning_history").fetchone()
+    assert row == (expected, expected, expected)
+    thuha.get_write_queue(path).close()
+
+
+@pytest.fixture
+def local_tz(monkeypatch):
+    # Múi giờ khác UTC để thấy được chuyển đổi sang giờ địa phương
+    monkeypatch.setenv('TZ', 'Asia/Ho_Chi_Minh')
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_schema_version_uses_local_time(tmp_path, monkeypatch, local_tz):
+    path = str(tmp_path / 'old.db')
+    monkeypatch.setattr(thuha, 'DB_PATH', path)
+    with sqlite3.connect(path) as conn:
+        conn.execute('''CREATE TABLE schema_version
+                        (version INTEGER PRIMARY KEY, description TEXT,
+                         applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+    with monkeypatch.context() as old:
+        old.setattr(thuha, 'MIGRATIONS', thuha.MIGRATIONS[:1])
+        thuha.init_database()
+    with sqlite3.connect(path) as conn:
+        conn.execute("UPDATE schema_version SET applied_at = '2024-01-01 00:00:00'")
+    thuha.init_database()
+
+    with sqlite3.connect(path) as conn:
+        rows = dict(conn.execute("SELECT version, applied_at FROM schema_version"))
+        assert 'CURRENT_TIMESTAMP' not in conn.execute(
+            "SELECT sql FROM sqlite_master WHERE name = 'schema_version'").fetchone()[0]
+    assert rows[1] == '2024-01-01 07:00:00'
+    latest = datetime.strptime(rows[thuha.MIGRATIONS[-1][0]], '%Y-%m-%d %H:%M:%S')
+    assert abs(latest - datetime.now()) < timedelta(minutes=1)
+    thuha.get_write_queue(path).close()
@@ -0,0 +1,56 @@
+import io
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import pytest
+
+import thuha
+from bench import make_pdf
+
+
+def pdf_file(pages):
+    return io.BytesIO(make_pdf([f"page{i} word{i % 7}" for i in range(pages)]))
+
+
+def serial_pages(pages):
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(thuha, 'MAX_PROCESSES', 1)
+        return list(thuha.iter_pdf_pages(pdf_file(pages)))
+
+
+def test_parallel_pages_match_serial(monkeypatch):
+    expected = serial_pages(45)
+    pool = ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context('spawn'))
+    monkeypatch.setattr(thuha, 'get_process_pool', lambda: pool)
+    monkeypatch.setattr(thuha, 'MAX_PROCESSES', 2)
+    monkeypatch.setattr(thuha, 'PDF_PARALLEL_MIN_PAGES', 10)
+    with pool:
+        assert list(thuha.iter_pdf_pages(pdf_file(45))) == expected
+    assert len(expected) == 45
+
+
+def test_reads_serially_when_tasks_cannot_be_sent(monkeypatch):
+    expected = serial_pages(30)
+
+    class FailingPool:
+        def submit(self, func, *args):
+            future = Future()
+            future.set_exception(TypeError("cannot pickle '_thread.lock' object"))
+            return future
+
+    monkeypatch.setattr(thuha, 'get_process_pool', FailingPool)
+    monkeypatch.setattr(thuha, 'MAX_PROCESSES', 2)
+    monkeypatch.setattr(thuha, 'PDF_PARALLEL_MIN_PAGES', 10)
+    assert list(thuha.iter_pdf_pages(pdf_file(30))) == expected
+
+
+def test_read_error_is_raised_not_truncated(monkeypatch):
+    def broken_pages(file):
+        yield "книга дом\n"
+        raise ValueError("trang hỏng")
+
+    monkeypatch.setattr(thuha, 'iter_pdf_pages', broken_pages)
+    chunks = thuha.iter_document_text(pdf_file(1), "application/pdf")
+    # Kết quả đọc dở không được trả về như thể đã đọc xong cả file
+    with pytest.raises(ValueError):
+        thuha.extract_word_frequencies('russian', chunks)
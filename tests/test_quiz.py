@@ -0,0 +1,48 @@
+import pytest
+
+import thuha
+
+
+def make_deck(translations):
+    return thuha.Deck(thuha.Deck.make_id('russian', translations), 'russian', translations)
+
+
+def options_of(quiz, i):
+    return [answer_id for answer_id in quiz.options[i * thuha.QUIZ_OPTIONS:(i + 1) * thuha.QUIZ_OPTIONS]
+            if answer_id >= 0]
+
+
+@pytest.mark.parametrize('meanings', [['một', 'hai'], ['một', 'hai', 'ba'], ['một', 'một', 'hai', 'ba']])
+@pytest.mark.parametrize('hard', [False, True])
+def test_small_decks_finish_with_distinct_options(meanings, hard):
+    deck = make_deck({f'слово{i}': meaning for i, meaning in enumerate(meanings)})
+    quiz = thuha.create_quiz(deck, 20, hard=hard)
+
+    # Mỗi từ hỏi đúng một lần, số đáp án bị giới hạn bởi số nghĩa khác nhau
+    assert sorted(quiz.positions) == list(range(len(deck)))
+    for i, position in enumerate(quiz.positions):
+        option_ids = options_of(quiz, i)
+        assert len(option_ids) == len(set(option_ids)) == min(thuha.QUIZ_OPTIONS, len(deck.answers))
+        assert deck.answer_ids[position] in option_ids
+
+
+def test_deck_with_one_meaning_gives_empty_quiz():
+    quiz = thuha.create_quiz(make_deck({'книга': 'sách', 'книги': 'sách'}))
+    assert len(quiz.positions) == 0
+
+
+def test_questions_are_sampled_without_replacement():
+    deck = make_deck({f'слово{i}': f'nghĩa {i}' for i in range(1000)})
+    quiz = thuha.create_quiz(deck, 30)
+    assert len(quiz.positions) == len(set(quiz.positions)) == 30
+
+
+def test_hard_distractors_prefer_similar_meanings():
+    translations = {f'слово{i}': f'xyz {i}' for i in range(2000)}
+    translations.update({'кот': 'con mèo', 'кошка': 'con mèo cái', 'котёнок': 'con mèo con', 'мышь': 'con mèo nhỏ'})
+    index = make_deck(translations).distractor_index
+    correct_id = index.answers.index('con mèo')
+
+    similar = {index.answers[answer_id] for answer_id in index.similar(correct_id, 3)}
+    assert similar == {'con mèo cái', 'con mèo con', 'con mèo nhỏ'}
+    assert correct_id not in index.random(correct_id, 3)
@@ -0,0 +1,51 @@
+import pytest
+
+import thuha
+
+
+@pytest.mark.parametrize('forms, stem', [
+    (['книга', 'книги', 'книгу', 'книгой', 'книгами'], 'книг'),
+    (['читать', 'читаю', 'читал'], 'чита'),
+    (['красивый', 'красивая', 'красивого'], 'красив'),
+    (['дом', 'дома', 'домов'], 'дом'),
+    (['ёлка', 'Елки'], 'елк'),
+])
+def test_inflected_forms_share_a_stem(forms, stem):
+    assert {thuha.russian_stem(form) for form in forms} == {stem}
+
+
+def test_short_words_are_left_alone():
+    assert thuha.russian_stem('дом') == 'дом'
+    assert thuha.russian_stem('кот') == 'кот'
+
+
+def test_merge_keeps_most_frequent_form_as_headword():
+    stats = [
+        thuha.WordStat('книги', 2, 10, 'две книги'),
+        thuha.WordStat('Книга', 5, 0, 'Книга лежит'),
+        thuha.WordStat('дом', 3, 5, 'мой дом'),
+        thuha.WordStat('книгу', 1, 20, 'читаю книгу'),
+    ]
+    merged = thuha.merge_word_forms(stats)
+
+    assert [(stat.word, stat.count) for stat in merged] == [('книга', 8), ('дом', 3)]
+    assert merged[0].forms == ('книга', 'книги', 'книгу')
+    # Vị trí và ngữ cảnh lấy từ lần xuất hiện sớm nhất của cả nhóm
+    assert (merged[0].first_pos, merged[0].context) == (0, 'Книга лежит')
+
+
+def test_merging_already_merged_stats_keeps_their_forms():
+    first = thuha.merge_word_forms([thuha.WordStat('книга', 3, 0, ''), thuha.WordStat('книгой', 1, 4, '')])
+    second = thuha.merge_word_forms([thuha.WordStat('книгу', 4, 0, '')])
+    merged = thuha.merge_word_forms(first + second)
+
+    assert len(merged) == 1
+    assert merged[0].count == 8
+    assert set(merged[0].forms) == {'книга', 'книгой', 'книгу'}
+
+
+def test_extraction_merges_forms_unless_disabled():
+    text = "Книга на столе. Я читаю книгу. Две книги."
+    assert [(stat.word, stat.count) for stat in thuha.extract_word_frequencies('russian', text)][:1] == [('книга', 3)]
+    unmerged = thuha.extract_word_frequencies('russian', text, merge_forms=False)
+    assert {'Книга', 'книгу', 'книги'} <= {stat.word for stat in unmerged}
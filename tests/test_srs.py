@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import thuha
+
+NEW = thuha.ReviewState(thuha.SRS_INITIAL_EASE, 0, 0)
+
+
+def test_correct_answers_grow_interval():
+    first = thuha.next_review_state(NEW, True)
+    second = thuha.next_review_state(first, True)
+    third = thuha.next_review_state(second, True)
+
+    assert (first.interval_days, first.repetitions) == (1, 1)
+    assert (second.interval_days, second.repetitions) == (6, 2)
+    assert third.interval_days == pytest.approx(6 * third.ease)
+    assert third.repetitions == 3
+
+
+def test_wrong_answer_resets_and_lowers_ease():
+    state = thuha.ReviewState(2.5, 15, 3)
+    after = thuha.next_review_state(state, False)
+
+    assert (after.interval_days, after.repetitions) == (1, 0)
+    assert after.ease < state.ease
+
+
+def test_ease_never_drops_below_minimum():
+    state = NEW
+    for _ in range(20):
+        state = thuha.next_review_state(state, False)
+    assert state.ease == thuha.SRS_MIN_EASE
+
+
+def test_saved_results_schedule_due_words(db_path):
+    thuha.save_results_to_history('russian', [('книга', 'sách', True), ('дом', 'nhà', False)]).result(5)
+    # Trả lời hai lần trong một lô: lịch tính theo thứ tự trả lời
+    thuha.save_results_to_history('russian', [('стол', 'bàn', True), ('стол', 'bàn', True)]).result(5)
+
+    assert thuha.get_due_words('russian', 10) == []
+    due = thuha.get_due_words('russian', 10, now=datetime.now() + timedelta(days=2))
+    assert [word for word, _, _ in due] == ['книга', 'дом']
+    assert thuha.get_due_words('russian', 10, now=datetime.now() + timedelta(days=7))[-1][0] == 'стол'
+    assert thuha.get_next_due_at('chinese') is None
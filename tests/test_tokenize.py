@@ -0,0 +1,59 @@
+import pickle
+from concurrent.futures import Future, ProcessPoolExecutor
+import multiprocessing
+
+import thuha
+import thuha_workers
+
+WORDS = ['книга', 'книги', 'книгу', 'дом', 'дома', 'читать', 'читаю', 'студент', 'студенты', 'город']
+
+
+def make_text(paragraphs):
+    # Các đoạn khác nhau để tần suất và vị trí lần đầu gặp phụ thuộc thứ tự khối
+    return "\n".join(" ".join(WORDS[(i * j) % len(WORDS)] for j in range(1, 40)) + "." for i in range(paragraphs))
+
+
+def test_pool_worker_is_pickled_by_module_name():
+    # Streamlit thay module __main__ mỗi lần chạy lại: hàm gửi sang process con phải nằm ngoài thuha.py
+    assert pickle.loads(pickle.dumps(thuha.count_words)) is thuha_workers.count_words
+
+
+def test_parallel_counts_match_serial(monkeypatch):
+    text = make_text(1500)
+    serial = thuha.extract_word_frequencies('russian', text)
+
+    pool = ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context('spawn'))
+    monkeypatch.setattr(thuha, 'get_process_pool', lambda: pool)
+    monkeypatch.setattr(thuha, 'MAX_PROCESSES', 2)
+    monkeypatch.setattr(thuha, 'PARALLEL_TOKENIZE_MIN_CHARS', 1000)
+    with pool:
+        parallel = thuha.extract_word_frequencies('russian', text)
+
+    assert len(text) > 2 * thuha.TOKENIZE_BLOCK_CHARS
+    assert parallel == serial
+
+
+class FailingPool:
+    """Nhóm process giả: mọi tác vụ lỗi như khi hàm không pickle được"""
+
+    def __init__(self):
+        self.submitted = 0
+
+    def submit(self, func, *args):
+        self.submitted += 1
+        future = Future()
+        future.set_exception(pickle.PicklingError("Can't pickle count_words: it's not the same object"))
+        return future
+
+
+def test_falls_back_to_serial_when_tasks_cannot_be_sent(monkeypatch):
+    text = make_text(1500)
+    serial = thuha.extract_word_frequencies('russian', text)
+
+    pool = FailingPool()
+    monkeypatch.setattr(thuha, 'get_process_pool', lambda: pool)
+    monkeypatch.setattr(thuha, 'MAX_PROCESSES', 2)
+    monkeypatch.setattr(thuha, 'PARALLEL_TOKENIZE_MIN_CHARS', 1000)
+
+    assert thuha.extract_word_frequencies('russian', text) == serial
+    assert pool.submitted > 0
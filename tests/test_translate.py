@@ -0,0 +1,94 @@
+import threading
+
+import thuha
+
+
+class StubTranslator(thuha.Translator):
+    """Dịch giả: thêm tiền tố 'vi:' cho mỗi dòng, lỗi với các từ trong fail"""
+
+    supports_batch = True
+
+    def __init__(self, fail=(), misalign=False):
+        self.fail = set(fail)
+        self.misalign = misalign
+        self.requests = []
+
+    def translate(self, text):
+        self.requests.append(text)
+        lines = text.split("\n")
+        if any(line in self.fail for line in lines):
+            raise RuntimeError("lỗi dịch")
+        if self.misalign and len(lines) > 1:
+            return "\n".join("vi:" + line for line in lines[:-1])
+        return "\n".join("vi:" + line for line in lines)
+
+
+def translate(keys, translator, **kwargs):
+    kwargs.setdefault('requests_per_second', 0)
+    kwargs.setdefault('backoff', 0)
+    return thuha.translate_batch(keys, lambda: translator, **kwargs)
+
+
+def test_batches_words_into_multiline_requests():
+    translator = StubTranslator()
+    keys = [f'слово{i}' for i in range(250)]
+    progress = []
+
+    results, errors = translate(keys, translator, max_workers=1,
+                                on_progress=lambda done, total: progress.append((done, total)))
+
+    assert results == {key: 'vi:' + key for key in keys}
+    assert errors == {}
+    assert len(translator.requests) == len(thuha.make_translation_batches(keys))
+    assert progress[-1] == (250, 250)
+
+
+def test_misaligned_batch_falls_back_to_single_words():
+    translator = StubTranslator(misalign=True)
+    results, errors = translate(['а', 'б', 'в'], translator, max_workers=1)
+
+    assert results == {'а': 'vi:а', 'б': 'vi:б', 'в': 'vi:в'}
+    assert errors == {}
+
+
+def test_failed_batch_is_not_retried_word_by_word():
+    translator = StubTranslator(fail={'плохо'})
+    keys = ['хорошо', 'плохо', 'книга']
+    results, errors = translate(keys, translator, max_workers=1, max_retries=2)
+
+    assert results == {}
+    assert sorted(errors) == sorted(keys)
+    # Chỉ request của cả lô được thử lại max_retries lần, không tách ra gọi từng từ
+    assert translator.requests == ["\n".join(keys)] * 3
+
+
+def test_failed_words_are_reported_after_retries():
+    class SingleWord(StubTranslator):
+        supports_batch = False
+
+    translator = SingleWord(fail={'плохо'})
+    results, errors = translate(['хорошо', 'плохо'], translator, max_workers=1, max_retries=2)
+
+    assert results == {'хорошо': 'vi:хорошо'}
+    assert list(errors) == ['плохо']
+    assert translator.requests.count('плохо') == 3
+
+
+def test_each_worker_thread_gets_its_own_translator():
+    created = []
+    lock = threading.Lock()
+
+    class SingleWord(StubTranslator):
+        supports_batch = False
+
+    def factory():
+        with lock:
+            created.append(threading.get_ident())
+        return SingleWord()
+
+    keys = [f'слово{i}' for i in range(40)]
+    results, errors = thuha.translate_batch(keys, factory, max_workers=4, requests_per_second=0, backoff=0)
+
+    assert len(results) == 40 and not errors
+    assert len(created) == len(set(created))
+
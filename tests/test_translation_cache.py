@@ -0,0 +1,70 @@
+import sqlite3
+
+import thuha
+
+
+class CountingTranslator(thuha.Translator):
+    """Dịch giả: thêm tiền tố 'vi:', ghi lại mọi request"""
+
+    supports_batch = True
+
+    def __init__(self):
+        self.requests = []
+
+    def translate(self, text):
+        self.requests.append(text)
+        return "\n".join("vi:" + line for line in text.split("\n"))
+
+
+def test_translate_words_uses_cache_before_network(db_path, tmp_path, monkeypatch):
+    monkeypatch.setattr(thuha, 'DICTIONARY_DIR', str(tmp_path / 'dictionaries'))
+    translator = CountingTranslator()
+    first = thuha.translate_words('russian', ['книга', 'Дом'], translator_factory=lambda: translator,
+                                  on_progress=lambda done, total: None)
+    thuha.get_write_queue(db_path).flush()
+    second = thuha.translate_words('russian', ['книга', 'дом'], translator_factory=lambda: translator,
+                                   on_progress=lambda done, total: None)
+
+    assert first == {'книга': 'vi:книга', 'Дом': 'vi:дом'}
+    assert second == {'книга': 'vi:книга', 'дом': 'vi:дом'}
+    assert len(translator.requests) == 1
+
+
+def cache_rows(db_path):
+    with sqlite3.connect(db_path) as conn:
+        stored = conn.execute("SELECT entries FROM translation_cache_size").fetchone()[0]
+        words = {row[0] for row in conn.execute("SELECT word FROM translation_cache")}
+    return stored, words
+
+
+def test_least_recently_used_entries_are_evicted(db_path, monkeypatch):
+    monkeypatch.setattr(thuha, 'TRANSLATION_CACHE_MAX_ENTRIES', 3)
+    for key, translation in [('а', '1'), ('б', '2'), ('в', '3')]:
+        thuha.save_cached_translations('ru', {key: translation}).result(5)
+    assert thuha.get_cached_translations('ru', ['а']) == {'а': '1'}  # 'а' được dùng gần đây nhất
+    thuha.get_write_queue(db_path).flush(5)
+    thuha.save_cached_translations('ru', {'г': '4'}).result(5)
+
+    assert cache_rows(db_path) == (3, {'а', 'в', 'г'})
+
+
+def test_updating_an_entry_keeps_the_count(db_path):
+    thuha.save_cached_translations('ru', {'а': '1', 'б': '2'}).result(5)
+    thuha.save_cached_translations('ru', {'а': 'một'}).result(5)
+
+    assert cache_rows(db_path) == (2, {'а', 'б'})
+    assert thuha.get_cached_translations('ru', ['а']) == {'а': 'một'}
+
+
+def test_count_starts_from_existing_entries(tmp_path, monkeypatch):
+    path = str(tmp_path / 'old.db')
+    monkeypatch.setattr(thuha, 'DB_PATH', path)
+    with monkeypatch.context() as old:
+        old.setattr(thuha, 'MIGRATIONS', [m for m in thuha.MIGRATIONS if m[0] < 12])
+        thuha.init_database()
+    with sqlite3.connect(path) as conn:
+        conn.executemany("INSERT INTO translation_cache VALUES ('ru', ?, 'x', '2024-01-01')", [('а',), ('б',)])
+    thuha.init_database()
+
+    assert cache_rows(path) == (2, {'а', 'б'})
+    thuha.get_write_queue(path).close()
@@ -0,0 +1,53 @@
+import io
+
+import thuha
+
+
+def entry(words, translations=None):
+    stats = [thuha.WordStat(word, 1, i, word) for i, word in enumerate(words)]
+    return {'preview': " ".join(words), 'stats': stats, 'translations': translations or {}}
+
+
+def test_get_returns_stored_entry():
+    cache = thuha.UploadCache(1 << 20)
+    value = entry(['книга', 'дом'], {'книга': 'sách'})
+    assert cache.get('a') is None
+    cache.put('a', value)
+    assert cache.get('a') is value
+
+
+def test_least_recently_used_entry_is_evicted():
+    value = entry(['слово'] * 10)
+    size = thuha.UploadCache._estimate_size(value)
+    cache = thuha.UploadCache(size * 2)
+    cache.put('a', value)
+    cache.put('b', entry(['слово'] * 10))
+    cache.get('a')
+    cache.put('c', entry(['слово'] * 10))
+
+    assert cache.get('a') is not None
+    assert cache.get('b') is None
+    assert cache.get('c') is not None
+
+
+def test_entry_larger_than_cache_is_not_stored():
+    value = entry(['слово'] * 100)
+    cache = thuha.UploadCache(thuha.UploadCache._estimate_size(value) - 1)
+    cache.put('a', value)
+    assert cache.get('a') is None
+
+
+def test_replacing_an_entry_updates_its_size():
+    cache = thuha.UploadCache(1 << 20)
+    cache.put('a', entry(['слово'] * 100))
+    cache.put('a', entry(['слово']))
+    assert cache._size == thuha.UploadCache._estimate_size(entry(['слово']))
+
+
+def test_key_depends_on_content_language_and_extractor_version(monkeypatch):
+    same = thuha.upload_cache_key(io.BytesIO(b'abc'), 'russian')
+    assert thuha.upload_cache_key(io.BytesIO(b'abc'), 'russian') == same
+    assert thuha.upload_cache_key(io.BytesIO(b'abd'), 'russian') != same
+    assert thuha.upload_cache_key(io.BytesIO(b'abc'), 'chinese') != same
+    monkeypatch.setattr(thuha, 'EXTRACTOR_VERSION', thuha.EXTRACTOR_VERSION + 1)
+    assert thuha.upload_cache_key(io.BytesIO(b'abc'), 'russian') != same
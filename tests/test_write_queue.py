@@ -0,0 +1,76 @@
+import sqlite3
+import threading
+
+import pytest
+
+import thuha
+
+
+def insert_word(conn, word):
+    conn.execute("INSERT INTO learning_history (language, word, translation) VALUES ('russian', ?, 'x')", (word,))
+    return word
+
+
+def fail_after_insert(conn, word):
+    insert_word(conn, word)
+    raise ValueError("lệnh ghi lỗi")
+
+
+def words(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return {row[0] for row in conn.execute("SELECT word FROM learning_history")}
+
+
+def test_failed_job_is_rolled_back_alone(db_path):
+    write_queue = thuha.WriteQueue(thuha.get_connection_pool(db_path))
+    # Chặn luồng ghi để ba lệnh chắc chắn nằm chung một giao dịch
+    gate = threading.Event()
+    write_queue.submit(lambda conn: gate.wait(5))
+    ok_before = write_queue.submit(insert_word, 'trước')
+    failed = write_queue.submit(fail_after_insert, 'lỗi')
+    ok_after = write_queue.submit(insert_word, 'sau')
+    gate.set()
+
+    assert ok_before.result(5) == 'trước'
+    assert ok_after.result(5) == 'sau'
+    with pytest.raises(ValueError):
+        failed.result(5)
+    assert words(db_path) == {'trước', 'sau'}
+    write_queue.close()
+
+
+def test_futures_resolve_after_commit(db_path):
+    future = thuha.save_to_history('russian', 'книга', 'sách')
+    future.result(5)
+    # Kết nối riêng, ngoài nhóm kết nối: chỉ thấy dữ liệu đã commit
+    assert words(db_path) == {'книга'}
+
+
+def test_close_flushes_pending_jobs_and_rejects_new_ones(db_path):
+    write_queue = thuha.WriteQueue(thuha.get_connection_pool(db_path))
+    futures = [write_queue.submit(insert_word, f'слово{i}') for i in range(50)]
+    write_queue.close()
+
+    assert all(future.done() for future in futures)
+    assert len(words(db_path)) == 50
+    with pytest.raises(RuntimeError):
+        write_queue.submit(insert_word, 'muộn')
+
+
+def test_concurrent_sessions_do_not_lose_counts(db_path):
+    def session(k):
+        for j in range(20):
+            thuha.save_results_to_history('russian', [(f'слово{(k + j) % 10}', 'x', j % 2 == 0)])
+        thuha.save_study_session('russian', 'quiz', 1, 1).result(5)
+
+    threads = [threading.Thread(target=session, args=(k,)) for k in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    thuha.get_write_queue(db_path).flush(5)
+
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT SUM(correct_count + wrong_count) FROM learning_history").fetchone()[0] == 160
+        assert conn.execute("SELECT COUNT(*) FROM study_sessions").fetchone()[0] == 8
+        assert thuha.check_language_stats(conn.cursor()) == []
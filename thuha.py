@@ -1,36 +1,476 @@
 import streamlit as st
-import pandas as pd
 import random
 import re
 import sqlite3
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
-from gtts import gTTS
+import sys
+import json
+import mmap
+import struct
+import argparse
+import atexit
+import importlib
+import logging
 import tempfile
-from deep_translator import GoogleTranslator
+import threading
+import time
+import queue
+import cProfile
+import io
+import pstats
+import functools
+import glob
+import hashlib
+import itertools
+import multiprocessing
+import shutil
+from array import array
+from collections import Counter, OrderedDict, deque, namedtuple
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+# Hàm chạy trong process con nằm trong module riêng, xem docstring của thuha_workers
+from thuha_workers import JIEBA_CACHE_FILE, JIEBA_USER_DICT, count_words, extract_pdf_page_range, load_chinese_tokenizer
+
+logger = logging.getLogger("thuha")
+
+# Các thư viện nặng (pandas, gTTS, deep_translator, PyPDF2, python-docx, jieba) được import
+# khi chế độ cần đến chúng chạy lần đầu, xem lazy_import()
+INSTALL_HINTS = {
+    'PyPDF2': "pip install PyPDF2",
+    'docx': "pip install python-docx",
+    'jieba': "pip install jieba",
+}
+
+
+# Database dùng chung cho mọi session trong process
+DB_PATH = os.environ.get('THUHA_DB_PATH', 'learning_history.db')
+DB_POOL_SIZE = 8
+DB_BUSY_TIMEOUT_MS = 5000  # Chờ khóa ghi thay vì báo "database is locked" ngay
+WRITE_BATCH_MAX_JOBS = 200  # Số lệnh ghi tối đa gộp vào một giao dịch của luồng ghi
+WRITE_SHUTDOWN_TIMEOUT = 10  # Số giây chờ ghi nốt hàng đợi khi process thoát
+
+# Số tham số tối đa trong một câu lệnh SQL dạng IN (...)
+SQL_BATCH_SIZE = 500
+
+# Giới hạn số mục trong bộ nhớ dịch, mục ít dùng nhất bị xóa trước
+TRANSLATION_CACHE_MAX_ENTRIES = 100000
+
+# Cấu hình bộ dịch theo lô
+TRANSLATE_MAX_WORKERS = 4  # Số luồng gọi translator đồng thời
+TRANSLATE_REQUESTS_PER_SECOND = 5.0  # Giới hạn request/giây cho tất cả các luồng (0 = không giới hạn)
+TRANSLATE_MAX_RETRIES = 3
+TRANSLATE_BACKOFF_SECONDS = 0.5  # Thời gian chờ ban đầu, nhân đôi sau mỗi lần thử lại
+TRANSLATE_BATCH_MAX_CHARS = 4500  # GoogleTranslator giới hạn 5000 ký tự mỗi request
+TRANSLATE_BATCH_MAX_WORDS = 100
+
+# Từ điển offline: file nguồn "<mã ngôn ngữ>-vi.tsv" (hoặc ".u8" kiểu CC-CEDICT) trong thư mục này
+DICTIONARY_DIR = os.environ.get('THUHA_DICTIONARY_DIR', 'dictionaries')
+DICTIONARY_INDEX_MAGIC = b'THDX0001'
+
+# Xử lý song song các tác vụ nặng CPU (đọc PDF lớn)
+MAX_PROCESSES = int(os.environ.get('THUHA_MAX_PROCESSES', min(4, os.cpu_count() or 1)))
+PDF_PARALLEL_MIN_PAGES = 40  # File ít trang hơn thì đọc tuần tự, không đáng để chia process
+PDF_PAGES_PER_TASK = 20
+PREVIEW_CHARS = 1000
+
+# Số từ dịch mặc định khi upload (chọn theo tần suất)
+DEFAULT_TRANSLATE_BUDGET = 500
+
+# Tách từ song song: văn bản dài được chia thành khối (cắt ở ranh giới đoạn/câu) và xử lý trên nhóm process
+TOKENIZE_BLOCK_CHARS = 100000
+PARALLEL_TOKENIZE_MIN_CHARS = 400000  # Văn bản ngắn hơn thì tách từ ngay trong process hiện tại
+
+# Cache kết quả xử lý file upload theo nội dung. Tăng EXTRACTOR_VERSION khi đổi cách
+# trích xuất/tách từ để không dùng lại kết quả cũ.
+EXTRACTOR_VERSION = 3
+UPLOAD_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+# Lệnh ingest: loại file theo đuôi, số file ghi trong mỗi giao dịch (cũng là đơn vị chạy tiếp khi bị ngắt)
+INGEST_FILE_TYPES = {'.pdf': "application/pdf", '.docx': DOCX_MIME, '.txt': "text/plain"}
+INGEST_BATCH_FILES = 50
+INGEST_LANGUAGE_ALIASES = {'ru': 'russian', 'zh': 'chinese'}  # Tên ngắn cho --language
+
+# Tách từ tiếng Trung: nạp sẵn từ điển jieba khi khởi động (file cache và từ điển người dùng
+# được cấu hình trong thuha_workers)
+JIEBA_WARMUP = os.environ.get('THUHA_JIEBA_WARMUP', '0') == '1'
+
+# Tiền tố cho từ không dịch được (không lưu vào bộ nhớ dịch)
+UNTRANSLATED_PREFIX = "Chưa dịch được: "
+
+# Số liệu hiệu năng: file dạng Prometheus (ghi sau mỗi lần chạy script, tối đa một lần mỗi
+# METRICS_EXPORT_INTERVAL giây) và bảng gỡ lỗi trong sidebar (hoặc mở bằng ?debug=1)
+METRICS_FILE = os.environ.get('THUHA_METRICS_FILE')
+METRICS_EXPORT_INTERVAL = 10
+DEBUG_PANEL = os.environ.get('THUHA_DEBUG_PANEL', '0') == '1'
+PROFILE_TOP_FUNCTIONS = 30
+
+# Cache file phát âm trên đĩa theo (văn bản, ngôn ngữ), xóa file ít dùng nhất khi vượt dung lượng
+TTS_CACHE_DIR = os.environ.get('THUHA_TTS_CACHE_DIR', 'tts_cache')
+TTS_CACHE_MAX_BYTES = 256 * 1024 * 1024
+TTS_MAX_WORKERS = 2  # Số luồng tạo sẵn file phát âm trong nền
+TTS_LANGUAGE_CODES = {'russian': 'ru', 'chinese': 'zh-CN'}
+FLASHCARD_PREFETCH_AHEAD = 5  # Số thẻ kế tiếp được tạo sẵn phát âm
+TTS_MAX_ERRORS = 1000  # Số lỗi tạo phát âm gần nhất được nhớ để hiển thị
+
+# Lịch ôn tập SM-2: điểm nhớ (0-5) cho câu trả lời đúng/sai và hệ số dễ nhỏ nhất
+SRS_QUALITY_CORRECT = 4
+SRS_QUALITY_WRONG = 2
+SRS_MIN_EASE = 1.3
+SRS_INITIAL_EASE = 2.5
+DUE_REVIEW_DEFAULT = 20
+
+# Phân trang Lịch sử/Từ vựng đã lưu theo khóa: tên -> (các cột sắp xếp, giảm dần?), cột cuối phải duy nhất
+HISTORY_SORTS = {
+    "🕒 Ôn gần nhất": (('last_reviewed', 'id'), True),
+    "🏆 Đúng nhiều nhất": (('correct_count', 'last_reviewed', 'id'), True),
+    "🔤 Theo chữ cái": (('word',), False),
+}
+HISTORY_FILTERS = {
+    "Tất cả": "",
+    "Cần ôn (đúng < 50%)": "AND correct_count < wrong_count",
+    "Đã thuộc": "AND correct_count > wrong_count",
+}
+HISTORY_PAGE_SIZES = [25, 50, 100]
+
+# Quiz: số đáp án mỗi câu và số ứng viên tối đa lấy từ mỗi nhóm khi tìm đáp án nhiễu khó
+QUIZ_OPTIONS = 4
+QUIZ_SIMILAR_CANDIDATES = 50
+
+# Kho bộ từ dùng chung: mỗi bộ từ chỉ lưu một lần trong process dù nhiều session cùng dùng
+DECK_STORE_MAX_BYTES = 512 * 1024 * 1024
+DECK_RETENTION_DAYS = 30  # Bộ từ không được tạo lại trong ngần này ngày thì xóa khỏi database
+
+
+@st.cache_resource(show_spinner=False)
+def get_startup_report():
+    """Số liệu khởi động của process: thời gian import từng thư viện và khởi tạo"""
+    return {'process_started_at': datetime.now().isoformat(timespec='seconds'), 'imports': {}, 'init': {}}
+
+
+def lazy_import(name):
+    """Import module khi cần lần đầu, ghi lại thời gian import vào báo cáo khởi động"""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    elapsed = time.perf_counter() - start
+    get_startup_report()['imports'][name] = round(elapsed, 4)
+    logger.info("Đã import %s trong %.3fs", name, elapsed)
+    return module
+
+
+def require_module(name):
+    """Import thư viện tùy chọn; báo lỗi trên giao diện và trả về None nếu chưa cài đặt"""
+    try:
+        return lazy_import(name)
+    except ImportError:
+        st.error(f"{name} chưa được cài đặt! Vui lòng cài đặt thư viện: {INSTALL_HINTS.get(name, 'pip install ' + name)}")
+        return None
 
-# Thêm thư viện xử lý file với import rõ ràng
-try:
-    import PyPDF2
-    from docx import Document
-except ImportError:
-    PyPDF2 = None
-    Document = None
-    st.error("Vui lòng cài đặt thư viện: pip install PyPDF2 python-docx")
 
-# Thêm jieba cho phân đoạn tiếng Trung
-try:
-    import jieba
-except ImportError:
-    jieba = None
-    st.error("Vui lòng cài đặt thư viện: pip install jieba")
+class Metrics:
+    """Bộ đếm và đồng hồ đo theo từng công đoạn, dùng chung trong process"""
+
+    def __init__(self):
+        self._timers = {}  # công đoạn -> [số lần, tổng giây, lâu nhất]
+        self._counters = Counter()
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            timer = self._timers.setdefault(stage, [0, 0.0, 0.0])
+            timer[0] += 1
+            timer[1] += seconds
+            timer[2] = max(timer[2], seconds)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(json.dumps({'event': 'timing', 'stage': stage, 'seconds': round(seconds, 6)}))
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self._counters[name] += value
+
+    def snapshot(self):
+        """Bản sao số liệu hiện tại: ({công đoạn: (số lần, tổng giây, lâu nhất)}, {bộ đếm: giá trị})"""
+        with self._lock:
+            return {stage: tuple(timer) for stage, timer in self._timers.items()}, dict(self._counters)
+
+    def render_prometheus(self):
+        """Số liệu theo định dạng văn bản của Prometheus"""
+        timers, counters = self.snapshot()
+        lines = ['# HELP thuha_stage_seconds Thời gian xử lý theo công đoạn',
+                 '# TYPE thuha_stage_seconds summary']
+        for stage, (count, total, _) in sorted(timers.items()):
+            lines.append(f'thuha_stage_seconds_count{{stage="{stage}"}} {count}')
+            lines.append(f'thuha_stage_seconds_sum{{stage="{stage}"}} {total:.6f}')
+        lines += ['# HELP thuha_stage_seconds_max Lần xử lý lâu nhất theo công đoạn',
+                  '# TYPE thuha_stage_seconds_max gauge']
+        for stage, (_, _, longest) in sorted(timers.items()):
+            lines.append(f'thuha_stage_seconds_max{{stage="{stage}"}} {longest:.6f}')
+        lines += ['# HELP thuha_events_total Số sự kiện theo loại', '# TYPE thuha_events_total counter']
+        for name, value in sorted(counters.items()):
+            lines.append(f'thuha_events_total{{name="{name}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+@st.cache_resource(show_spinner=False)
+def get_metrics():
+    """Số liệu hiệu năng dùng chung cho mọi session trong process"""
+    return Metrics()
+
+
+@contextmanager
+def timed(stage):
+    """Đo thời gian một khối lệnh và ghi vào số liệu của công đoạn stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        get_metrics().observe(stage, time.perf_counter() - start)
 
 
-def init_database():
-    """Khởi tạo database và xử lý migration"""
-    conn = sqlite3.connect('learning_history.db', check_same_thread=False)
-    c = conn.cursor()
+def instrumented(stage):
+    """Decorator: đo thời gian mỗi lần gọi hàm"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class TimedIterator:
+    """Bọc một iterator, cộng dồn thời gian chờ phần tử kế tiếp (để tách thời gian đọc file khỏi xử lý)"""
+
+    def __init__(self, iterable):
+        self._iterator = iter(iterable)
+        self.elapsed = 0.0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            return next(self._iterator)
+        finally:
+            self.elapsed += time.perf_counter() - start
+
+
+@st.cache_resource(show_spinner=False)
+def get_metrics_export_state():
+    """Thời điểm ghi file số liệu gần nhất, dùng chung giữa các session"""
+    return {'lock': threading.Lock(), 'last': float('-inf')}
+
+
+def export_metrics(path=None, min_interval=None):
+    """Ghi số liệu ra file dạng Prometheus (ghi file tạm rồi đổi tên), tối đa một lần mỗi min_interval giây"""
+    path = path or METRICS_FILE
+    if not path:
+        return
+    min_interval = METRICS_EXPORT_INTERVAL if min_interval is None else min_interval
+    state = get_metrics_export_state()
+    with state['lock']:
+        now = time.monotonic()
+        if now - state['last'] < min_interval:
+            return
+        state['last'] = now
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(suffix='.part', dir=directory)
+        with os.fdopen(fd, 'w', encoding='utf-8') as fp:
+            fp.write(get_metrics().render_prometheus())
+        os.replace(tmp_path, path)
+
+
+class ConnectionPool:
+    """Nhóm kết nối SQLite dùng chung trong process, an toàn cho nhiều luồng script của Streamlit
+
+    Mỗi kết nối bật WAL (đọc không chặn ghi), synchronous=NORMAL (không fsync mỗi commit)
+    và busy_timeout. Trong cùng một luồng, các lệnh with lồng nhau dùng chung một giao dịch.
+    """
+
+    def __init__(self, path, size=DB_POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=DB_BUSY_TIMEOUT_MS / 1000)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}')
+        return conn
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return self._connect()
+        return self._idle.get()
+
+    @contextmanager
+    def connection(self):
+        """Mượn một kết nối; commit khi thoát bình thường, rollback khi có lỗi"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            # Lồng nhau trong cùng luồng: dùng chung giao dịch bên ngoài
+            yield conn
+            return
+
+        conn = self._acquire()
+        self._local.conn = conn
+        try:
+            with conn:
+                yield conn
+        finally:
+            self._local.conn = None
+            self._idle.put(conn)
+
+
+@st.cache_resource(show_spinner=False)
+def get_connection_pool(path):
+    """Tạo nhóm kết nối một lần cho mỗi process"""
+    return ConnectionPool(path)
+
+
+def db_connection():
+    """Kết nối tới database học tập, dùng với câu lệnh with"""
+    return get_connection_pool(DB_PATH).connection()
+
+
+WriteJob = namedtuple('WriteJob', ['func', 'args', 'future', 'queued_at'])
+
+
+class WriteQueue:
+    """Hàng đợi ghi dùng chung trong process: một luồng ghi duy nhất gom lệnh ghi của mọi session
+
+    Mỗi lệnh ghi là func(conn, *args). Luồng ghi lấy hết các lệnh đang chờ (tối đa max_jobs)
+    và chạy chúng trong một giao dịch, mỗi lệnh trong một SAVEPOINT riêng để lệnh lỗi
+    không làm hỏng các lệnh khác. Future trả về chỉ xong sau khi giao dịch đã commit.
+    Các lệnh đọc vẫn dùng nhóm kết nối như cũ, WAL cho phép đọc song song với luồng ghi.
+    """
+
+    _STOP = object()
+
+    def __init__(self, pool, max_jobs=WRITE_BATCH_MAX_JOBS):
+        self.pool = pool
+        self.max_jobs = max_jobs
+        self._queue = queue.Queue()
+        self._closed = False
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="thuha-db-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, func, *args):
+        """Đưa func(conn, *args) vào hàng đợi; Future.result() chờ tới khi dữ liệu đã được commit"""
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Hàng đợi ghi đã đóng")
+            self._queue.put(WriteJob(func, args, future, time.perf_counter()))
+        return future
+
+    def flush(self, timeout=None):
+        """Chờ tới khi mọi lệnh ghi đã gửi trước đó được commit"""
+        self.submit(lambda conn: None).result(timeout)
+
+    def close(self, timeout=WRITE_SHUTDOWN_TIMEOUT):
+        """Ghi nốt các lệnh còn trong hàng đợi rồi dừng luồng ghi"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(self._STOP)
+        self._thread.join(timeout)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            jobs = [self._queue.get()]
+            # Gom các lệnh đã xếp hàng trong lúc giao dịch trước đang commit
+            while len(jobs) < self.max_jobs:
+                try:
+                    jobs.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if self._STOP in jobs:
+                stopping = True
+                jobs = [job for job in jobs if job is not self._STOP]
+                # Không nhận thêm lệnh nào sau khi đóng, ghi nốt phần còn lại
+                while True:
+                    try:
+                        jobs.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+            for start in range(0, len(jobs), self.max_jobs):
+                self._write_batch(jobs[start:start + self.max_jobs])
+
+    def _write_batch(self, jobs):
+        if not jobs:
+            return
+        metrics = get_metrics()
+        now = time.perf_counter()
+        for job in jobs:
+            metrics.observe('db.write_queue_wait', now - job.queued_at)
+        metrics.increment('db.write_batches')
+        metrics.increment('db.write_jobs', len(jobs))
+
+        outcomes = []
+        try:
+            with timed('db.write_batch'), self.pool.connection() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                for job in jobs:
+                    conn.execute("SAVEPOINT write_job")
+                    try:
+                        outcomes.append((job, job.func(conn, *job.args), None))
+                    except Exception as e:
+                        conn.execute("ROLLBACK TO write_job")
+                        outcomes.append((job, None, e))
+                    conn.execute("RELEASE write_job")
+        except Exception as e:
+            # Không mở hoặc không commit được giao dịch: cả lô thất bại
+            logger.exception("Không ghi được %d lệnh vào database", len(jobs))
+            metrics.increment('db.write_errors', len(jobs))
+            for job in jobs:
+                job.future.set_exception(e)
+            return
+
+        for job, result, error in outcomes:
+            if error is None:
+                job.future.set_result(result)
+            else:
+                logger.error("Lệnh ghi %s lỗi: %s", getattr(job.func, '__name__', job.func), error)
+                metrics.increment('db.write_errors')
+                job.future.set_exception(error)
 
+
+@st.cache_resource(show_spinner=False)
+def get_write_queue(path):
+    """Luồng ghi duy nhất cho mỗi database trong process; ghi nốt hàng đợi khi process thoát"""
+    write_queue = WriteQueue(get_connection_pool(path))
+    atexit.register(write_queue.close)
+    return write_queue
+
+
+def db_write(func, *args):
+    """Gửi func(conn, *args) cho luồng ghi của database học tập, trả về Future"""
+    return get_write_queue(DB_PATH).submit(func, *args)
+
+
+def _migrate_base_tables(c):
     c.execute('''CREATE TABLE IF NOT EXISTS learning_history
                  (id INTEGER PRIMARY KEY AUTOINCREMENT,
                   language TEXT,
@@ -49,39 +489,317 @@ def init_database():
                   total_questions INTEGER,
                   session_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
 
-    # Migration: Thêm cột language nếu chưa có
-    # Cho learning_history
-    c.execute("PRAGMA table_info(learning_history)")
-    columns = [row[1] for row in c.fetchall()]
-    if 'language' not in columns:
-        c.execute("ALTER TABLE learning_history ADD COLUMN language TEXT")
-        c.execute("UPDATE learning_history SET language = 'russian' WHERE language IS NULL")
 
-    # Cho study_sessions
-    c.execute("PRAGMA table_info(study_sessions)")
-    columns = [row[1] for row in c.fetchall()]
-    if 'language' not in columns:
-        c.execute("ALTER TABLE study_sessions ADD COLUMN language TEXT")
-        c.execute("UPDATE study_sessions SET language = 'russian' WHERE language IS NULL")
+def _migrate_language_columns(c):
+    # Database cũ chưa có cột language: dữ liệu cũ đều là tiếng Nga
+    for table in ('learning_history', 'study_sessions'):
+        c.execute(f"PRAGMA table_info({table})")
+        columns = [row[1] for row in c.fetchall()]
+        if 'language' not in columns:
+            c.execute(f"ALTER TABLE {table} ADD COLUMN language TEXT")
+            c.execute(f"UPDATE {table} SET language = 'russian' WHERE language IS NULL")
+
+
+def _migrate_translation_cache(c):
+    # Bộ nhớ dịch: khóa là (ngôn ngữ nguồn, từ đã chuẩn hóa)
+    c.execute('''CREATE TABLE IF NOT EXISTS translation_cache
+                 (source_lang TEXT NOT NULL,
+                  word TEXT NOT NULL,
+                  translation TEXT NOT NULL,
+                  last_used TIMESTAMP,
+                  PRIMARY KEY (source_lang, word))''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_translation_cache_last_used
+                 ON translation_cache (last_used)''')
+
+
+def _migrate_dedupe_history(c):
+    # Gộp các dòng trùng (language, word) vào dòng cũ nhất, rồi thêm UNIQUE cho UPSERT
+    c.execute('''CREATE TEMP TABLE history_duplicates
+                 (id INTEGER PRIMARY KEY, correct_count INTEGER, wrong_count INTEGER, last_reviewed TIMESTAMP)''')
+    c.execute('''INSERT INTO history_duplicates
+                 SELECT MIN(id), SUM(correct_count), SUM(wrong_count), MAX(last_reviewed)
+                 FROM learning_history GROUP BY language, word HAVING COUNT(*) > 1''')
+    c.execute('''UPDATE learning_history SET
+                 correct_count = (SELECT d.correct_count FROM history_duplicates d WHERE d.id = learning_history.id),
+                 wrong_count = (SELECT d.wrong_count FROM history_duplicates d WHERE d.id = learning_history.id),
+                 last_reviewed = (SELECT d.last_reviewed FROM history_duplicates d WHERE d.id = learning_history.id)
+                 WHERE id IN (SELECT id FROM history_duplicates)''')
+    c.execute('''DELETE FROM learning_history
+                 WHERE id NOT IN (SELECT MIN(id) FROM learning_history GROUP BY language, word)''')
+    c.execute("DROP TABLE history_duplicates")
+    c.execute('''CREATE UNIQUE INDEX IF NOT EXISTS idx_learning_history_language_word
+                 ON learning_history (language, word)''')
+
+
+def _migrate_history_indexes(c):
+    # Cho trang Lịch sử (ORDER BY last_reviewed DESC) và thống kê theo phiên học
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_learning_history_language_last_reviewed
+                 ON learning_history (language, last_reviewed)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_study_sessions_language_date
+                 ON study_sessions (language, session_date)''')
+
+
+def _migrate_review_schedule(c):
+    # Lịch ôn tập kiểu SM-2: từ cũ coi như đến hạn ngay từ lần ôn gần nhất
+    c.execute("ALTER TABLE learning_history ADD COLUMN ease REAL NOT NULL DEFAULT 2.5")
+    c.execute("ALTER TABLE learning_history ADD COLUMN interval_days REAL NOT NULL DEFAULT 0")
+    c.execute("ALTER TABLE learning_history ADD COLUMN repetitions INTEGER NOT NULL DEFAULT 0")
+    c.execute("ALTER TABLE learning_history ADD COLUMN due_at TIMESTAMP")
+    c.execute("UPDATE learning_history SET due_at = COALESCE(last_reviewed, created_at)")
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_learning_history_language_due
+                 ON learning_history (language, due_at)''')
+
+
+def _migrate_history_paging(c):
+    # Phân trang theo khóa cần cột sắp xếp không NULL; dòng cũ chưa ôn lấy thời điểm tạo
+    c.execute("UPDATE learning_history SET last_reviewed = created_at WHERE last_reviewed IS NULL")
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_learning_history_language_correct
+                 ON learning_history (language, correct_count, last_reviewed)''')
+
+
+LANGUAGE_STATS_COLUMNS = ('total_words', 'total_correct', 'total_wrong', 'mastered_words')
+
+
+def _language_stats_aggregate_sql():
+    # Cách tính chuẩn từ learning_history, dùng để dựng lại và kiểm tra bảng tổng hợp
+    return '''SELECT language,
+                     COUNT(*),
+                     COALESCE(SUM(correct_count), 0),
+                     COALESCE(SUM(wrong_count), 0),
+                     COUNT(CASE WHEN correct_count > wrong_count THEN 1 END)
+              FROM learning_history
+              WHERE language IS NOT NULL
+              GROUP BY language'''
+
+
+def rebuild_language_stats(c):
+    """Tính lại toàn bộ bảng language_stats từ learning_history"""
+    c.execute("DELETE FROM language_stats")
+    c.execute(f'''INSERT INTO language_stats (language, {', '.join(LANGUAGE_STATS_COLUMNS)})
+                  {_language_stats_aggregate_sql()}''')
+
+
+def check_language_stats(c):
+    """So bảng tổng hợp với số liệu tính lại, trả về [(ngôn ngữ, đã lưu, tính lại)] các dòng lệch"""
+    c.execute(_language_stats_aggregate_sql())
+    expected = {row[0]: tuple(row[1:]) for row in c.fetchall()}
+    c.execute(f"SELECT language, {', '.join(LANGUAGE_STATS_COLUMNS)} FROM language_stats")
+    stored = {row[0]: tuple(row[1:]) for row in c.fetchall()}
+    zero = (0,) * len(LANGUAGE_STATS_COLUMNS)
+    return [(language, stored.get(language, zero), expected.get(language, zero))
+            for language in sorted(set(expected) | set(stored))
+            if stored.get(language, zero) != expected.get(language, zero)]
+
+
+def _migrate_language_stats(c):
+    # Thống kê theo ngôn ngữ được trigger cập nhật cùng giao dịch với mỗi lần ghi learning_history
+    c.execute('''CREATE TABLE IF NOT EXISTS language_stats
+                 (language TEXT PRIMARY KEY,
+                  total_words INTEGER NOT NULL DEFAULT 0,
+                  total_correct INTEGER NOT NULL DEFAULT 0,
+                  total_wrong INTEGER NOT NULL DEFAULT 0,
+                  mastered_words INTEGER NOT NULL DEFAULT 0)''')
+    add_new = '''INSERT INTO language_stats (language) VALUES (NEW.language) ON CONFLICT (language) DO NOTHING;
+                 UPDATE language_stats SET
+                     total_words = total_words + 1,
+                     total_correct = total_correct + COALESCE(NEW.correct_count, 0),
+                     total_wrong = total_wrong + COALESCE(NEW.wrong_count, 0),
+                     mastered_words = mastered_words + (CASE WHEN NEW.correct_count > NEW.wrong_count THEN 1 ELSE 0 END)
+                 WHERE language = NEW.language;'''
+    remove_old = '''UPDATE language_stats SET
+                        total_words = total_words - 1,
+                        total_correct = total_correct - COALESCE(OLD.correct_count, 0),
+                        total_wrong = total_wrong - COALESCE(OLD.wrong_count, 0),
+                        mastered_words = mastered_words - (CASE WHEN OLD.correct_count > OLD.wrong_count THEN 1 ELSE 0 END)
+                    WHERE language = OLD.language;'''
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_learning_history_stats_insert
+                  AFTER INSERT ON learning_history BEGIN {add_new} END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_learning_history_stats_delete
+                  AFTER DELETE ON learning_history BEGIN {remove_old} END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_learning_history_stats_update
+                  AFTER UPDATE OF language, correct_count, wrong_count ON learning_history
+                  BEGIN {remove_old} {add_new} END''')
+    rebuild_language_stats(c)
+
+
+def _migrate_ingested_files(c):
+    # Lệnh ingest ghi lại file đã xử lý để chạy lại thì bỏ qua (file đổi kích thước/thời gian sửa thì xử lý lại)
+    c.execute('''CREATE TABLE IF NOT EXISTS ingested_files
+                 (path TEXT NOT NULL,
+                  language TEXT NOT NULL,
+                  sha256 TEXT NOT NULL,
+                  size INTEGER NOT NULL,
+                  mtime REAL NOT NULL,
+                  word_count INTEGER NOT NULL,
+                  ingested_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                  PRIMARY KEY (path, language))''')
+
+
+def _migrate_decks(c):
+    # Nội dung các bộ từ trong kho chung, để dựng lại bộ từ đã bị xóa khỏi bộ nhớ mà session vẫn đang dùng
+    c.execute('''CREATE TABLE IF NOT EXISTS decks
+                 (deck_id TEXT PRIMARY KEY,
+                  language TEXT NOT NULL,
+                  items TEXT NOT NULL,
+                  last_used TIMESTAMP NOT NULL)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_decks_last_used ON decks (last_used)")
+
+
+def _migrate_local_timestamps(c):
+    # Mọi thời điểm dùng giờ địa phương như datetime.now(). created_at/session_date mặc định là
+    # CURRENT_TIMESTAMP (UTC), và migration 6/7 đã chép created_at sang due_at/last_reviewed:
+    # các dòng đó có giá trị trùng created_at, đổi cùng lúc sang giờ địa phương.
+    c.execute("UPDATE learning_history SET due_at = datetime(created_at, 'localtime') WHERE due_at = created_at")
+    c.execute('''UPDATE learning_history SET last_reviewed = datetime(created_at, 'localtime')
+                 WHERE last_reviewed = created_at''')
+    c.execute("UPDATE learning_history SET created_at = datetime(created_at, 'localtime')")
+    c.execute("UPDATE study_sessions SET session_date = datetime(session_date, 'localtime')")
+
+
+def _migrate_translation_cache_size(c):
+    # Số mục của bộ nhớ dịch do trigger cập nhật, để mỗi lần ghi không phải đếm lại cả bảng
+    c.execute('''CREATE TABLE IF NOT EXISTS translation_cache_size
+                 (id INTEGER PRIMARY KEY CHECK (id = 1),
+                  entries INTEGER NOT NULL)''')
+    c.execute('''INSERT OR REPLACE INTO translation_cache_size (id, entries)
+                 SELECT 1, COUNT(*) FROM translation_cache''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS trg_translation_cache_size_insert
+                 AFTER INSERT ON translation_cache
+                 BEGIN UPDATE translation_cache_size SET entries = entries + 1 WHERE id = 1; END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS trg_translation_cache_size_delete
+                 AFTER DELETE ON translation_cache
+                 BEGIN UPDATE translation_cache_size SET entries = entries - 1 WHERE id = 1; END''')
+
+
+SCHEMA_VERSION_COLUMNS = '''(version INTEGER PRIMARY KEY,
+                             description TEXT,
+                             applied_at TIMESTAMP DEFAULT (datetime('now', 'localtime')))'''
+
+
+def _migrate_schema_version_local_time(c):
+    # Database cũ tạo schema_version với mặc định CURRENT_TIMESTAMP (UTC): dựng lại bảng với mặc định
+    # giờ địa phương và đổi các dòng đã có. Database mới đã có mặc định đúng, không cần làm gì.
+    c.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'")
+    if 'CURRENT_TIMESTAMP' not in c.fetchone()[0]:
+        return
+    c.execute("ALTER TABLE schema_version RENAME TO schema_version_utc")
+    c.execute(f"CREATE TABLE schema_version {SCHEMA_VERSION_COLUMNS}")
+    c.execute('''INSERT INTO schema_version (version, description, applied_at)
+                 SELECT version, description, datetime(applied_at, 'localtime') FROM schema_version_utc''')
+    c.execute("DROP TABLE schema_version_utc")
+
+
+# Các migration theo thứ tự, mỗi bản chỉ chạy một lần. Chỉ thêm vào cuối, không sửa bản đã phát hành.
+MIGRATIONS = [
+    (1, "Tạo bảng learning_history và study_sessions", _migrate_base_tables),
+    (2, "Thêm cột language", _migrate_language_columns),
+    (3, "Bộ nhớ dịch", _migrate_translation_cache),
+    (4, "Gộp từ trùng và UNIQUE (language, word)", _migrate_dedupe_history),
+    (5, "Index theo ngôn ngữ cho lịch sử và phiên học", _migrate_history_indexes),
+    (6, "Lịch ôn tập SM-2 (ease, interval, due_at)", _migrate_review_schedule),
+    (7, "Index cho phân trang Từ vựng Đã lưu", _migrate_history_paging),
+    (8, "Bảng thống kê theo ngôn ngữ cập nhật bằng trigger", _migrate_language_stats),
+    (9, "Danh sách file đã nạp bằng lệnh ingest", _migrate_ingested_files),
+    (10, "Nội dung bộ từ dùng chung giữa các session", _migrate_decks),
+    (11, "Đưa thời điểm tạo/ôn về giờ địa phương", _migrate_local_timestamps),
+    (12, "Số mục của bộ nhớ dịch cập nhật bằng trigger", _migrate_translation_cache_size),
+    (13, "Thời điểm áp dụng migration theo giờ địa phương", _migrate_schema_version_local_time),
+]
+
+
+@instrumented('db.init_database')
+def init_database():
+    """Khởi tạo database và chạy các migration chưa áp dụng"""
+    with db_connection() as conn:
+        c = conn.cursor()
+        c.execute(f"CREATE TABLE IF NOT EXISTS schema_version {SCHEMA_VERSION_COLUMNS}")
+        c.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+        if c.fetchone()[0] >= MIGRATIONS[-1][0]:
+            return
 
-    conn.commit()
-    conn.close()
+    for version, description, migrate in MIGRATIONS:
+        with db_connection() as conn:
+            c = conn.cursor()
+            # Khóa ghi trước khi kiểm tra để hai process không cùng chạy một migration
+            c.execute("BEGIN IMMEDIATE")
+            c.execute("SELECT 1 FROM schema_version WHERE version = ?", (version,))
+            if c.fetchone() is not None:
+                continue
+            migrate(c)
+            c.execute("INSERT INTO schema_version (version, description) VALUES (?, ?)", (version, description))
+
+
+@st.cache_resource(show_spinner=False)
+def get_process_pool():
+    """Nhóm process dùng chung cho các tác vụ nặng CPU, tạo một lần cho mỗi process"""
+    # spawn thay vì fork: process Streamlit có nhiều luồng, fork dễ kế thừa khóa đang bị giữ
+    return ProcessPoolExecutor(max_workers=MAX_PROCESSES, mp_context=multiprocessing.get_context('spawn'))
+
+
+def iter_pdf_pages(file, parallel=True):
+    """Sinh văn bản từng trang PDF theo thứ tự; file nhiều trang được chia cho nhóm process (trừ khi parallel=False)"""
+    PyPDF2 = lazy_import('PyPDF2')
+    pdf_reader = PyPDF2.PdfReader(file)
+    num_pages = len(pdf_reader.pages)
+    next_page = 0
+
+    if parallel and num_pages >= PDF_PARALLEL_MIN_PAGES and MAX_PROCESSES > 1:
+        # Process con tự mở file tạm, tránh gửi cả file qua pickle cho mỗi tác vụ
+        file.seek(0)
+        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as fp:
+            shutil.copyfileobj(file, fp)
+        ranges = iter([(start, min(start + PDF_PAGES_PER_TASK, num_pages))
+                       for start in range(0, num_pages, PDF_PAGES_PER_TASK)])
+        pending = deque()
+        try:
+            pool = get_process_pool()
+            # Giới hạn số tác vụ đang chạy để bộ nhớ không phụ thuộc số trang
+            for start, end in itertools.islice(ranges, MAX_PROCESSES * 2):
+                pending.append(pool.submit(extract_pdf_page_range, fp.name, start, end))
+            while pending:
+                pages = pending.popleft().result()
+                next_range = next(ranges, None)
+                if next_range is not None:
+                    pending.append(pool.submit(extract_pdf_page_range, fp.name, *next_range))
+                for page_text in pages:
+                    next_page += 1
+                    if page_text:
+                        yield page_text + "\n"
+        except Exception as e:
+            # Nhóm process hỏng hoặc không gửi được tác vụ (lỗi pickle): đọc tiếp tuần tự, trang lỗi
+            # thật sự sẽ báo lỗi lại khi đọc tuần tự
+            if isinstance(e, BrokenProcessPool):
+                get_process_pool.clear()  # process con bị dừng bất thường: tạo lại nhóm lần sau
+            logger.warning("Không đọc PDF song song được (%s: %s), đọc tiếp tuần tự từ trang %d",
+                           type(e).__name__, e, next_page + 1)
+        finally:
+            for future in pending:
+                future.cancel()
+            os.unlink(fp.name)
+
+    for page in pdf_reader.pages[next_page:]:
+        page_text = page.extract_text()
+        if page_text:
+            yield page_text + "\n"
+
+
+def iter_docx_paragraphs(file):
+    """Sinh văn bản từng đoạn của file DOCX"""
+    docx = lazy_import('docx')
+    doc = docx.Document(file)
+    for paragraph in doc.paragraphs:
+        if paragraph.text:
+            yield paragraph.text + "\n"
 
 
 def extract_text_from_pdf(file):
     """Trích xuất văn bản từ file PDF"""
+    PyPDF2 = require_module('PyPDF2')
     if PyPDF2 is None:
-        st.error("PyPDF2 chưa được cài đặt!")
         return ""
 
     try:
-        pdf_reader = PyPDF2.PdfReader(file)
-        text = ""
-        for page in pdf_reader.pages:
-            page_text = page.extract_text()
-            if page_text:
-                text += page_text + "\n"
-        return text
+        return "".join(iter_pdf_pages(file))
     except Exception as e:
         st.error(f"Lỗi khi đọc file PDF: {str(e)}")
         return ""
@@ -89,17 +807,12 @@ def extract_text_from_pdf(file):
 
 def extract_text_from_docx(file):
     """Trích xuất văn bản từ file DOCX"""
-    if Document is None:
-        st.error("python-docx chưa được cài đặt!")
+    docx = require_module('docx')
+    if docx is None:
         return ""
 
     try:
-        doc = Document(file)
-        text = ""
-        for paragraph in doc.paragraphs:
-            if paragraph.text:
-                text += paragraph.text + "\n"
-        return text
+        return "".join(iter_docx_paragraphs(file))
     except Exception as e:
         st.error(f"Lỗi khi đọc file DOCX: {str(e)}")
         return ""
@@ -118,181 +831,1410 @@ def extract_text_from_txt(file):
         return ""
 
 
-def extract_words(language, text):
-    """Trích xuất từ dựa trên ngôn ngữ"""
-    if language == "russian":
-        pattern = re.compile(r'[а-яА-ЯёЁ]{3,}')  # Ít nhất 3 ký tự cho tiếng Nga
-        words = pattern.findall(text)
-        # Lọc từ phổ biến (tùy chọn)
-        common_words = ['и', 'в', 'на', 'с', 'по', 'у', 'о', 'к', 'но', 'а', 'из', 'от', 'до', 'для']
-        filtered_words = [word for word in words if word.lower() not in common_words]
-    elif language == "chinese":
-        if jieba is None:
-            st.error("jieba chưa được cài đặt!")
-            return []
-        # Sử dụng jieba để phân đoạn từ
-        words = jieba.lcut(text)
-        # Lọc chỉ giữ từ tiếng Trung, ít nhất 1 ký tự, và không phải từ phổ biến
-        chinese_pattern = re.compile(r'^[\u4e00-\u9fff]+$')
-        filtered_words = [word for word in words if chinese_pattern.match(word) and len(word) >= 1]
-        # Lọc từ phổ biến (tùy chọn)
-        common_words = ['的', '是', '在', '我', '有', '他', '这', '了', '你', '不', '和', '我们']
-        filtered_words = [word for word in filtered_words if word not in common_words]
+# Một mục trong chỉ mục tần suất: từ, số lần xuất hiện, vị trí và ngữ cảnh lần đầu gặp,
+# các dạng biến đổi đã gặp (chỉ khi gộp theo gốc từ)
+WordStat = namedtuple('WordStat', ['word', 'count', 'first_pos', 'context', 'forms'], defaults=((),))
+
+
+class UploadCache:
+    """Lưu kết quả xử lý file upload trong process, xóa mục ít dùng nhất khi vượt dung lượng"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _estimate_size(value):
+        size = len(value['preview'])
+        size += sum(len(stat.word) + len(stat.context) + sum(map(len, stat.forms)) for stat in value['stats'])
+        size += sum(len(word) + len(translation) for word, translation in value['translations'].items())
+        # Ước lượng thô: ~4 byte mỗi ký tự cộng chi phí đối tượng Python
+        return size * 4 + 200 * (len(value['stats']) + len(value['translations']))
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                get_metrics().increment('upload_cache.misses')
+                return None
+            self._entries.move_to_end(key)
+        get_metrics().increment('upload_cache.hits')
+        return entry[0]
+
+    def put(self, key, value):
+        size = self._estimate_size(value)
+        with self._lock:
+            if key in self._entries:
+                self._size -= self._entries.pop(key)[1]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size)
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+
+
+@st.cache_resource(show_spinner=False)
+def get_upload_cache():
+    """Bộ nhớ đệm file upload dùng chung cho mọi session trong process"""
+    return UploadCache(UPLOAD_CACHE_MAX_BYTES)
+
+
+def upload_cache_key(file, language):
+    """Khóa cache: băm nội dung file, ngôn ngữ và phiên bản bộ trích xuất"""
+    with file.getbuffer() as buffer:
+        digest = hashlib.sha256(buffer).hexdigest()
+    return digest, language, EXTRACTOR_VERSION
+
+
+def iter_document_text(file, file_type):
+    """Đọc file thành luồng các đoạn văn bản (trang PDF, đoạn DOCX, hoặc cả file TXT)
+
+    Lỗi đọc file được ném ra cho nơi gọi: phần văn bản đã đọc được không đủ để lưu làm kết quả của file.
+    """
+    if file_type == "application/pdf":
+        if require_module('PyPDF2') is None:
+            return
+        chunks = iter_pdf_pages(file)
+    elif file_type == DOCX_MIME:
+        if require_module('docx') is None:
+            return
+        chunks = iter_docx_paragraphs(file)
     else:
+        yield extract_text_from_txt(file)
+        return
+
+    for chunk in chunks:
+        if chunk.strip():
+            yield chunk
+
+
+def tap_preview(chunks, preview, limit=PREVIEW_CHARS):
+    """Chuyển tiếp các đoạn văn bản, đồng thời giữ lại phần đầu (tối đa limit + 1 ký tự) để xem trước"""
+    size = 0
+    for chunk in chunks:
+        if size <= limit:
+            preview.append(chunk[:limit + 1 - size])
+            size += len(preview[-1])
+        yield chunk
+
+
+@st.cache_resource(show_spinner=False)
+def get_chinese_tokenizer():
+    """Từ điển jieba của process hiện tại, ghi thời gian nạp vào báo cáo khởi động"""
+    lazy_import('jieba')
+    tokenizer, info = load_chinese_tokenizer()
+    report = get_startup_report()
+    report['init']['jieba'] = info['seconds']
+    report['jieba'] = info
+    return tokenizer
+
+
+# Stemmer tiếng Nga theo thuật toán Snowball (https://snowballstem.org/algorithms/russian/stemmer.html)
+_RU_VOWELS = set('аеиоуыэюя')
+_RU_PERFECTIVE_GERUND = (('в', 'вши', 'вшись'), ('ив', 'ивши', 'ившись', 'ыв', 'ывши', 'ывшись'))
+_RU_ADJECTIVE = ((), ('ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый', 'ой', 'ем', 'им', 'ым', 'ом',
+                      'его', 'ого', 'ему', 'ому', 'их', 'ых', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею'))
+_RU_PARTICIPLE = (('ем', 'нн', 'вш', 'ющ', 'щ'), ('ивш', 'ывш', 'ующ'))
+_RU_REFLEXIVE = ((), ('ся', 'сь'))
+_RU_VERB = (('ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но', 'ет', 'ют', 'ны', 'ть', 'ешь', 'нно'),
+            ('ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей', 'уй', 'ил', 'ыл', 'им', 'ым', 'ен',
+             'ило', 'ыло', 'ено', 'ят', 'ует', 'уют', 'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю'))
+_RU_NOUN = ((), ('а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии', 'и', 'ией', 'ей', 'ой', 'ий',
+                 'й', 'иям', 'ям', 'ием', 'ем', 'ам', 'ом', 'о', 'у', 'ах', 'иях', 'ях', 'ы', 'ь', 'ию', 'ью',
+                 'ю', 'ия', 'ья', 'я'))
+
+
+def _ru_strip_suffix(word, start, groups):
+    """Bỏ hậu tố dài nhất khớp trong vùng word[start:]; nhóm 1 chỉ bỏ khi đứng sau 'а' hoặc 'я'
+
+    Trả về từ đã bỏ hậu tố, hoặc None nếu không khớp (như lệnh among của Snowball).
+    """
+    with_a, plain = groups
+    for suffix in sorted(with_a + plain, key=len, reverse=True):
+        if word.endswith(suffix) and len(word) - len(suffix) >= start:
+            cut = len(word) - len(suffix)
+            if suffix in plain:
+                return word[:cut]
+            if cut - 1 >= start and word[cut - 1] in 'ая':
+                return word[:cut]
+            return None
+    return None
+
+
+def _ru_region(word, start):
+    """Vị trí sau phụ âm đầu tiên đứng sau một nguyên âm, tính từ start (R1/R2 của Snowball)"""
+    for i in range(start + 1, len(word)):
+        if word[i] not in _RU_VOWELS and word[i - 1] in _RU_VOWELS:
+            return i + 1
+    return len(word)
+
+
+def russian_stem(word):
+    """Lấy gốc từ tiếng Nga, dùng để gộp các dạng biến cách/chia động từ của cùng một từ"""
+    word = word.lower().replace('ё', 'е')
+    rv = next((i + 1 for i, ch in enumerate(word) if ch in _RU_VOWELS), len(word))
+    r2 = _ru_region(word, _ru_region(word, 0) - 1)
+
+    # Bước 1
+    stripped = _ru_strip_suffix(word, rv, _RU_PERFECTIVE_GERUND)
+    if stripped is not None:
+        word = stripped
+    else:
+        word = _ru_strip_suffix(word, rv, _RU_REFLEXIVE) or word
+        stripped = _ru_strip_suffix(word, rv, _RU_ADJECTIVE)
+        if stripped is not None:
+            word = _ru_strip_suffix(stripped, rv, _RU_PARTICIPLE) or stripped
+        else:
+            stripped = _ru_strip_suffix(word, rv, _RU_VERB)
+            if stripped is None:
+                stripped = _ru_strip_suffix(word, rv, _RU_NOUN)
+            word = stripped if stripped is not None else word
+
+    # Bước 2
+    if word.endswith('и') and len(word) - 1 >= rv:
+        word = word[:-1]
+
+    # Bước 3: hậu tố phái sinh trong R2
+    for suffix in ('ость', 'ост'):
+        if word.endswith(suffix):
+            if len(word) - len(suffix) >= r2:
+                word = word[:-len(suffix)]
+            break
+
+    # Bước 4: bỏ hậu tố so sánh nhất rồi rút gọn "нн", hoặc rút gọn "нн", hoặc bỏ "ь"
+    superlative = next((suffix for suffix in ('ейше', 'ейш')
+                        if word.endswith(suffix) and len(word) - len(suffix) >= rv), None)
+    if superlative:
+        word = word[:-len(superlative)]
+        if word.endswith('нн') and len(word) - 2 >= rv:
+            word = word[:-1]
+    elif word.endswith('нн') and len(word) - 2 >= rv:
+        word = word[:-1]
+    elif word.endswith('ь') and len(word) - 1 >= rv:
+        word = word[:-1]
+
+    return word
+
+
+def merge_word_forms(stats):
+    """Gộp các dạng biến đổi của từ tiếng Nga theo gốc từ, giữ dạng gặp nhiều nhất làm từ chính
+
+    stats có thể là các mục đã gộp (vd. của nhiều file): các dạng trong forms được giữ lại.
+    """
+    groups = {}
+    for stat in stats:
+        groups.setdefault(russian_stem(stat.word), []).append(stat)
+
+    merged = []
+    for group in groups.values():
+        forms = Counter()
+        for stat in group:
+            forms[normalize_word(stat.word)] += stat.count
+            for form in stat.forms:
+                forms[normalize_word(form)] += 0
+        first = min(group, key=lambda stat: stat.first_pos)
+        ordered_forms = tuple(form for form, _ in sorted(forms.items(), key=lambda item: -item[1]))
+        merged.append(WordStat(ordered_forms[0], sum(forms.values()), first.first_pos, first.context, ordered_forms))
+
+    merged.sort(key=lambda stat: (-stat.count, stat.first_pos))
+    return merged
+
+
+def split_text(text, size):
+    """Cắt văn bản dài thành các đoạn không quá size ký tự, ưu tiên cắt ở xuống dòng, rồi cuối câu, rồi khoảng trắng"""
+    start = 0
+    while len(text) - start > size:
+        end = start + size
+        lower = start + size // 2
+        cut = text.rfind('\n', lower, end)
+        if cut == -1:
+            cut = max(text.rfind(mark, lower, end) for mark in '.!?。！？')
+        if cut == -1:
+            cut = text.rfind(' ', lower, end)
+        if cut == -1:
+            cut = end - 1
+        yield text[start:cut + 1]
+        start = cut + 1
+    if start < len(text):
+        yield text[start:]
+
+
+def iter_text_blocks(chunks, size=TOKENIZE_BLOCK_CHARS):
+    """Gom luồng các đoạn văn bản thành khối khoảng size ký tự, cắt ở ranh giới đoạn/câu"""
+    buffer, buffered = [], 0
+    for chunk in chunks:
+        for piece in split_text(chunk, size):
+            buffer.append(piece)
+            buffered += len(piece)
+            if buffered >= size:
+                yield "".join(buffer)
+                buffer, buffered = [], 0
+    if buffer:
+        yield "".join(buffer)
+
+
+def _iter_block_counts(language, chunks, parallel=True):
+    """Đếm từ theo từng khối, trả về (vị trí khối, kết quả) theo thứ tự văn bản
+
+    Nếu parallel, văn bản từ PARALLEL_TOKENIZE_MIN_CHARS ký tự trở lên được tách từ song song trên nhóm process.
+    """
+    blocks = iter_text_blocks(chunks)
+
+    # Đọc trước tới ngưỡng để biết có đáng chạy song song không
+    head, head_size = [], 0
+    for block in blocks:
+        head.append(block)
+        head_size += len(block)
+        if head_size >= PARALLEL_TOKENIZE_MIN_CHARS:
+            break
+
+    offset = 0
+    if not parallel or head_size < PARALLEL_TOKENIZE_MIN_CHARS or MAX_PROCESSES < 2:
+        if language == "chinese":
+            get_chinese_tokenizer()  # nạp jieba qua cache của ứng dụng để ghi vào báo cáo khởi động
+        for block in itertools.chain(head, blocks):
+            yield offset, count_words(language, block)
+            offset += len(block)
+        return
+
+    pending = deque()
+    remaining = itertools.chain(head, blocks)
+    try:
+        pool = get_process_pool()
+        for block in remaining:
+            # Giữ khối trong hàng chờ đến khi có kết quả để có thể xử lý lại nếu nhóm process lỗi
+            pending.append([offset, block, None])
+            offset += len(block)
+            pending[-1][2] = pool.submit(count_words, language, block)
+            # Giới hạn số khối đang xử lý để bộ nhớ không phụ thuộc độ dài văn bản
+            if len(pending) >= MAX_PROCESSES * 2:
+                yield pending[0][0], pending[0][2].result()
+                pending.popleft()
+        while pending:
+            yield pending[0][0], pending[0][2].result()
+            pending.popleft()
+    except Exception as e:
+        # Nhóm process hỏng, không nhận tác vụ hoặc không gửi được tác vụ (lỗi pickle): xử lý tiếp tuần tự
+        if isinstance(e, BrokenProcessPool):
+            get_process_pool.clear()  # process con bị dừng bất thường: tạo lại nhóm lần sau
+        logger.warning("Không tách từ song song được (%s: %s), tách từ tiếp tuần tự", type(e).__name__, e)
+        for _, _, future in pending:
+            if future is not None:
+                future.cancel()
+        for block_offset, block, _ in pending:
+            yield block_offset, count_words(language, block)
+        for block in remaining:
+            yield offset, count_words(language, block)
+            offset += len(block)
+
+
+def extract_word_frequencies(language, text, merge_forms=True, parallel=True):
+    """Lập chỉ mục tần suất từ: danh sách WordStat sắp xếp theo số lần xuất hiện giảm dần
+
+    text là chuỗi hoặc luồng các đoạn văn bản (xử lý lần lượt). Từ có cùng tần suất
+    được xếp theo vị trí xuất hiện đầu tiên. Với tiếng Nga, merge_forms gộp các dạng
+    biến đổi về một từ chính, các dạng đã gặp nằm trong WordStat.forms. parallel=False
+    tách từ ngay trong process hiện tại (vd. khi đang chạy trong process con).
+    """
+    if language not in ("russian", "chinese"):
+        return []
+    if language == "chinese" and require_module('jieba') is None:
         return []
 
-    return list(set(filtered_words))
+    chunks = [text] if isinstance(text, str) else text
+    counts = Counter()
+    first_seen = {}
+    # Các khối được trả về theo thứ tự văn bản, nên lần gặp đầu tiên luôn nằm ở khối sớm nhất
+    for offset, (block_counts, block_first_seen) in _iter_block_counts(language, chunks, parallel):
+        counts.update(block_counts)
+        for word, (pos, context) in block_first_seen.items():
+            if word not in first_seen:
+                first_seen[word] = (offset + pos, context)
+
+    stats = [WordStat(word, count, *first_seen[word]) for word, count in counts.items()]
+    if language == "russian" and merge_forms:
+        # книга, книги, книгу, книгой... được gộp thành một mục
+        return merge_word_forms(stats)
+    stats.sort(key=lambda stat: (-stat.count, stat.first_pos))
+    return stats
+
+
+def extract_words(language, text):
+    """Trích xuất từ dựa trên ngôn ngữ, từ xuất hiện nhiều nhất đứng trước"""
+    return [stat.word for stat in extract_word_frequencies(language, text)]
+
+
+def select_words(stats, max_words=None, min_count=1):
+    """Chọn các từ cần dịch: chỉ lấy từ xuất hiện ít nhất min_count lần, tối đa max_words từ đầu"""
+    words = [stat.word for stat in stats if stat.count >= min_count]
+    return words[:max_words] if max_words else words
+
+
+def normalize_word(word):
+    """Chuẩn hóa từ để làm khóa cho bộ nhớ dịch"""
+    return word.strip().lower()
+
+
+@instrumented('db.get_cached_translations')
+def get_cached_translations(source_lang, keys):
+    """Lấy bản dịch có sẵn trong bộ nhớ dịch cho các từ đã chuẩn hóa"""
+    found = {}
+    keys = list(keys)
+    if not keys:
+        return found
+
+    with db_connection() as conn:
+        c = conn.cursor()
+
+        for start in range(0, len(keys), SQL_BATCH_SIZE):
+            chunk = keys[start:start + SQL_BATCH_SIZE]
+            placeholders = ','.join('?' * len(chunk))
+            c.execute(f'''SELECT word, translation FROM translation_cache
+                          WHERE source_lang = ? AND word IN ({placeholders})''', (source_lang, *chunk))
+            found.update(c.fetchall())
+
+    # Cập nhật thời điểm sử dụng để xóa theo LRU, ghi nền qua luồng ghi để lệnh đọc không giữ khóa ghi
+    if found:
+        db_write(_touch_cached_translations, source_lang, list(found), datetime.now())
+    return found
+
+
+@instrumented('db.touch_cached_translations')
+def _touch_cached_translations(conn, source_lang, keys, now):
+    conn.executemany('''UPDATE translation_cache SET last_used = ?
+                        WHERE source_lang = ? AND word = ?''', [(now, source_lang, key) for key in keys])
+
+
+@instrumented('db.get_history_translations')
+def get_history_translations(language, words):
+    """Lấy bản dịch đã lưu trong learning_history, trả về theo từ đã chuẩn hóa"""
+    found = {}
+    words = list(words)
+    if not words:
+        return found
+
+    with db_connection() as conn:
+        c = conn.cursor()
+
+        for start in range(0, len(words), SQL_BATCH_SIZE):
+            chunk = words[start:start + SQL_BATCH_SIZE]
+            placeholders = ','.join('?' * len(chunk))
+            c.execute(f'''SELECT word, translation FROM learning_history
+                          WHERE language = ? AND word IN ({placeholders})''', (language, *chunk))
+            for word, translation in c.fetchall():
+                if translation and not translation.startswith(UNTRANSLATED_PREFIX):
+                    found[normalize_word(word)] = translation
+
+    return found
+
+
+@instrumented('db.save_cached_translations')
+def _write_cached_translations(conn, source_lang, translations, now):
+    c = conn.cursor()
+    # UPSERT thay vì INSERT OR REPLACE: REPLACE xóa dòng cũ mà không chạy trigger DELETE, làm lệch số mục
+    c.executemany('''INSERT INTO translation_cache (source_lang, word, translation, last_used)
+                     VALUES (?, ?, ?, ?)
+                     ON CONFLICT (source_lang, word) DO UPDATE SET
+                         translation = excluded.translation,
+                         last_used = excluded.last_used''',
+                  [(source_lang, key, translation, now) for key, translation in translations.items()])
+
+    # Số mục do trigger đếm sẵn (migration 12), không phải COUNT(*) cả bảng mỗi lần ghi
+    c.execute('SELECT entries FROM translation_cache_size')
+    excess = c.fetchone()[0] - TRANSLATION_CACHE_MAX_ENTRIES
+    if excess > 0:
+        c.execute('''DELETE FROM translation_cache WHERE rowid IN
+                     (SELECT rowid FROM translation_cache ORDER BY last_used LIMIT ?)''', (excess,))
+
+
+def save_cached_translations(source_lang, translations):
+    """Lưu bản dịch vào bộ nhớ dịch (ghi nền) và xóa các mục ít dùng nhất khi vượt giới hạn"""
+    if not translations:
+        return None
+    return db_write(_write_cached_translations, source_lang, dict(translations), datetime.now())
+
+
+class Translator:
+    """Giao diện chung cho backend dịch: translate(text) trả về bản dịch hoặc ném lỗi"""
+    # True nếu backend dịch được văn bản nhiều dòng, mỗi dòng một từ
+    supports_batch = False
+
+    def translate(self, text):
+        raise NotImplementedError
+
+
+class GoogleBackend(Translator):
+    """Dịch qua Google Translate, hỗ trợ gộp nhiều từ thành một request nhiều dòng"""
+    supports_batch = True
+
+    def __init__(self, source_lang, target_lang='vi'):
+        deep_translator = lazy_import('deep_translator')
+        self._translator = deep_translator.GoogleTranslator(source=source_lang, target=target_lang)
+
+    def translate(self, text):
+        return self._translator.translate(text)
+
+
+class DictionaryTranslator(Translator):
+    """Tra từ điển offline từ file chỉ mục đã sắp xếp, đọc qua mmap với tìm kiếm nhị phân
+
+    Định dạng chỉ mục: magic (8 byte), số mục n (uint64), n offset (uint64) trỏ tới
+    các bản ghi "từ\tnghĩa\n" UTF-8 đã sắp xếp theo từ.
+    """
+
+    def __init__(self, index_path):
+        self.index_path = index_path
+        with open(index_path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:8] != DICTIONARY_INDEX_MAGIC:
+            raise ValueError(f"File chỉ mục từ điển không hợp lệ: {index_path}")
+        self.size = struct.unpack_from('<Q', self._mm, 8)[0]
+
+    def _record_at(self, i):
+        offset = struct.unpack_from('<Q', self._mm, 16 + 8 * i)[0]
+        tab = self._mm.find(b'\t', offset)
+        return offset, tab
+
+    def lookup(self, word):
+        """Trả về nghĩa của từ (đã chuẩn hóa) hoặc None nếu không có, O(log n)"""
+        key = normalize_word(word).encode('utf-8')
+        lo, hi = 0, self.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset, tab = self._record_at(mid)
+            current = self._mm[offset:tab]
+            if current < key:
+                lo = mid + 1
+            elif current > key:
+                hi = mid
+            else:
+                end = self._mm.find(b'\n', tab)
+                return self._mm[tab + 1:end].decode('utf-8')
+        return None
+
+    def translate(self, text):
+        result = self.lookup(text)
+        if result is None:
+            raise LookupError(f"Không có trong từ điển: {text}")
+        return result
+
+
+def parse_dictionary_line(line):
+    """Đọc một dòng từ điển dạng "từ<TAB>nghĩa" hoặc kiểu CC-CEDICT (繁 简 [pinyin] /nghĩa 1/nghĩa 2/)"""
+    line = line.strip()
+    if not line or line.startswith('#'):
+        return None
+    if '\t' in line:
+        word, _, translation = line.partition('\t')
+        return word.strip(), translation.strip()
+    match = re.match(r'^\S+\s+(\S+)\s+\[[^\]]*\]\s+/(.+)/$', line)
+    if match:
+        return match.group(1), '; '.join(part for part in match.group(2).split('/') if part)
+    return None
+
+
+def compile_dictionary(source_path, index_path):
+    """Biên dịch danh sách từ song ngữ thành file chỉ mục đã sắp xếp (chạy một lần)"""
+    entries = {}
+    with open(source_path, encoding='utf-8') as f:
+        for line in f:
+            parsed = parse_dictionary_line(line)
+            if not parsed or not parsed[0] or not parsed[1]:
+                continue
+            key = normalize_word(parsed[0])
+            translation = ' '.join(parsed[1].split())
+            # Giữ nghĩa đầu tiên cho mỗi từ
+            entries.setdefault(key.encode('utf-8'), translation.encode('utf-8'))
+
+    keys = sorted(entries)
+    header_size = 16 + 8 * len(keys)
+    offsets, records, position = [], [], header_size
+    for key in keys:
+        record = key + b'\t' + entries[key] + b'\n'
+        offsets.append(position)
+        records.append(record)
+        position += len(record)
+
+    tmp_path = index_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(DICTIONARY_INDEX_MAGIC)
+        f.write(struct.pack('<Q', len(keys)))
+        f.write(struct.pack(f'<{len(keys)}Q', *offsets))
+        f.writelines(records)
+    os.replace(tmp_path, index_path)
+    return len(keys)
+
+
+@st.cache_resource(show_spinner=False)
+def _open_dictionary(index_path, mtime):
+    return DictionaryTranslator(index_path)
+
+
+def load_dictionary(source_lang):
+    """Mở từ điển offline cho ngôn ngữ nguồn, biên dịch lại chỉ mục nếu file nguồn thay đổi"""
+    index_path = os.path.join(DICTIONARY_DIR, f"{source_lang}-vi.idx")
+    for ext in ('.tsv', '.u8', '.txt'):
+        source_path = os.path.join(DICTIONARY_DIR, f"{source_lang}-vi{ext}")
+        if os.path.exists(source_path):
+            if not os.path.exists(index_path) or os.path.getmtime(index_path) < os.path.getmtime(source_path):
+                compile_dictionary(source_path, index_path)
+            break
+
+    if not os.path.exists(index_path):
+        return None
+    try:
+        return _open_dictionary(index_path, os.path.getmtime(index_path))
+    except (OSError, ValueError) as e:
+        st.warning(f"Không mở được từ điển offline: {str(e)}")
+        return None
+
+
+class RateLimiter:
+    """Giới hạn số request mỗi giây, dùng chung giữa các luồng"""
+
+    def __init__(self, requests_per_second):
+        self.interval = 1.0 / requests_per_second if requests_per_second > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = time.monotonic()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+def make_translation_batches(keys, max_chars=TRANSLATE_BATCH_MAX_CHARS, max_words=TRANSLATE_BATCH_MAX_WORDS):
+    """Gộp các từ thành lô, mỗi lô là một request nhiều dòng không vượt giới hạn ký tự"""
+    batches = []
+    batch, size = [], 0
+    for key in keys:
+        if batch and (size + len(key) + 1 > max_chars or len(batch) >= max_words):
+            batches.append(batch)
+            batch, size = [], 0
+        batch.append(key)
+        size += len(key) + 1
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def _call_with_retry(func, text, limiter, max_retries, backoff):
+    """Gọi translator với giới hạn tốc độ và thử lại theo exponential backoff"""
+    for attempt in range(max_retries + 1):
+        limiter.wait()
+        try:
+            return func(text)
+        except Exception:
+            if attempt == max_retries:
+                raise
+            time.sleep(backoff * (2 ** attempt) + random.uniform(0, backoff))
+
+
+def _translate_one_batch(batch, get_translator, limiter, max_retries, backoff):
+    """Dịch một lô từ, tách kết quả theo dòng; nếu số dòng lệch thì dịch lại từng từ
+
+    Nếu chính request của cả lô vẫn lỗi sau khi thử lại (mất mạng, bị giới hạn 429...), mọi từ
+    trong lô được ghi lỗi luôn: dịch lại từng từ chỉ nhân số request lên khi backend đang lỗi.
+    """
+    translator = get_translator()
+    results, errors = {}, {}
 
+    if len(batch) > 1:
+        try:
+            lines = _call_with_retry(translator.translate, "\n".join(batch), limiter, max_retries, backoff)
+        except Exception as e:
+            return results, dict.fromkeys(batch, str(e))
+        lines = [line.strip() for line in (lines or "").splitlines() if line.strip()]
+        if len(lines) == len(batch):
+            return dict(zip(batch, lines)), errors
 
-def translate_words(language, words):
-    """Dịch từ dựa trên ngôn ngữ sang tiếng Việt"""
+    for key in batch:
+        try:
+            results[key] = _call_with_retry(translator.translate, key, limiter, max_retries, backoff)
+        except Exception as e:
+            errors[key] = str(e)
+    return results, errors
+
+
+def translate_batch(keys, translator_factory, on_progress=None,
+                    max_workers=TRANSLATE_MAX_WORKERS,
+                    requests_per_second=TRANSLATE_REQUESTS_PER_SECOND,
+                    max_retries=TRANSLATE_MAX_RETRIES,
+                    backoff=TRANSLATE_BACKOFF_SECONDS):
+    """Dịch danh sách từ bằng nhóm luồng có giới hạn, trả về (bản dịch, lỗi)
+
+    translator_factory tạo một translator cho mỗi luồng (đối tượng có hàm translate(text)).
+    Nếu translator có supports_batch = True, nhiều từ được gộp thành một request nhiều dòng.
+    on_progress(số từ đã xong, tổng số từ) được gọi trên luồng gọi hàm này.
+    """
+    results, errors = {}, {}
+    keys = list(keys)
+    if not keys:
+        return results, errors
+
+    local = threading.local()
+
+    def get_translator():
+        # GoogleTranslator giữ trạng thái request, mỗi luồng cần một đối tượng riêng
+        if not hasattr(local, 'translator'):
+            local.translator = translator_factory()
+        return local.translator
+
+    if getattr(get_translator(), 'supports_batch', False):
+        batches = make_translation_batches(keys)
+    else:
+        batches = [[key] for key in keys]
+
+    limiter = RateLimiter(requests_per_second)
+    done = 0
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = {executor.submit(_translate_one_batch, batch, get_translator, limiter, max_retries, backoff): batch
+                   for batch in batches}
+        for future in as_completed(futures):
+            batch_results, batch_errors = future.result()
+            results.update(batch_results)
+            errors.update(batch_errors)
+            done += len(futures[future])
+            if on_progress:
+                on_progress(done, len(keys))
+
+    return results, errors
+
+
+@instrumented('translate')
+def translate_words(language, words, translator_factory=None, dictionary=None, on_progress=None):
+    """Dịch từ dựa trên ngôn ngữ sang tiếng Việt
+
+    Thứ tự tra: bộ nhớ dịch -> lịch sử học -> từ điển offline -> translator mạng (chỉ cho từ còn thiếu).
+    on_progress(số từ đã xong, tổng số từ) cho nơi gọi không có giao diện Streamlit (dòng lệnh);
+    khi có on_progress thì không vẽ thanh tiến trình và thông báo của Streamlit.
+    """
     translations = {}
 
     if not words:
         return translations
 
-    progress_bar = st.progress(0)
-    status_text = st.empty()
+    show_ui = on_progress is None
+    if show_ui:
+        progress_bar = st.progress(0)
+        status_text = st.empty()
 
-    # Khởi tạo translator
     source_lang = 'ru' if language == "russian" else 'zh-CN'
-    translator = GoogleTranslator(source=source_lang, target='vi')
 
-    for i, word in enumerate(words):
-        try:
-            # Dùng deep-translator
-            translated_text = translator.translate(word)
-            translations[word] = translated_text
-        except Exception as e:
-            st.warning(f"Không thể dịch từ '{word}': {str(e)}")
-            translations[word] = f"Chưa dịch được: {word}"
+    # Tra bộ nhớ dịch trước, sau đó đến bản dịch đã có trong lịch sử học
+    keys = {word: normalize_word(word) for word in words}
+    known = get_cached_translations(source_lang, set(keys.values()))
+    from_history = get_history_translations(language, [word for word in words if keys[word] not in known])
+    if from_history:
+        save_cached_translations(source_lang, from_history)
+        known.update(from_history)
+
+    missing = [key for key in dict.fromkeys(keys.values()) if key not in known]
+    hits = len(set(keys.values())) - len(missing)
+
+    # Từ điển offline, không cần mạng
+    if dictionary is None:
+        dictionary = load_dictionary(source_lang)
+    dictionary_hits = 0
+    if dictionary is not None and missing:
+        still_missing = []
+        for key in missing:
+            result = dictionary.lookup(key)
+            if result is None:
+                still_missing.append(key)
+            else:
+                known[key] = result
+        dictionary_hits = len(missing) - len(still_missing)
+        missing = still_missing
+
+    # Chỉ gọi translator mạng cho các từ chưa có trong cache và từ điển
+    if translator_factory is None:
+        translator_factory = lambda: GoogleBackend(source_lang)
+
+    def show_progress(done, total):
+        if show_ui:
+            progress_bar.progress(done / total)
+            status_text.text(f"Đang dịch... {done}/{total} từ")
+        else:
+            on_progress(done, total)
+
+    with timed('translate.network'):
+        translated, errors = translate_batch(missing, translator_factory, on_progress=show_progress)
+    metrics = get_metrics()
+    metrics.increment('translate.cache_hits', hits)
+    metrics.increment('translate.dictionary_hits', dictionary_hits)
+    metrics.increment('translate.network_words', len(missing))
+    metrics.increment('translate.errors', len(errors))
+    if errors:
+        sample = ", ".join(f"'{key}'" for key in list(errors)[:5])
+        message = f"Không thể dịch {len(errors)} từ ({sample}...): {next(iter(errors.values()))}"
+        if show_ui:
+            st.warning(message)
+        else:
+            logger.warning(message)
+
+    save_cached_translations(source_lang, translated)
+    known.update(translated)
 
-        progress_bar.progress((i + 1) / len(words))
-        status_text.text(f"Đang dịch... {i + 1}/{len(words)} từ")
+    for word in words:
+        translations[word] = known.get(keys[word], f"{UNTRANSLATED_PREFIX}{word}")
 
-    status_text.text("✅ Hoàn thành dịch thuật!")
+    if show_ui:
+        progress_bar.progress(1.0)
+        status_text.text(f"✅ Hoàn thành dịch thuật! (cache: {hits} từ có sẵn, từ điển: {dictionary_hits} từ, "
+                         f"{len(missing)} từ dịch qua mạng)")
     return translations
 
 
+ReviewState = namedtuple('ReviewState', ['ease', 'interval_days', 'repetitions'])
+
+
+def next_review_state(state, is_correct):
+    """Tính lịch ôn tiếp theo theo SM-2 từ trạng thái hiện tại và kết quả trả lời"""
+    quality = SRS_QUALITY_CORRECT if is_correct else SRS_QUALITY_WRONG
+    ease = max(SRS_MIN_EASE, state.ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    if quality < 3:
+        # Trả lời sai: học lại từ đầu, ôn lại sau một ngày
+        return ReviewState(ease, 1, 0)
+    if state.repetitions == 0:
+        interval_days = 1
+    elif state.repetitions == 1:
+        interval_days = 6
+    else:
+        interval_days = state.interval_days * ease
+    return ReviewState(ease, interval_days, state.repetitions + 1)
+
+
+@instrumented('db.save_results_to_history')
+def _write_results_to_history(conn, language, results, now):
+    c = conn.cursor()
+    # Luồng ghi đã giữ khóa ghi (BEGIN IMMEDIATE) nên lịch đọc ở đây không bị phiên khác ghi đè
+    words = list(dict.fromkeys(word for word, _, _ in results))
+    states = {}
+    for start in range(0, len(words), SQL_BATCH_SIZE):
+        chunk = words[start:start + SQL_BATCH_SIZE]
+        placeholders = ','.join('?' * len(chunk))
+        c.execute(f'''SELECT word, ease, interval_days, repetitions FROM learning_history
+                      WHERE language = ? AND word IN ({placeholders})''', (language, *chunk))
+        for word, ease, interval_days, repetitions in c.fetchall():
+            states[word] = ReviewState(ease, interval_days, repetitions)
+
+    # Gộp các kết quả của cùng một từ theo thứ tự trả lời
+    rows = {}
+    for word, translation, is_correct in results:
+        states[word] = next_review_state(states.get(word, ReviewState(SRS_INITIAL_EASE, 0, 0)), is_correct)
+        _, correct_count, wrong_count = rows.get(word, (None, 0, 0))
+        rows[word] = (translation, correct_count + (1 if is_correct else 0), wrong_count + (0 if is_correct else 1))
+
+    c.executemany('''INSERT INTO learning_history
+                     (language, word, translation, correct_count, wrong_count, last_reviewed,
+                      ease, interval_days, repetitions, due_at, created_at)
+                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                     ON CONFLICT (language, word) DO UPDATE SET
+                         correct_count = correct_count + excluded.correct_count,
+                         wrong_count = wrong_count + excluded.wrong_count,
+                         last_reviewed = excluded.last_reviewed,
+                         ease = excluded.ease,
+                         interval_days = excluded.interval_days,
+                         repetitions = excluded.repetitions,
+                         due_at = excluded.due_at''',
+                  [(language, word, translation, correct_count, wrong_count, now,
+                    states[word].ease, states[word].interval_days, states[word].repetitions,
+                    now + timedelta(days=states[word].interval_days), now)
+                   for word, (translation, correct_count, wrong_count) in rows.items()])
+
+
+def save_results_to_history(language, results):
+    """Lưu cả lô kết quả [(từ, nghĩa, đúng/sai), ...] vào lịch sử học tập và cập nhật lịch ôn
+
+    Việc ghi chạy trên luồng ghi chung; trả về Future, gọi .result() nếu cần chờ dữ liệu đã được commit.
+    """
+    if not results:
+        return None
+    return db_write(_write_results_to_history, language, list(results), datetime.now())
+
+
+@instrumented('db.get_due_words')
+def get_due_words(language, limit, now=None):
+    """Lấy tối đa limit từ đã đến hạn ôn, hạn sớm nhất trước (quét theo index (language, due_at))"""
+    with db_connection() as conn:
+        c = conn.cursor()
+        c.execute('''SELECT word, translation, due_at FROM learning_history
+                     WHERE language = ? AND due_at <= ?
+                     ORDER BY due_at
+                     LIMIT ?''', (language, now or datetime.now(), limit))
+        return c.fetchall()
+
+
+@instrumented('db.get_next_due_at')
+def get_next_due_at(language):
+    """Thời điểm đến hạn sớm nhất của ngôn ngữ, None nếu chưa có từ nào"""
+    with db_connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT MIN(due_at) FROM learning_history WHERE language = ?", (language,))
+        return c.fetchone()[0]
+
+
+@instrumented('db.get_history_page')
+def get_history_page(language, sort, after=None, search="", accuracy_filter="Tất cả", limit=25):
+    """Lấy một trang lịch sử học tập, sắp xếp và lọc trong SQL; after là khóa của dòng cuối trang trước"""
+    columns, descending = HISTORY_SORTS[sort]
+    conditions = HISTORY_FILTERS[accuracy_filter]
+    params = [language]
+    if search:
+        pattern = '%' + re.sub(r'([\\%_])', r'\\\1', search) + '%'
+        conditions += r" AND (word LIKE ? ESCAPE '\' OR translation LIKE ? ESCAPE '\')"
+        params += [pattern, pattern]
+    if after is not None:
+        # So sánh bộ giá trị để SQLite tiếp tục quét index từ dòng cuối trang trước
+        conditions += f" AND ({', '.join(columns)}) {'<' if descending else '>'} ({', '.join('?' * len(columns))})"
+        params += list(after)
+    direction = 'DESC' if descending else 'ASC'
+
+    with db_connection() as conn:
+        c = conn.cursor()
+        c.execute(f'''SELECT id, word, translation, correct_count, wrong_count, last_reviewed,
+                             CASE WHEN (correct_count + wrong_count) > 0
+                                  THEN ROUND(correct_count * 100.0 / (correct_count + wrong_count), 1)
+                                  ELSE 0 END as accuracy
+                      FROM learning_history
+                      WHERE language = ? {conditions}
+                      ORDER BY {', '.join(f'{column} {direction}' for column in columns)}
+                      LIMIT ?''', (*params, limit + 1))
+        names = [description[0] for description in c.description]
+        rows = [dict(zip(names, row)) for row in c.fetchall()]
+
+    # Lấy dư một dòng để biết còn trang sau hay không
+    has_next = len(rows) > limit
+    rows = rows[:limit]
+    next_after = tuple(rows[-1][column] for column in columns) if has_next else None
+    return rows, next_after
+
+
+@instrumented('db.get_review_words')
+def get_review_words(language, order="random", limit=None, accuracy_filter="Tất cả"):
+    """Lấy (từ, nghĩa) để ôn tập, chỉ đọc hai cột cần thiết"""
+    order_by = "RANDOM()" if order == "random" else "last_reviewed DESC"
+    with db_connection() as conn:
+        c = conn.cursor()
+        c.execute(f'''SELECT word, translation FROM learning_history
+                      WHERE language = ? {HISTORY_FILTERS[accuracy_filter]}
+                      ORDER BY {order_by} LIMIT ?''', (language, -1 if limit is None else limit))
+        return dict(c.fetchall())
+
+
 def save_to_history(language, word, translation, is_correct=True):
     """Lưu từ vào lịch sử học tập"""
-    conn = sqlite3.connect('learning_history.db', check_same_thread=False)
-    c = conn.cursor()
+    return save_results_to_history(language, [(word, translation, is_correct)])
 
-    # Kiểm tra xem từ đã tồn tại chưa (dựa trên ngôn ngữ)
-    c.execute('SELECT * FROM learning_history WHERE language = ? AND word = ?', (language, word))
-    existing = c.fetchone()
 
-    if existing:
-        if is_correct:
-            c.execute('''UPDATE learning_history 
-                        SET correct_count = correct_count + 1, last_reviewed = ?
-                        WHERE language = ? AND word = ?''', (datetime.now(), language, word))
-        else:
-            c.execute('''UPDATE learning_history 
-                        SET wrong_count = wrong_count + 1, last_reviewed = ?
-                        WHERE language = ? AND word = ?''', (datetime.now(), language, word))
-    else:
-        c.execute('''INSERT INTO learning_history 
-                    (language, word, translation, correct_count, wrong_count, last_reviewed)
-                    VALUES (?, ?, ?, ?, ?, ?)''',
-                  (language, word, translation, 1 if is_correct else 0, 0 if is_correct else 1, datetime.now()))
+@instrumented('db.save_study_session')
+def _write_study_session(conn, language, session_type, score, total_questions, now):
+    c = conn.cursor()
 
-    conn.commit()
-    conn.close()
+    c.execute('''INSERT INTO study_sessions 
+                (language, session_type, score, total_questions, session_date)
+                VALUES (?, ?, ?, ?, ?)''',
+              (language, session_type, score, total_questions, now))
 
 
 def save_study_session(language, session_type, score, total_questions):
     """Lưu session học tập"""
-    conn = sqlite3.connect('learning_history.db', check_same_thread=False)
-    c = conn.cursor()
+    return db_write(_write_study_session, language, session_type, score, total_questions, datetime.now())
 
-    c.execute('''INSERT INTO study_sessions 
-                (language, session_type, score, total_questions)
-                VALUES (?, ?, ?, ?)''',
-              (language, session_type, score, total_questions))
 
-    conn.commit()
-    conn.close()
+def _write_quiz_results(conn, language, results, now, score, total_questions):
+    _write_results_to_history(conn, language, results, now)
+    _write_study_session(conn, language, "quiz", score, total_questions, now)
 
 
-def get_learning_stats(language):
-    """Lấy thống kê học tập dựa trên ngôn ngữ"""
-    conn = sqlite3.connect('learning_history.db', check_same_thread=False)
-    c = conn.cursor()
+def save_quiz_results(language, results, score, total_questions):
+    """Lưu kết quả bài quiz và session học tập trong cùng một giao dịch; trả về Future"""
+    return db_write(_write_quiz_results, language, list(results), datetime.now(), score, total_questions)
 
-    c.execute('''SELECT 
-                 COUNT(*) as total_words,
-                 SUM(correct_count) as total_correct,
-                 SUM(wrong_count) as total_wrong,
-                 COUNT(CASE WHEN correct_count > wrong_count THEN 1 END) as mastered_words
-                 FROM learning_history
-                 WHERE language = ?''', (language,))
 
-    stats = c.fetchone()
-    conn.close()
+@instrumented('db.get_learning_stats')
+def get_learning_stats(language):
+    """Lấy thống kê học tập dựa trên ngôn ngữ (đọc một dòng của bảng tổng hợp)"""
+    with db_connection() as conn:
+        c = conn.cursor()
+
+        c.execute(f'''SELECT {', '.join(LANGUAGE_STATS_COLUMNS)}
+                      FROM language_stats
+                      WHERE language = ?''', (language,))
+
+        stats = c.fetchone() or (0,) * len(LANGUAGE_STATS_COLUMNS)
+
+    return dict(zip(LANGUAGE_STATS_COLUMNS, stats))
+
+
+def gtts_synthesize(text, lang, path):
+    """Tạo file MP3 phát âm bằng gTTS (cần mạng)"""
+    gtts = lazy_import('gtts')
+    gtts.gTTS(text=text, lang=lang.lower(), slow=False).save(path)
+
+
+class AudioCache:
+    """Cache file phát âm trên đĩa theo nội dung, xóa file ít dùng nhất khi vượt dung lượng"""
+
+    def __init__(self, directory, max_bytes, synthesize=gtts_synthesize, executor=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.synthesize = synthesize
+        self.executor = executor
+        self._entries = OrderedDict()  # đường dẫn -> kích thước, theo thứ tự dùng gần nhất
+        self._size = 0
+        self._pending = {}  # đường dẫn -> Future của lần tạo đang chạy
+        self._errors = OrderedDict()  # đường dẫn -> lỗi của lần tạo gần nhất bị hỏng
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        # Khôi phục thứ tự LRU từ thời gian sửa file của các lần chạy trước
+        files = []
+        for entry in os.scandir(directory):
+            if entry.name.endswith('.mp3') and entry.is_file():
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.path, stat.st_size))
+        for _, path, size in sorted(files):
+            self._entries[path] = size
+            self._size += size
+
+    def path_for(self, text, lang):
+        digest = hashlib.sha256(f"{lang}\0{text}".encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest + '.mp3')
+
+    def get(self, text, lang):
+        """Trả về đường dẫn file đã có trong cache, hoặc None"""
+        path = self.path_for(text, lang)
+        with self._lock:
+            if path not in self._entries:
+                get_metrics().increment('tts.misses')
+                return None
+            self._entries.move_to_end(path)
+        get_metrics().increment('tts.hits')
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # File bị xóa từ bên ngoài
+            with self._lock:
+                self._size -= self._entries.pop(path, 0)
+            return None
+        return path
+
+    def status(self, text, lang):
+        """Trạng thái phát âm: ('ready', đường dẫn), ('pending', Future), ('failed', lỗi) hoặc ('missing', None)"""
+        path = self.get(text, lang)
+        if path is not None:
+            return 'ready', path
+        path = self.path_for(text, lang)
+        with self._lock:
+            if path in self._pending:
+                return 'pending', self._pending[path]
+            if path in self._errors:
+                return 'failed', self._errors[path]
+        return 'missing', None
+
+    def fetch(self, text, lang):
+        """Trả về file phát âm, tạo ngay nếu chưa có (chờ nếu đang được tạo trong nền)"""
+        path = self.get(text, lang)
+        if path is not None:
+            return path
+        return self._claim(text, lang).result()
+
+    def prefetch(self, texts, lang):
+        """Tạo sẵn file phát âm cho các từ chưa có trong cache, chạy trong nền"""
+        if self.executor is None:
+            return
+        for text in texts:
+            path = self.path_for(text, lang)
+            with self._lock:
+                if path in self._entries or path in self._pending:
+                    continue
+            self._claim(text, lang, background=True)
+
+    def _claim(self, text, lang, background=False):
+        """Đăng ký một lần tạo file để các lời gọi trùng nhau dùng chung kết quả"""
+        path = self.path_for(text, lang)
+        with self._lock:
+            future = self._pending.get(path)
+            if future is not None:
+                return future
+            future = Future()
+            self._pending[path] = future
+            self._errors.pop(path, None)
+        if background:
+            self.executor.submit(self._run, future, text, lang, path)
+        else:
+            self._run(future, text, lang, path)
+        return future
 
-    return {
-        'total_words': stats[0] or 0,
-        'total_correct': stats[1] or 0,
-        'total_wrong': stats[2] or 0,
-        'mastered_words': stats[3] or 0
-    }
+    def _run(self, future, text, lang, path):
+        try:
+            self._synthesize_to(text, lang, path)
+        except Exception as e:
+            logger.warning("Không tạo được phát âm cho %r (%s): %s", text, lang, e)
+            with self._lock:
+                self._errors[path] = str(e)
+                while len(self._errors) > TTS_MAX_ERRORS:
+                    self._errors.popitem(last=False)
+                self._pending.pop(path, None)
+            future.set_exception(e)
+        else:
+            with self._lock:
+                self._pending.pop(path, None)
+            future.set_result(path)
+
+    def _synthesize_to(self, text, lang, path):
+        # Ghi ra file tạm cùng thư mục rồi đổi tên để không ai đọc phải file ghi dở
+        fd, tmp_path = tempfile.mkstemp(suffix='.part', dir=self.directory)
+        os.close(fd)
+        try:
+            with timed('tts.synthesize'):
+                self.synthesize(text, lang, tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        size = os.path.getsize(path)
+        evicted = []
+        with self._lock:
+            self._size -= self._entries.pop(path, 0)
+            self._entries[path] = size
+            self._size += size
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                old_path, old_size = self._entries.popitem(last=False)
+                self._size -= old_size
+                evicted.append(old_path)
+        for old_path in evicted:
+            try:
+                os.unlink(old_path)
+            except FileNotFoundError:
+                pass
+
+
+@st.cache_resource(show_spinner=False)
+def get_tts_executor():
+    """Nhóm luồng tạo sẵn file phát âm, dùng chung cho mọi session"""
+    return ThreadPoolExecutor(max_workers=TTS_MAX_WORKERS, thread_name_prefix='thuha-tts')
+
+
+@st.cache_resource(show_spinner=False)
+def get_audio_cache():
+    """Cache phát âm dùng chung cho mọi session trong process"""
+    return AudioCache(TTS_CACHE_DIR, TTS_CACHE_MAX_BYTES, executor=get_tts_executor())
+
+
+def prefetch_audio(language, words):
+    """Bắt đầu tạo phát âm cho cả bộ từ trong nền để khi bấm nghe chỉ cần đọc file"""
+    get_audio_cache().prefetch(words, TTS_LANGUAGE_CODES[language])
 
 
 def text_to_speech(text, lang='ru'):
-    """Chuyển văn bản thành giọng nói"""
+    """Chuyển văn bản thành giọng nói, trả về đường dẫn file MP3 trong cache"""
     try:
-        tts = gTTS(text=text, lang=lang.lower(), slow=False)
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.mp3') as fp:
-            tts.save(fp.name)
-            return fp.name
+        return get_audio_cache().fetch(text, lang)
     except Exception as e:
         st.error(f"Lỗi phát âm: {str(e)}")
         return None
 
 
-def create_quiz(translations, num_questions=20):  # Đã thay đổi từ 10 lên 20
-    """Tạo câu hỏi trắc nghiệm"""
-    quiz = []
-    words = list(translations.keys())
+class DistractorIndex:
+    """Chỉ mục các nghĩa khác nhau của bộ từ để chọn đáp án nhiễu trong thời gian giới hạn
+
+    Làm việc trên mã số của nghĩa (vị trí trong answers), answers không được có phần tử trùng.
+    """
+
+    def __init__(self, answers):
+        self.answers = answers
+        self._by_length = None
+        self._by_gram = None
+        self._lock = threading.Lock()
+
+    def _build_similarity(self):
+        # Dựng một lần khi cần đáp án khó: nhóm theo độ dài và theo cặp ký tự (bigram)
+        by_length = {}
+        by_gram = {}
+        for answer_id, answer in enumerate(self.answers):
+            by_length.setdefault(len(answer), []).append(answer_id)
+            for gram in self._grams(answer):
+                by_gram.setdefault(gram, []).append(answer_id)
+        self._by_length = by_length
+        self._by_gram = by_gram
+
+    @staticmethod
+    def _grams(text):
+        text = text.lower()
+        return set(text[i:i + 2] for i in range(len(text) - 1)) or {text}
+
+    def _sample_ids(self, ids, k):
+        return ids if len(ids) <= k else random.sample(ids, k)
+
+    def random(self, correct_id, k):
+        """k mã nghĩa khác nghĩa đúng, chọn ngẫu nhiên"""
+        picked = random.sample(range(len(self.answers)), min(k + 1, len(self.answers)))
+        return [answer_id for answer_id in picked if answer_id != correct_id][:k]
+
+    def similar(self, correct_id, k):
+        """k mã nghĩa gần giống nghĩa đúng (cùng cặp ký tự, độ dài gần bằng), bù ngẫu nhiên nếu thiếu"""
+        if self._by_gram is None:
+            # Bộ từ dùng chung giữa các session: chỉ một session dựng chỉ mục
+            with self._lock:
+                if self._by_gram is None:
+                    self._build_similarity()
+        correct = self.answers[correct_id]
+        # Chỉ xét một số ứng viên giới hạn từ mỗi danh sách để chi phí không phụ thuộc kích thước bộ từ
+        scores = Counter()
+        for gram in self._grams(correct):
+            for answer_id in self._sample_ids(self._by_gram.get(gram, []), QUIZ_SIMILAR_CANDIDATES):
+                scores[answer_id] += 1
+        for length in (len(correct) - 1, len(correct), len(correct) + 1):
+            for answer_id in self._sample_ids(self._by_length.get(length, []), QUIZ_SIMILAR_CANDIDATES):
+                scores[answer_id] += 0.5
+        ranked = sorted(scores, key=lambda answer_id: (-scores[answer_id], random.random()))
+        chosen = [answer_id for answer_id in ranked if answer_id != correct_id][:k]
+        if len(chosen) < k:
+            chosen += [answer_id for answer_id in self.random(correct_id, k + len(chosen))
+                       if answer_id not in chosen][:k - len(chosen)]
+        return chosen
+
+
+class Deck:
+    """Bộ từ bất biến dùng chung giữa các session; session chỉ giữ deck_id và các mảng chỉ số vào bộ từ
+
+    Nghĩa được lưu một lần trong answers, mỗi từ chỉ giữ mã số nghĩa của nó (answer_ids).
+    """
+
+    def __init__(self, deck_id, language, translations):
+        self.deck_id = deck_id
+        self.language = language
+        self.words = tuple(translations)
+        answer_ids = {}
+        self.answer_ids = array('I', (answer_ids.setdefault(translation, len(answer_ids))
+                                      for translation in translations.values()))
+        self.answers = tuple(answer_ids)
+        self._distractor_index = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_id(language, translations):
+        """Mã bộ từ theo nội dung: cùng ngôn ngữ, cùng từ và nghĩa theo cùng thứ tự thì cùng mã"""
+        digest = hashlib.sha256(language.encode('utf-8'))
+        for word, translation in translations.items():
+            digest.update(f"\0{word}\t{translation}".encode('utf-8'))
+        return digest.hexdigest()[:32]
+
+    def __len__(self):
+        return len(self.words)
+
+    def word(self, position):
+        return self.words[position]
+
+    def translation(self, position):
+        return self.answers[self.answer_ids[position]]
+
+    def items(self):
+        """Các cặp (từ, nghĩa) theo thứ tự của bộ từ"""
+        return zip(self.words, (self.answers[answer_id] for answer_id in self.answer_ids))
+
+    @property
+    def distractor_index(self):
+        """Chỉ mục đáp án nhiễu của bộ từ, dựng một lần và dùng chung cho mọi session"""
+        if self._distractor_index is None:
+            with self._lock:
+                if self._distractor_index is None:
+                    self._distractor_index = DistractorIndex(self.answers)
+        return self._distractor_index
+
+    def estimate_size(self):
+        # Ước lượng thô như UploadCache: ~4 byte mỗi ký tự cộng chi phí đối tượng Python
+        chars = sum(map(len, self.words)) + sum(map(len, self.answers))
+        return chars * 4 + 60 * (len(self.words) + len(self.answers)) + self.answer_ids.itemsize * len(self.answer_ids)
+
+
+class DeckStore:
+    """Kho bộ từ dùng chung trong process theo deck_id, xóa bộ từ ít dùng nhất khi vượt dung lượng
+
+    save(deck) lưu nội dung bộ từ khi tạo mới, load(deck_id) trả về (ngôn ngữ, {từ: nghĩa}) hoặc None:
+    bộ từ đã bị xóa khỏi bộ nhớ được dựng lại khi session còn dùng nó.
+    """
+
+    def __init__(self, max_bytes, load=None, save=None):
+        self.max_bytes = max_bytes
+        self.load = load
+        self.save = save
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def _lookup(self, deck_id):
+        with self._lock:
+            entry = self._entries.get(deck_id)
+            if entry is None:
+                return None
+            self._entries.move_to_end(deck_id)
+        return entry[0]
+
+    def _remember(self, deck):
+        size = deck.estimate_size()
+        with self._lock:
+            if deck.deck_id in self._entries:
+                return self._entries[deck.deck_id][0]
+            self._entries[deck.deck_id] = (deck, size)
+            self._size += size
+            # Luôn giữ bộ từ vừa thêm, kể cả khi một mình nó vượt giới hạn
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+        return deck
+
+    def get(self, deck_id):
+        """Bộ từ theo deck_id, dựng lại từ nơi lưu nếu đã bị xóa khỏi bộ nhớ; None nếu không còn"""
+        deck = self._lookup(deck_id)
+        if deck is not None or self.load is None:
+            return deck
+        stored = self.load(deck_id)
+        if stored is None:
+            return None
+        get_metrics().increment('deck_store.reloads')
+        language, translations = stored
+        return self._remember(Deck(deck_id, language, translations))
+
+    def put(self, language, translations):
+        """Trả về bộ từ có cùng nội dung nếu đã có trong kho, nếu chưa thì tạo mới"""
+        deck_id = Deck.make_id(language, translations)
+        deck = self._lookup(deck_id)
+        if deck is not None:
+            get_metrics().increment('deck_store.hits')
+            return deck
+        get_metrics().increment('deck_store.misses')
+        deck = Deck(deck_id, language, translations)
+        if self.save is not None:
+            self.save(deck)
+        return self._remember(deck)
+
+
+def _write_deck(conn, deck_id, language, items, now):
+    conn.execute('''INSERT INTO decks (deck_id, language, items, last_used) VALUES (?, ?, ?, ?)
+                    ON CONFLICT (deck_id) DO UPDATE SET last_used = excluded.last_used''',
+                 (deck_id, language, items, now))
+    # Bộ từ lâu không được tạo lại thì không còn session nào dùng
+    conn.execute("DELETE FROM decks WHERE last_used < ?", (now - timedelta(days=DECK_RETENTION_DAYS),))
+
+
+def save_deck(deck):
+    """Lưu nội dung bộ từ vào database, chờ commit xong để session dùng được ngay cả khi bộ từ bị xóa khỏi bộ nhớ"""
+    items = json.dumps(list(deck.items()), ensure_ascii=False)
+    db_write(_write_deck, deck.deck_id, deck.language, items, datetime.now()).result()
+
+
+@instrumented('db.load_deck')
+def load_deck(deck_id):
+    """(ngôn ngữ, {từ: nghĩa}) của bộ từ đã lưu, None nếu không có"""
+    with db_connection() as conn:
+        row = conn.execute("SELECT language, items FROM decks WHERE deck_id = ?", (deck_id,)).fetchone()
+    if row is None:
+        return None
+    return row[0], dict(json.loads(row[1]))
+
+
+@st.cache_resource(show_spinner=False)
+def get_deck_store():
+    """Kho bộ từ dùng chung cho mọi session trong process"""
+    return DeckStore(DECK_STORE_MAX_BYTES, load=load_deck, save=save_deck)
+
+
+def set_session_deck(language, translations):
+    """Đưa bộ từ {từ: nghĩa} vào kho chung, session chỉ giữ deck_id"""
+    deck = get_deck_store().put(language, translations)
+    st.session_state[f'deck_{language}'] = deck.deck_id
+    return deck
+
+
+def get_session_deck(language):
+    """Bộ từ đang dùng của session, None nếu chưa có"""
+    deck_id = st.session_state.get(f'deck_{language}')
+    return get_deck_store().get(deck_id) if deck_id else None
+
 
-    if len(words) < 4:
-        st.warning("Cần ít nhất 4 từ để tạo quiz!")
-        return quiz
+# Bài quiz trong session: vị trí của từ được hỏi và QUIZ_OPTIONS mã nghĩa cho mỗi câu (-1 = ô trống)
+QuizPlan = namedtuple('QuizPlan', ['deck_id', 'positions', 'options'])
 
-    for _ in range(min(num_questions, len(words))):
-        correct_word = random.choice(words)
-        correct_answer = translations[correct_word]
+
+def create_quiz(deck, num_questions=20, hard=False):  # Đã thay đổi từ 10 lên 20
+    """Tạo câu hỏi trắc nghiệm; bài quiz rỗng nếu bộ từ có ít hơn 2 nghĩa khác nhau"""
+    positions = array('I')
+    options = array('i')
+    index = deck.distractor_index
+
+    if len(index.answers) < 2:
+        return QuizPlan(deck.deck_id, positions, options)
+
+    # Mỗi từ chỉ hỏi một lần; bộ từ ít nghĩa khác nhau thì mỗi câu có ít đáp án hơn
+    for position in random.sample(range(len(deck)), min(num_questions, len(deck))):
+        correct_id = deck.answer_ids[position]
 
         # Tạo các đáp án sai
-        wrong_answers = []
-        while len(wrong_answers) < 3:
-            wrong_word = random.choice(words)
-            if (wrong_word != correct_word and
-                    translations[wrong_word] not in wrong_answers and
-                    translations[wrong_word] != correct_answer):
-                wrong_answers.append(translations[wrong_word])
+        if hard:
+            wrong_ids = index.similar(correct_id, QUIZ_OPTIONS - 1)
+        else:
+            wrong_ids = index.random(correct_id, QUIZ_OPTIONS - 1)
 
         # Trộn đáp án
-        options = wrong_answers + [correct_answer]
-        random.shuffle(options)
-
-        quiz.append({
-            'question': f"Từ '{correct_word}' có nghĩa là gì?",
-            'options': options,
-            'correct_answer': correct_answer,
-            'word': correct_word  # Đổi tên từ 'russian_word' thành 'word' để chung
+        option_ids = wrong_ids + [correct_id]
+        random.shuffle(option_ids)
+
+        positions.append(position)
+        options.extend(option_ids + [-1] * (QUIZ_OPTIONS - len(option_ids)))
+
+    return QuizPlan(deck.deck_id, positions, options)
+
+
+def quiz_questions(deck, quiz):
+    """Dựng câu hỏi để hiển thị từ bài quiz dạng chỉ số (không lưu vào session)"""
+    questions = []
+    for i, position in enumerate(quiz.positions):
+        word = deck.word(position)
+        questions.append({
+            'question': f"Từ '{word}' có nghĩa là gì?",
+            'options': [deck.answers[answer_id]
+                        for answer_id in quiz.options[i * QUIZ_OPTIONS:(i + 1) * QUIZ_OPTIONS] if answer_id >= 0],
+            'correct_answer': deck.translation(position),
+            'word': word  # Đổi tên từ 'russian_word' thành 'word' để chung
         })
+    return questions
+
+
+def _flashcard_move(delta):
+    st.session_state.flashcard_index += delta
+    st.session_state.show_translation = False
 
-    return quiz
 
+def _flashcard_flip():
+    st.session_state.show_translation = not st.session_state.show_translation
 
-def flashcard_view(language, translations):
+
+def _flashcard_mark_known(deck, position):
+    known = st.session_state[f'known_{deck.language}'][1]
+    known[position >> 3] |= 1 << (position & 7)
+    save_to_history(deck.language, deck.word(position), deck.translation(position), True)
+    # Callback của fragment không được vẽ phần tử, thông báo được hiển thị trong lần chạy tiếp theo
+    st.session_state.flashcard_notice = "Đã đánh dấu là đã biết!"
+
+
+def flashcard_view(language, deck):
     """Hiển thị chế độ flashcard"""
     st.subheader("📇 Flashcards")
 
-    if not translations:
+    if not deck:
         st.warning("Chưa có từ vựng. Hãy upload file để bắt đầu!")
         return
 
@@ -301,13 +2243,27 @@ def flashcard_view(language, translations):
         st.session_state.flashcard_index = 0
     if 'show_translation' not in st.session_state:
         st.session_state.show_translation = False
-    if 'known_words' not in st.session_state:
-        st.session_state.known_words = set()
 
-    words = list(translations.keys())
+    # Từ đã biết lưu dạng bitset theo vị trí trong bộ từ, làm mới khi đổi bộ từ
+    known_key = f'known_{language}'
+    if st.session_state.get(known_key, (None,))[0] != deck.deck_id:
+        st.session_state[known_key] = (deck.deck_id, bytearray((len(deck) + 7) // 8))
+        if st.session_state.flashcard_index >= len(deck):
+            st.session_state.flashcard_index = 0
+
+    flashcard_card(language, deck)
+
+
+@st.fragment
+def flashcard_card(language, deck):
+    """Vùng thẻ: lật/đánh dấu/chuyển thẻ chỉ chạy lại phần này, không chạy lại cả ứng dụng"""
     current_index = st.session_state.flashcard_index
-    current_word = words[current_index]
-    current_translation = translations[current_word]
+    current_word = deck.word(current_index)
+    current_translation = deck.translation(current_index)
+    lang_code = TTS_LANGUAGE_CODES[language]
+
+    # Tạo sẵn phát âm cho thẻ hiện tại và vài thẻ kế tiếp để chuyển thẻ là nghe được ngay
+    prefetch_audio(language, deck.words[max(0, current_index - 1):current_index + FLASHCARD_PREFETCH_AHEAD + 1])
 
     # Hiển thị flashcard với giao diện đẹp hơn
     col1, col2, col3 = st.columns([1, 2, 1])
@@ -338,49 +2294,39 @@ def flashcard_view(language, translations):
         col_btn1, col_btn2, col_btn3 = st.columns(3)
 
         with col_btn1:
-            if st.button("🔄 Lật thẻ", use_container_width=True, type="primary"):
-                st.session_state.show_translation = not st.session_state.show_translation
-                st.rerun()
+            st.button("🔄 Lật thẻ", use_container_width=True, type="primary", on_click=_flashcard_flip)
 
         with col_btn2:
-            if st.button("✅ Đã biết", use_container_width=True, type="secondary"):
-                st.session_state.known_words.add(current_word)
-                save_to_history(language, current_word, current_translation, True)
-                st.success("Đã đánh dấu là đã biết!")
-                st.rerun()
+            st.button("✅ Đã biết", use_container_width=True, type="secondary", on_click=_flashcard_mark_known,
+                      args=(deck, current_index))
+            if st.session_state.get('flashcard_notice'):
+                st.success(st.session_state.pop('flashcard_notice'))
 
         with col_btn3:
-            lang_code = 'ru' if language == "russian" else 'zh-CN'
             if st.button("🔊 Phát âm", use_container_width=True):
                 audio_file = text_to_speech(current_word, lang_code)
                 if audio_file:
                     st.audio(audio_file, format='audio/mp3')
-                    os.unlink(audio_file)  # Xóa file tạm
 
         # Điều hướng với styling đẹp hơn
         col_nav1, col_nav2, col_nav3 = st.columns([1, 2, 1])
         with col_nav1:
-            if st.button("⏮ Trước", use_container_width=True, disabled=current_index == 0):
-                if current_index > 0:
-                    st.session_state.flashcard_index -= 1
-                    st.session_state.show_translation = False
-                    st.rerun()
+            st.button("⏮ Trước", use_container_width=True, disabled=current_index == 0,
+                      on_click=_flashcard_move, args=(-1,))
 
         with col_nav2:
             st.markdown(
-                f"<div style='text-align: center; padding: 10px;'><strong>Thẻ {current_index + 1} / {len(words)}</strong></div>",
+                f"<div style='text-align: center; padding: 10px;'><strong>Thẻ {current_index + 1} / {len(deck)}</strong></div>",
                 unsafe_allow_html=True)
-            progress = (current_index + 1) / len(words)
+            progress = (current_index + 1) / len(deck)
             st.progress(progress)
 
         with col_nav3:
-            if st.button("Tiếp ⏭", use_container_width=True, disabled=current_index == len(words) - 1):
-                if current_index < len(words) - 1:
-                    st.session_state.flashcard_index += 1
-                    st.session_state.show_translation = False
-                    st.rerun()
+            st.button("Tiếp ⏭", use_container_width=True, disabled=current_index == len(deck) - 1,
+                      on_click=_flashcard_move, args=(1,))
 
         # Thống kê với styling đẹp hơn
+        known_count = sum(bin(byte).count('1') for byte in st.session_state[f'known_{language}'][1])
         st.markdown(f"""
         <div style='
             background: #e8f5e8; 
@@ -390,14 +2336,208 @@ def flashcard_view(language, translations):
             text-align: center;
             border-left: 5px solid #4CAF50;
         '>
-            <strong>📊 Đã biết: {len(st.session_state.known_words)} / {len(words)} từ</strong>
+            <strong>📊 Đã biết: {known_count} / {len(deck)} từ</strong>
         </div>
         """, unsafe_allow_html=True)
 
 
-def main():
-    # Khởi tạo database
+@st.fragment
+def quiz_audio_panel(language, words):
+    """Phát âm các từ của bài quiz: file đã tạo sẵn thì phát ngay, chưa có thì tạo khi bấm, lỗi thì cho thử lại"""
+    lang_code = TTS_LANGUAGE_CODES[language]
+    audio_cache = get_audio_cache()
+    with st.expander("🔊 Phát âm các từ trong quiz", expanded=True):
+        for i, word in enumerate(words):
+            col_word, col_audio = st.columns([2, 3])
+            with col_word:
+                st.write(f"**Câu {i + 1}:** {word}")
+            with col_audio:
+                status, value = audio_cache.status(word, lang_code)
+                if status != 'ready':
+                    label = "🔁 Thử lại" if status == 'failed' else "🔊 Phát âm"
+                    if st.button(label, key=f"quiz_audio_{language}_{i}"):
+                        # Chờ lần tạo đang chạy trong nền hoặc tạo ngay
+                        try:
+                            status, value = 'ready', audio_cache.fetch(word, lang_code)
+                        except Exception as e:
+                            status, value = 'failed', str(e)
+                if status == 'ready':
+                    st.audio(value, format='audio/mp3')
+                elif status == 'failed':
+                    st.caption(f"⚠️ Không tạo được phát âm: {value}")
+
+
+def _start_review(language, translations, mode):
+    """Callback: chọn bộ từ ôn tập và chuyển chế độ (chạy trước khi selectbox chế độ được tạo)"""
+    set_session_deck(language, translations)
+    st.session_state.flashcard_index = 0
+    st.session_state.show_translation = False
+    st.session_state.app_mode_select = mode
+
+
+def _review_saved_words(language, empty_message, **query):
+    """Callback: lấy từ đã lưu theo query của get_review_words rồi chuyển sang Flashcards"""
+    review_translations = get_review_words(language, **query)
+    if not review_translations:
+        st.session_state.review_notice = ('info', empty_message)
+        return
+    _start_review(language, review_translations, "📇 Flashcards")
+    st.session_state.review_notice = ('success', f"✅ Đã chọn {len(review_translations)} từ để ôn tập!")
+
+
+def history_page_view(language, view, default_sort, columns):
+    """Bảng lịch sử phân trang theo khóa: chỉ đọc và hiển thị trang đang xem"""
+    col_search, col_filter, col_sort, col_size = st.columns([3, 2, 2, 1])
+    with col_search:
+        search = st.text_input("🔍 Tìm từ hoặc nghĩa:", key=f"{view}_search_{language}").strip()
+    with col_filter:
+        accuracy_filter = st.selectbox("Lọc:", list(HISTORY_FILTERS), key=f"{view}_filter_{language}")
+    with col_sort:
+        sort = st.selectbox("Sắp xếp:", list(HISTORY_SORTS), index=list(HISTORY_SORTS).index(default_sort),
+                            key=f"{view}_sort_{language}")
+    with col_size:
+        page_size = st.selectbox("Số dòng:", HISTORY_PAGE_SIZES, key=f"{view}_page_size_{language}")
+
+    # Khóa bắt đầu của từng trang đã xem; đổi bộ lọc thì quay về trang đầu
+    cursors_key = f"{view}_cursors_{language}"
+    query = (search, accuracy_filter, sort, page_size)
+    if st.session_state.get(f"{view}_query_{language}") != query:
+        st.session_state[f"{view}_query_{language}"] = query
+        st.session_state[cursors_key] = [None]
+    cursors = st.session_state[cursors_key]
+
+    rows, next_after = get_history_page(language, sort, cursors[-1], search, accuracy_filter, page_size)
+    if not rows:
+        st.info("🔍 Không có từ nào phù hợp." if search or cursors[-1] is not None or accuracy_filter != "Tất cả"
+                else "📝 Chưa có từ vựng nào được lưu.")
+        return rows
+
+    pd = lazy_import('pandas')
+    st.dataframe(pd.DataFrame(rows, columns=columns), use_container_width=True)
+
+    col_prev, col_page, col_next = st.columns([1, 2, 1])
+    with col_prev:
+        if st.button("⏮ Trang trước", key=f"{view}_prev_{language}", use_container_width=True,
+                     disabled=len(cursors) == 1):
+            cursors.pop()
+            st.rerun()
+    with col_page:
+        st.markdown(f"<div style='text-align: center; padding: 10px;'>Trang {len(cursors)}</div>",
+                    unsafe_allow_html=True)
+    with col_next:
+        if st.button("Trang sau ⏭", key=f"{view}_next_{language}", use_container_width=True,
+                     disabled=next_after is None):
+            cursors.append(next_after)
+            st.rerun()
+    return rows
+
+
+# Custom CSS để cải thiện giao diện
+APP_CSS = """
+<style>
+.main-header {
+    font-size: 3rem;
+    color: #2E7D32;
+    text-align: center;
+    margin-bottom: 2rem;
+    font-weight: bold;
+}
+.metric-card {
+    background: linear-gradient(135deg, #f8fffe 0%, #e3f2fd 100%);
+    padding: 20px;
+    border-radius: 15px;
+    border-left: 5px solid #4CAF50;
+    margin: 10px 0;
+}
+.stButton button {
+    border-radius: 10px;
+    font-weight: bold;
+    transition: all 0.3s ease;
+}
+.stButton button:hover {
+    transform: translateY(-2px);
+    box-shadow: 0 4px 8px rgba(0,0,0,0.2);
+}
+.quiz-question {
+    background: #f8f9fa;
+    padding: 20px;
+    border-radius: 10px;
+    margin: 15px 0;
+    border-left: 4px solid #2196F3;
+}
+</style>
+"""
+
+
+@st.cache_resource(show_spinner=False)
+def init_app():
+    """Khởi tạo một lần cho mỗi process (migration database), trả về báo cáo khởi động"""
+    report = get_startup_report()
+    start = time.perf_counter()
     init_database()
+    report['init']['database'] = round(time.perf_counter() - start, 4)
+    if JIEBA_WARMUP:
+        try:
+            get_chinese_tokenizer()
+        except ImportError:
+            logger.warning("Bỏ qua nạp sẵn jieba: thư viện chưa được cài đặt")
+    logger.info("Khởi động: %s", json.dumps(report, ensure_ascii=False))
+    return report
+
+
+def debug_enabled():
+    """Bảng gỡ lỗi bật bằng biến môi trường THUHA_DEBUG_PANEL=1 hoặc tham số ?debug=1 trên URL"""
+    return DEBUG_PANEL or st.query_params.get('debug') == '1'
+
+
+def debug_panel():
+    """Bảng số liệu hiệu năng trong sidebar"""
+    with st.expander("🛠 Hiệu năng", expanded=False):
+        timers, counters = get_metrics().snapshot()
+        if timers:
+            pd = lazy_import('pandas')
+            st.dataframe(pd.DataFrame(
+                [(stage, count, total / count * 1000, longest * 1000, total)
+                 for stage, (count, total, longest) in sorted(timers.items(), key=lambda item: -item[1][1])],
+                columns=['Công đoạn', 'Số lần', 'TB (ms)', 'Lâu nhất (ms)', 'Tổng (s)']
+            ).round(2), use_container_width=True, hide_index=True)
+        if counters:
+            st.json(counters, expanded=False)
+        st.download_button("📥 Số liệu (Prometheus)", get_metrics().render_prometheus(),
+                           file_name="thuha_metrics.txt", mime="text/plain", use_container_width=True)
+        # Lần chạy được đo là lần chạy do chính nút này kích hoạt
+        st.button("📸 Ghi cProfile lần chạy này", use_container_width=True,
+                  on_click=lambda: st.session_state.update(profile_next_run=True))
+
+
+def run_app():
+    """Chạy main() và đo thời gian cả lần chạy script; tùy chọn ghi cProfile cho một lần chạy"""
+    profiler = cProfile.Profile() if st.session_state.pop('profile_next_run', False) else None
+    start = time.perf_counter()
+    completed = False
+    try:
+        if profiler is not None:
+            profiler.enable()
+        main()
+        completed = True
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        get_metrics().observe('rerun', time.perf_counter() - start)
+        export_metrics()
+
+    if profiler is not None and completed:
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(PROFILE_TOP_FUNCTIONS)
+        with st.sidebar.expander("📸 cProfile lần chạy vừa rồi", expanded=True):
+            st.code(output.getvalue(), language=None)
+            st.download_button("📥 Tải kết quả cProfile", output.getvalue(), file_name="thuha_profile.txt",
+                               mime="text/plain", use_container_width=True)
+
+
+def main():
+    # Khởi tạo database (một lần cho mỗi process)
+    init_app()
 
     st.set_page_config(
         page_title="Thu Hà sai đẹp giếu",
@@ -406,41 +2546,8 @@ def main():
         initial_sidebar_state="expanded"
     )
 
-    # Custom CSS để cải thiện giao diện
-    st.markdown("""
-    <style>
-    .main-header {
-        font-size: 3rem;
-        color: #2E7D32;
-        text-align: center;
-        margin-bottom: 2rem;
-        font-weight: bold;
-    }
-    .metric-card {
-        background: linear-gradient(135deg, #f8fffe 0%, #e3f2fd 100%);
-        padding: 20px;
-        border-radius: 15px;
-        border-left: 5px solid #4CAF50;
-        margin: 10px 0;
-    }
-    .stButton button {
-        border-radius: 10px;
-        font-weight: bold;
-        transition: all 0.3s ease;
-    }
-    .stButton button:hover {
-        transform: translateY(-2px);
-        box-shadow: 0 4px 8px rgba(0,0,0,0.2);
-    }
-    .quiz-question {
-        background: #f8f9fa;
-        padding: 20px;
-        border-radius: 10px;
-        margin: 15px 0;
-        border-left: 4px solid #2196F3;
-    }
-    </style>
-    """, unsafe_allow_html=True)
+    # Custom CSS để cải thiện giao diện (Streamlit cần vẽ lại ở mỗi lần chạy script)
+    st.markdown(APP_CSS, unsafe_allow_html=True)
 
     st.markdown('<div class="main-header">🌍 HỌC NGOẠI NGỮ VỚI HÀ NHÉEE!!!</div>', unsafe_allow_html=True)
     st.markdown("### Upload tài liệu PDF/DOCX/TXT để tạo quiz và flashcards học từ vựng!")
@@ -459,7 +2566,8 @@ def main():
 
         app_mode = st.selectbox(
             "**Chọn chế độ**",
-            ["📤 Upload Tài liệu", "🎯 Làm Quiz", "📇 Flashcards", "📊 Lịch sử Học tập", "📚 Từ vựng Đã lưu"],
+            ["📤 Upload Tài liệu", "🎯 Làm Quiz", "📇 Flashcards", "⏰ Ôn tập đến hạn", "📊 Lịch sử Học tập",
+             "📚 Từ vựng Đã lưu"],
             key="app_mode_select"
         )
 
@@ -496,12 +2604,15 @@ def main():
         </div>
         """, unsafe_allow_html=True)
 
-    # Khởi tạo session state cho translations dựa trên ngôn ngữ
-    session_key = f'translations_{language}'
-    if session_key not in st.session_state:
-        st.session_state[session_key] = {}
+        if debug_enabled():
+            debug_panel()
 
-    translations = st.session_state[session_key]
+    # Bộ từ đang học nằm trong kho chung, session chỉ giữ deck_id theo ngôn ngữ
+    deck = get_session_deck(language)
+    # Thông báo do callback của các nút ôn tập để lại (callback không được vẽ phần tử)
+    if st.session_state.get('review_notice'):
+        kind, message = st.session_state.pop('review_notice')
+        getattr(st, kind)(message)
 
     # Chế độ Upload Tài liệu
     if app_mode == "📤 Upload Tài liệu":
@@ -543,43 +2654,98 @@ def main():
                 </div>
                 """, unsafe_allow_html=True)
 
-            # Đọc file dựa trên loại
-            with st.spinner("🔄 Đang đọc và xử lý file..."):
-                if uploaded_file.type == "application/pdf":
-                    text = extract_text_from_pdf(uploaded_file)
-                elif uploaded_file.type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-                    text = extract_text_from_docx(uploaded_file)
-                else:
-                    text = extract_text_from_txt(uploaded_file)
+            # Kết quả xử lý được lưu theo nội dung file: rerun hoặc upload lại cùng file
+            # không phải đọc và dịch lại
+            upload_cache = get_upload_cache()
+            cache_key = upload_cache_key(uploaded_file, language)
+            cached = upload_cache.get(cache_key)
+
+            if cached is not None:
+                text, stats = cached['preview'], cached['stats']
+            else:
+                # Đọc file dựa trên loại và lập chỉ mục tần suất theo từng trang/đoạn,
+                # không giữ toàn bộ văn bản trong bộ nhớ
+                preview = []
+                with st.spinner("🔄 Đang đọc và trích xuất từ vựng..."):
+                    # Đọc file và tách từ chạy xen kẽ: đo riêng thời gian chờ đọc file để tách hai công đoạn
+                    start = time.perf_counter()
+                    chunks = TimedIterator(iter_document_text(uploaded_file, uploaded_file.type))
+                    try:
+                        stats = extract_word_frequencies(language, tap_preview(chunks, preview))
+                    except Exception as e:
+                        # Không lưu kết quả đọc dở vào cache: lần upload sau đọc lại cả file
+                        st.error(f"Lỗi khi đọc file {uploaded_file.name}: {str(e)}")
+                        return
+                    get_metrics().observe('extract', chunks.elapsed)
+                    get_metrics().observe('tokenize', time.perf_counter() - start - chunks.elapsed)
+                text = "".join(preview)
 
             if text:
                 st.success("✅ Đã đọc file thành công!")
 
                 # Hiển thị preview văn bản
                 with st.expander("👀 Xem trước văn bản", expanded=False):
-                    preview_text = text[:1000] + "..." if len(text) > 1000 else text
+                    preview_text = text[:PREVIEW_CHARS] + "..." if len(text) > PREVIEW_CHARS else text
                     st.text_area("Nội dung văn bản", preview_text, height=200, key="preview",
                                  label_visibility="collapsed")
 
-                # Trích xuất và dịch từ vựng
-                with st.spinner("🔍 Đang trích xuất và dịch từ vựng..."):
-                    words = extract_words(language, text)
+                if not stats:
+                    upload_cache.put(cache_key, {'preview': text, 'stats': [], 'translations': {}})
+                    st.error(f"❌ Không tìm thấy từ {lang_display} trong văn bản!")
+                    return
+
+                st.info(f"📖 Tìm thấy {len(stats)} từ {lang_display}")
+
+                # Chỉ dịch các từ xuất hiện nhiều nhất, từ hiếm (lỗi chính tả, tên riêng) có thể bỏ qua
+                col_budget1, col_budget2 = st.columns(2)
+                with col_budget1:
+                    max_words = st.number_input(
+                        "Số từ tối đa cần dịch (theo tần suất):",
+                        min_value=1,
+                        max_value=len(stats),
+                        value=min(DEFAULT_TRANSLATE_BUDGET, len(stats)),
+                        key=f"translate_budget_{language}"
+                    )
+                with col_budget2:
+                    min_count = st.number_input(
+                        "Số lần xuất hiện tối thiểu:",
+                        min_value=1,
+                        value=1,
+                        key=f"translate_min_count_{language}"
+                    )
+                words = select_words(stats, int(max_words), int(min_count))
+                if not words:
+                    st.warning("⚠️ Không có từ nào đạt số lần xuất hiện tối thiểu!")
+                    return
 
-                    if not words:
-                        st.error(f"❌ Không tìm thấy từ {lang_display} trong văn bản!")
-                        return
+                if cached is None:
+                    cached = {'preview': text, 'stats': stats, 'translations': {}}
+                else:
+                    st.caption("⚡ Dùng lại kết quả đã xử lý của file này")
 
-                    st.info(f"📖 Tìm thấy {len(words)} từ {lang_display}")
+                # Dịch các từ chưa dịch cho file này
+                missing_words = [word for word in words if word not in cached['translations']]
+                if missing_words:
+                    with st.spinner("🔍 Đang dịch từ vựng..."):
+                        new_translations = translate_words(language, missing_words)
+                    # Mục trong cache dùng chung giữa các session: tạo mục mới thay vì sửa dict đang được chia sẻ
+                    cached = {**cached, 'translations': {**cached['translations'], **new_translations}}
+                    upload_cache.put(cache_key, cached)
 
-                    # Dịch từ
-                    st.session_state[session_key] = translate_words(language, words)
+                deck = set_session_deck(language, {word: cached['translations'][word] for word in words})
 
                 # Hiển thị kết quả
                 st.subheader("📚 Từ vựng đã trích xuất")
+                pd = lazy_import('pandas')
+                stats_by_word = {stat.word: stat for stat in stats}
                 vocab_df = pd.DataFrame(
-                    list(st.session_state[session_key].items()),
-                    columns=[lang_display, 'Tiếng Việt']
+                    [(word, translation, stats_by_word[word].count, ", ".join(stats_by_word[word].forms),
+                      stats_by_word[word].context)
+                     for word, translation in deck.items()],
+                    columns=[lang_display, 'Tiếng Việt', 'Số lần', 'Các dạng đã gặp', 'Ngữ cảnh']
                 )
+                if language != "russian":
+                    vocab_df = vocab_df.drop(columns=['Các dạng đã gặp'])
                 st.dataframe(vocab_df, use_container_width=True)
 
                 # Tùy chọn tải xuống từ vựng
@@ -594,15 +2760,14 @@ def main():
                         use_container_width=True
                     )
                 with col_dl2:
-                    if st.button("🎯 Chuyển sang làm Quiz ngay", use_container_width=True):
-                        st.session_state.app_mode_select = "🎯 Làm Quiz"
-                        st.rerun()
+                    st.button("🎯 Chuyển sang làm Quiz ngay", use_container_width=True,
+                              on_click=st.session_state.update, kwargs={'app_mode_select': "🎯 Làm Quiz"})
 
     # Chế độ Làm Quiz
     elif app_mode == "🎯 Làm Quiz":
         st.header("🎯 Làm Quiz Kiểm tra Từ vựng")
 
-        if not translations:
+        if not deck:
             st.warning("⚠️ Vui lòng upload tài liệu trước!")
             st.info("💡 Hãy chuyển sang tab '📤 Upload Tài liệu' để upload file và trích xuất từ vựng.")
             return
@@ -615,16 +2780,20 @@ def main():
                 num_questions = st.slider(
                     "Số câu hỏi:",
                     min_value=5,
-                    max_value=min(30, len(translations)),
+                    max_value=min(30, len(deck)),
                     value=20,  # Mặc định 20 câu
-                    help=f"Tối đa {min(30, len(translations))} câu từ {len(translations)} từ có sẵn"
+                    help=f"Tối đa {min(30, len(deck))} câu từ {len(deck)} từ có sẵn"
+                )
+                hard_distractors = st.checkbox(
+                    "Đáp án nhiễu khó (nghĩa gần giống)",
+                    key=f"quiz_hard_{language}"
                 )
             with col_set2:
                 st.markdown(f"""
                 <div style='background: #e3f2fd; padding: 15px; border-radius: 10px; margin-top: 10px;'>
                     <strong>📊 Thông tin:</strong><br>
-                    • Từ có sẵn: {len(translations)}<br>
-                    • Số câu tối đa: {min(30, len(translations))}
+                    • Từ có sẵn: {len(deck)}<br>
+                    • Số câu tối đa: {min(30, len(deck))}
                 </div>
                 """, unsafe_allow_html=True)
 
@@ -632,95 +2801,125 @@ def main():
 
         # Nút tạo quiz mới
         if st.button("🎲 Tạo Quiz Mới", type="primary", use_container_width=True):
-            st.session_state[quiz_key] = create_quiz(translations, num_questions)
-            st.session_state[f'quiz_answers_{language}'] = [None] * len(st.session_state[quiz_key])
+            # Chỉ mục đáp án nhiễu nằm trong bộ từ dùng chung, dựng một lần cho mọi session
+            st.session_state[quiz_key] = create_quiz(deck, num_questions, hard=hard_distractors)
+            num_created = len(st.session_state[quiz_key].positions)
+            prefetch_audio(language, [deck.word(position) for position in st.session_state[quiz_key].positions])
+            st.session_state[f'quiz_answers_{language}'] = array('b', [-1] * num_created)
             st.session_state[f'quiz_submitted_{language}'] = False
-            st.success(f"✅ Đã tạo quiz {len(st.session_state[quiz_key])} câu!")
+            # Bài quiz rỗng: chạy lại để hiện cảnh báo không đủ từ bên dưới
+            if num_created:
+                st.success(f"✅ Đã tạo quiz {num_created} câu!")
             st.rerun()
 
-        if quiz_key in st.session_state and st.session_state[quiz_key]:
+        # Quiz của bộ từ trước đó không còn dùng được khi đã đổi bộ từ
+        if quiz_key in st.session_state and st.session_state[quiz_key].deck_id != deck.deck_id:
+            del st.session_state[quiz_key]
+
+        questions = quiz_questions(deck, st.session_state[quiz_key]) if quiz_key in st.session_state else []
+        if questions:
             st.markdown("---")
-            st.subheader(f"📝 Bài Quiz ({len(st.session_state[quiz_key])} câu)")
+            st.subheader(f"📝 Bài Quiz ({len(questions)} câu)")
+
+            # Phát âm nằm ngoài form, trong fragment riêng: nghe/tạo lại không chạy lại cả bài
+            quiz_audio_panel(language, [q['word'] for q in questions])
 
-            # Hiển thị từng câu hỏi
-            for i, q in enumerate(st.session_state[quiz_key]):
-                st.markdown(f'<div class="quiz-question">', unsafe_allow_html=True)
+            # Cả bài nằm trong một form: chọn đáp án không chạy lại script, chỉ gửi về server khi nộp bài
+            with st.form(key=f"quiz_form_{language}"):
+                user_answers = []
+                for i, q in enumerate(questions):
+                    st.markdown(f'<div class="quiz-question">', unsafe_allow_html=True)
 
-                # Câu hỏi và nút phát âm
-                col_q, col_audio = st.columns([4, 1])
-                with col_q:
+                    # Câu hỏi
                     st.write(f"**Câu {i + 1}: {q['question']}**")
-                with col_audio:
-                    lang_code = 'ru' if language == "russian" else 'zh-CN'
-                    if st.button(f"🔊", key=f"audio_{language}_{i}", use_container_width=True):
-                        audio_file = text_to_speech(q['word'], lang_code)
-                        if audio_file:
-                            st.audio(audio_file, format='audio/mp3')
-                            os.unlink(audio_file)
-
-                # Đáp án
-                user_answer = st.radio(
-                    f"Chọn đáp án cho câu {i + 1}:",
-                    q['options'],
-                    key=f"quiz_{language}_{i}",
-                    index=st.session_state[f'quiz_answers_{language}'][i] if
-                    st.session_state[f'quiz_answers_{language}'][i] is not None else 0
-                )
-                st.session_state[f'quiz_answers_{language}'][i] = q['options'].index(user_answer)
-
-                st.markdown('</div>', unsafe_allow_html=True)
-
-            # Nút nộp bài
-            col_submit1, col_submit2 = st.columns([1, 1])
-            with col_submit1:
-                if st.button("📤 Nộp Bài", type="primary", use_container_width=True):
-                    score = 0
-                    for i, q in enumerate(st.session_state[quiz_key]):
-                        user_answer = q['options'][st.session_state[f'quiz_answers_{language}'][i]]
-                        if user_answer == q['correct_answer']:
-                            score += 1
-                            save_to_history(language, q['word'], q['correct_answer'], True)
-                        else:
-                            save_to_history(language, q['word'], q['correct_answer'], False)
 
-                    st.session_state[f'quiz_submitted_{language}'] = True
-                    save_study_session(language, "quiz", score, len(st.session_state[quiz_key]))
+                    # Đáp án
+                    user_answers.append(st.radio(
+                        f"Chọn đáp án cho câu {i + 1}:",
+                        q['options'],
+                        key=f"quiz_{language}_{i}",
+                        index=max(0, st.session_state[f'quiz_answers_{language}'][i])
+                    ))
+
+                    st.markdown('</div>', unsafe_allow_html=True)
 
-                    # Hiển thị kết quả
-                    st.success(f"🎉 Điểm của bạn: **{score}/{len(st.session_state[quiz_key])}**")
+                # Nút nộp bài
+                submitted = st.form_submit_button("📤 Nộp Bài", type="primary", use_container_width=True)
 
-                    # Hiển thị kết quả chi tiết
-                    with st.expander("📋 Xem chi tiết đáp án", expanded=True):
-                        for i, q in enumerate(st.session_state[quiz_key]):
-                            user_answer = q['options'][st.session_state[f'quiz_answers_{language}'][i]]
-                            is_correct = user_answer == q['correct_answer']
+            if submitted:
+                st.session_state[f'quiz_answers_{language}'] = array('b', [
+                    q['options'].index(user_answer) for q, user_answer in zip(questions, user_answers)])
+                results = []
+                for q, user_answer in zip(questions, user_answers):
+                    results.append((q['word'], q['correct_answer'], user_answer == q['correct_answer']))
+                score = sum(1 for _, _, is_correct in results if is_correct)
 
-                            if is_correct:
-                                st.write(f"✅ **Câu {i + 1}:** {q['correct_answer']}")
-                            else:
-                                st.write(
-                                    f"❌ **Câu {i + 1}:** Đáp án của bạn: `{user_answer}` | Đáp án đúng: `{q['correct_answer']}`")
+                # Ghi toàn bộ kết quả trong một giao dịch, chờ commit xong rồi mới báo điểm
+                save_quiz_results(language, results, score, len(questions)).result()
+
+                st.session_state[f'quiz_submitted_{language}'] = True
+
+                # Hiển thị kết quả
+                st.success(f"🎉 Điểm của bạn: **{score}/{len(questions)}**")
 
-            with col_submit2:
-                if st.button("🔄 Làm Lại Quiz", use_container_width=True):
-                    st.session_state[quiz_key] = create_quiz(translations, num_questions)
-                    st.session_state[f'quiz_answers_{language}'] = [None] * len(st.session_state[quiz_key])
-                    st.session_state[f'quiz_submitted_{language}'] = False
-                    st.rerun()
+                # Hiển thị kết quả chi tiết
+                with st.expander("📋 Xem chi tiết đáp án", expanded=True):
+                    for i, (q, user_answer) in enumerate(zip(questions, user_answers)):
+                        is_correct = user_answer == q['correct_answer']
+
+                        if is_correct:
+                            st.write(f"✅ **Câu {i + 1}:** {q['correct_answer']}")
+                        else:
+                            st.write(
+                                f"❌ **Câu {i + 1}:** Đáp án của bạn: `{user_answer}` | Đáp án đúng: `{q['correct_answer']}`")
+
+            if st.button("🔄 Làm Lại Quiz", use_container_width=True):
+                st.session_state[quiz_key] = create_quiz(deck, num_questions, hard=hard_distractors)
+                prefetch_audio(language, [deck.word(position) for position in st.session_state[quiz_key].positions])
+                st.session_state[f'quiz_answers_{language}'] = array('b', [-1] * len(st.session_state[quiz_key].positions))
+                st.session_state[f'quiz_submitted_{language}'] = False
+                st.rerun()
 
         elif quiz_key in st.session_state:
-            st.warning("❌ Không đủ từ để tạo quiz! Cần ít nhất 4 từ.")
+            st.warning("❌ Không đủ từ để tạo quiz! Cần ít nhất 2 từ có nghĩa khác nhau.")
 
     # Chế độ Flashcards
     elif app_mode == "📇 Flashcards":
-        flashcard_view(language, translations)
+        flashcard_view(language, deck)
+
+    # Chế độ Ôn tập đến hạn
+    elif app_mode == "⏰ Ôn tập đến hạn":
+        st.header("⏰ Ôn tập đến hạn")
+
+        num_due = st.slider("Số từ mỗi lượt ôn:", min_value=5, max_value=100, value=DUE_REVIEW_DEFAULT,
+                            key=f"due_limit_{language}")
+        due_words = get_due_words(language, num_due)
+
+        if due_words:
+            st.info(f"📅 {len(due_words)}{'+' if len(due_words) == num_due else ''} từ đã đến hạn ôn tập")
+            pd = lazy_import('pandas')
+            st.dataframe(pd.DataFrame(due_words, columns=['word', 'translation', 'due_at']),
+                         use_container_width=True)
+
+            review_translations = {word: translation for word, translation, _ in due_words}
+            col_due1, col_due2 = st.columns(2)
+            with col_due1:
+                st.button("📇 Ôn bằng Flashcards", use_container_width=True, type="primary",
+                          on_click=_start_review, args=(language, review_translations, "📇 Flashcards"))
+            with col_due2:
+                st.button("🎯 Ôn bằng Quiz", use_container_width=True,
+                          on_click=_start_review, args=(language, review_translations, "🎯 Làm Quiz"))
+        else:
+            next_due_at = get_next_due_at(language)
+            if next_due_at is None:
+                st.info("📝 Chưa có từ nào trong lịch ôn tập. Hãy làm quiz hoặc flashcards trước!")
+            else:
+                st.success(f"🎉 Không còn từ nào đến hạn. Lượt ôn tiếp theo: {str(next_due_at)[:16]}")
 
     # Chế độ Lịch sử Học tập
     elif app_mode == "📊 Lịch sử Học tập":
         st.header("📊 Lịch sử Học tập")
 
-        conn = sqlite3.connect('learning_history.db', check_same_thread=False)
-
         # Thống kê tổng quan với card đẹp
         stats = get_learning_stats(language)
         col1, col2, col3, col4 = st.columns(4)
@@ -761,78 +2960,282 @@ def main():
 
         # Lịch sử học tập chi tiết
         st.subheader("📋 Chi tiết học tập")
-        history_df = pd.read_sql_query('''
-            SELECT word, translation, correct_count, wrong_count, 
-                   last_reviewed, 
-                   CASE WHEN (correct_count + wrong_count) > 0 
-                        THEN ROUND(correct_count * 100.0 / (correct_count + wrong_count), 1) 
-                        ELSE 0 END as accuracy
-            FROM learning_history 
-            WHERE language = ?
-            ORDER BY last_reviewed DESC
-        ''', conn, params=(language,))
-
-        if not history_df.empty:
-            st.dataframe(history_df, use_container_width=True)
-
-            # Từ cần ôn tập (tỷ lệ đúng < 50%)
-            weak_words = history_df[history_df['accuracy'] < 50]
-            if not weak_words.empty:
-                st.subheader("📝 Từ cần ôn tập")
-                st.dataframe(weak_words[['word', 'translation', 'accuracy']], use_container_width=True)
-
-                # Nút ôn tập từ yếu
-                if st.button("🔄 Ôn Tập Từ Cần Cải Thiện", use_container_width=True):
-                    review_translations = dict(zip(weak_words['word'], weak_words['translation']))
-                    st.session_state[f'translations_{language}'] = review_translations
-                    st.session_state.app_mode_select = "📇 Flashcards"
-                    st.success(f"Đã chọn {len(weak_words)} từ cần ôn tập!")
-                    st.rerun()
-        else:
-            st.info("📝 Chưa có lịch sử học tập.")
+        history_page_view(language, "history", "🕒 Ôn gần nhất",
+                          ['word', 'translation', 'correct_count', 'wrong_count', 'last_reviewed', 'accuracy'])
 
-        conn.close()
+        # Nút ôn tập từ yếu (tỷ lệ đúng < 50%), ôn gần nhất trước
+        st.button("🔄 Ôn Tập Từ Cần Cải Thiện", use_container_width=True, on_click=_review_saved_words,
+                  args=(language, "🎉 Không có từ nào cần cải thiện."),
+                  kwargs={'order': "recent", 'accuracy_filter': "Cần ôn (đúng < 50%)"})
 
     # Chế độ Từ vựng Đã lưu
     elif app_mode == "📚 Từ vựng Đã lưu":
         st.header("📚 Từ vựng Đã lưu")
 
-        conn = sqlite3.connect('learning_history.db', check_same_thread=False)
-        saved_words_df = pd.read_sql_query('''
-            SELECT word, translation, correct_count, wrong_count, last_reviewed
-            FROM learning_history 
-            WHERE language = ?
-            ORDER BY correct_count DESC, last_reviewed DESC
-        ''', conn, params=(language,))
-
-        if not saved_words_df.empty:
-            st.dataframe(saved_words_df, use_container_width=True)
+        rows = history_page_view(language, "saved", "🏆 Đúng nhiều nhất",
+                                 ['word', 'translation', 'correct_count', 'wrong_count', 'last_reviewed'])
 
+        if rows:
             # Ôn tập nhanh
             st.subheader("🔄 Ôn tập nhanh")
             col_rev1, col_rev2 = st.columns(2)
 
             with col_rev1:
-                if st.button("🎯 Ôn tập ngẫu nhiên 10 từ", use_container_width=True):
-                    review_words = saved_words_df.sample(min(10, len(saved_words_df)))
-                    st.session_state[f'translations_{language}'] = dict(
-                        zip(review_words['word'], review_words['translation']))
-                    st.session_state.app_mode_select = "📇 Flashcards"
-                    st.success(f"✅ Đã chọn {len(review_words)} từ để ôn tập!")
-                    st.rerun()
+                st.button("🎯 Ôn tập ngẫu nhiên 10 từ", use_container_width=True, on_click=_review_saved_words,
+                          args=(language, "📝 Chưa có từ nào để ôn tập."), kwargs={'limit': 10})
 
             with col_rev2:
-                if st.button("📖 Ôn tập tất cả từ", use_container_width=True):
-                    st.session_state[f'translations_{language}'] = dict(
-                        zip(saved_words_df['word'], saved_words_df['translation']))
-                    st.session_state.app_mode_select = "📇 Flashcards"
-                    st.success(f"✅ Đã chọn {len(saved_words_df)} từ để ôn tập!")
-                    st.rerun()
+                st.button("📖 Ôn tập tất cả từ", use_container_width=True, on_click=_review_saved_words,
+                          args=(language, "📝 Chưa có từ nào để ôn tập."), kwargs={'order': "recent"})
+
+
+def cmd_startup_report(args):
+    """In thời gian khởi tạo và import từng thư viện nặng để theo dõi cold start"""
+    start = time.perf_counter()
+    report = init_app()
+    for name in ('pandas', 'gtts', 'deep_translator', 'PyPDF2', 'docx', 'jieba'):
+        try:
+            lazy_import(name)
+        except ImportError:
+            report['imports'][name] = None
+    if args.jieba and report['imports'].get('jieba') is not None:
+        get_chinese_tokenizer()
+    report['total_seconds'] = round(time.perf_counter() - start, 4)
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        for name, seconds in report['init'].items():
+            print(f"Khởi tạo {name}: {seconds:.3f}s")
+        if 'jieba' in report:
+            print(f"  jieba nạp lúc {report['jieba']['loaded_at']}, cache: {report['jieba']['cache_file']} "
+                  f"({'có sẵn' if report['jieba']['cache_hit'] else 'dựng mới'})")
+        for name, seconds in report['imports'].items():
+            print(f"import {name}: " + (f"{seconds:.3f}s" if seconds is not None else "chưa cài đặt"))
+        print(f"Tổng: {report['total_seconds']:.3f}s")
+    return 0
+
+
+def cmd_stats(args):
+    """Kiểm tra (hoặc dựng lại) bảng thống kê language_stats so với learning_history"""
+    init_database()
+    with db_connection() as conn:
+        c = conn.cursor()
+        if args.rebuild:
+            c.execute("BEGIN IMMEDIATE")
+            rebuild_language_stats(c)
+            print("Đã dựng lại bảng thống kê.")
+        mismatches = check_language_stats(c)
+
+    if not mismatches:
+        print("Bảng thống kê khớp với learning_history.")
+        return 0
+    for language, stored, expected in mismatches:
+        print(f"{language}: đang lưu {dict(zip(LANGUAGE_STATS_COLUMNS, stored))}, "
+              f"tính lại {dict(zip(LANGUAGE_STATS_COLUMNS, expected))}")
+    print("Chạy lại với --rebuild để sửa.")
+    return 1
+
+
+def collect_ingest_paths(patterns):
+    """Mở rộng thư mục (đệ quy) và mẫu glob thành danh sách file PDF/DOCX/TXT, bỏ trùng"""
+    paths = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            candidates = (os.path.join(root, name) for root, _, names in os.walk(pattern) for name in names)
+        else:
+            candidates = glob.glob(pattern, recursive=True)
+        for path in candidates:
+            if os.path.isfile(path) and os.path.splitext(path)[1].lower() in INGEST_FILE_TYPES:
+                paths.add(os.path.abspath(path))
+    return sorted(paths)
+
+
+def _ingest_file(path, language, max_words, min_count):
+    """Chạy trong process con: đọc một file, trả về thông tin file và WordStat của các từ được chọn"""
+    file_stat = os.stat(path)
+    file_type = INGEST_FILE_TYPES[os.path.splitext(path)[1].lower()]
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fp:
+        for block in iter(lambda: fp.read(1 << 20), b''):
+            digest.update(block)
+        fp.seek(0)
+        # Gọi thẳng các hàm đọc (không qua iter_document_text) để lỗi đọc file được báo về lệnh ingest.
+        # Đã chạy song song theo file, trong mỗi file xử lý tuần tự để không tạo nhóm process lồng nhau
+        if file_type == "application/pdf":
+            chunks = iter_pdf_pages(fp, parallel=False)
+        elif file_type == DOCX_MIME:
+            chunks = iter_docx_paragraphs(fp)
         else:
-            st.info("📝 Chưa có từ vựng nào được lưu.")
+            chunks = [extract_text_from_txt(fp)]
+        stats = extract_word_frequencies(language, chunks, parallel=False)
 
-        conn.close()
+    selected = set(select_words(stats, max_words, min_count))
+    return {
+        'path': path,
+        'sha256': digest.hexdigest(),
+        'size': file_stat.st_size,
+        'mtime': file_stat.st_mtime,
+        'words': [stat for stat in stats if stat.word in selected],
+    }
+
+
+def get_ingested_files(language):
+    """{đường dẫn: (kích thước, thời gian sửa)} của các file đã nạp cho ngôn ngữ"""
+    with db_connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT path, size, mtime FROM ingested_files WHERE language = ?", (language,))
+        return {path: (size, mtime) for path, size, mtime in c.fetchall()}
+
+
+@instrumented('db.get_history_stems')
+def get_history_stems(language):
+    """{gốc từ: từ chính} của các từ tiếng Nga đã có trong learning_history"""
+    with db_connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT word FROM learning_history WHERE language = ?", (language,))
+        return {russian_stem(row[0]): row[0] for row in c.fetchall()}
+
+
+@instrumented('db.save_ingested_batch')
+def _write_ingested_batch(conn, language, translations, files, now):
+    c = conn.cursor()
+    # Từ đã có trong lịch sử giữ nguyên kết quả học và lịch ôn; từ mới đến hạn ôn ngay
+    c.executemany('''INSERT INTO learning_history (language, word, translation, last_reviewed, due_at, created_at)
+                     VALUES (?, ?, ?, ?, ?, ?)
+                     ON CONFLICT (language, word) DO NOTHING''',
+                  [(language, word, translation, now, now, now) for word, translation in translations.items()])
+    inserted = c.rowcount  # executemany: tổng số dòng thực sự được thêm
+    c.executemany('''INSERT INTO ingested_files (path, language, sha256, size, mtime, word_count, ingested_at)
+                     VALUES (?, ?, ?, ?, ?, ?, ?)
+                     ON CONFLICT (path, language) DO UPDATE SET
+                         sha256 = excluded.sha256,
+                         size = excluded.size,
+                         mtime = excluded.mtime,
+                         word_count = excluded.word_count,
+                         ingested_at = excluded.ingested_at''',
+                  [(result['path'], language, result['sha256'], result['size'], result['mtime'],
+                    len(result['words']), now) for result in files])
+    return inserted
+
+
+def save_ingested_batch(language, translations, files):
+    """Ghi từ mới vào learning_history và đánh dấu các file đã nạp, trong cùng một giao dịch"""
+    return db_write(_write_ingested_batch, language, translations, files, datetime.now()).result()
+
+
+def cmd_ingest(args):
+    """Nạp từ vựng từ nhiều file (thư mục hoặc glob) vào learning_history, chạy tiếp được khi bị ngắt"""
+    init_database()
+    paths = collect_ingest_paths(args.paths)
+    if not args.force:
+        done = get_ingested_files(args.language)
+        pending = []
+        for path in paths:
+            file_stat = os.stat(path)
+            if done.get(path) != (file_stat.st_size, file_stat.st_mtime):
+                pending.append(path)
+        print(f"Tìm thấy {len(paths)} file, {len(paths) - len(pending)} file đã nạp trước đó được bỏ qua.")
+        paths = pending
+    else:
+        print(f"Tìm thấy {len(paths)} file.")
+    if not paths:
+        return 0
+
+    def show_progress(done, total):
+        if done == total or done % 500 < TRANSLATE_BATCH_MAX_WORDS:
+            print(f"  Đang dịch... {done}/{total} từ")
+
+    # Gốc từ của các từ đã có trong lịch sử (kể cả từ vừa ghi ở lô trước): книгу ở lô này
+    # được gộp vào книга đã ghi thay vì thành một dòng mới
+    known_stems = get_history_stems(args.language) if args.language == "russian" else {}
+
+    processed = failed = inserted = 0
+    pool = ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context('spawn'))
+    with pool:
+        for start in range(0, len(paths), args.batch_files):
+            batch = paths[start:start + args.batch_files]
+            futures = {pool.submit(_ingest_file, path, args.language, args.max_words, args.min_count): path
+                       for path in batch}
+            # Gộp từ của các file trong lô: mỗi từ chỉ dịch và ghi một lần
+            batch_stats = []
+            files = []
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    failed += 1
+                    print(f"Lỗi khi đọc {path}: {e}", file=sys.stderr)
+                    continue
+                processed += 1
+                files.append(result)
+                batch_stats += result['words']
+                print(f"[{processed + failed}/{len(paths)}] {path}: {len(result['words'])} từ")
+
+            if not files:
+                continue
+            if args.language == "russian":
+                # Mỗi file chọn từ chính riêng (книга ở file này, книгу ở file khác): gộp lại theo gốc từ,
+                # bỏ các từ mà một dạng khác đã có trong lịch sử
+                words = [stat.word for stat in merge_word_forms(batch_stats)
+                         if russian_stem(stat.word) not in known_stems]
+            else:
+                vocabulary = Counter()
+                for stat in batch_stats:
+                    vocabulary[stat.word] += stat.count
+                words = [word for word, _ in vocabulary.most_common()]
+            translations = translate_words(args.language, words, on_progress=show_progress) if words else {}
+            # Từ chưa dịch được không ghi vào lịch sử; chạy lại với --force để thử lại
+            untranslated = [word for word, translation in translations.items()
+                            if translation.startswith(UNTRANSLATED_PREFIX)]
+            for word in untranslated:
+                del translations[word]
+            inserted += save_ingested_batch(args.language, translations, files)
+            if args.language == "russian":
+                known_stems.update((russian_stem(word), word) for word in translations)
+            print(f"Đã ghi lô {start // args.batch_files + 1}: {len(files)} file, {len(words)} từ khác nhau"
+                  + (f", {len(untranslated)} từ chưa dịch được" if untranslated else ""))
+
+    print(f"Xong: {processed} file đã nạp, {failed} file lỗi, {inserted} dòng mới trong learning_history.")
+    return 1 if failed else 0
+
+
+def run_cli(argv=None):
+    """Các lệnh chạy ngoài Streamlit: python thuha.py <lệnh>"""
+    parser = argparse.ArgumentParser(prog="thuha.py", description="Công cụ dòng lệnh của ứng dụng học ngoại ngữ")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    startup_parser = subparsers.add_parser('startup-report', help="Đo thời gian khởi động và import thư viện")
+    startup_parser.add_argument('--json', action='store_true', help="In kết quả dạng JSON")
+    startup_parser.add_argument('--jieba', action='store_true',
+                                help="Nạp cả từ điển jieba (dựng file cache nếu chưa có)")
+    startup_parser.set_defaults(handler=cmd_startup_report)
+
+    stats_parser = subparsers.add_parser('stats', help="Kiểm tra bảng thống kê theo ngôn ngữ")
+    stats_parser.add_argument('--rebuild', action='store_true', help="Tính lại bảng thống kê từ learning_history")
+    stats_parser.set_defaults(handler=cmd_stats)
+
+    ingest_parser = subparsers.add_parser('ingest', help="Nạp từ vựng từ thư mục hoặc nhiều file PDF/DOCX/TXT")
+    ingest_parser.add_argument('paths', nargs='+', help="Thư mục (quét đệ quy), file hoặc mẫu glob (vd. 'tai_lieu/**/*.pdf')")
+    ingest_parser.add_argument('--language', type=lambda value: INGEST_LANGUAGE_ALIASES.get(value, value),
+                               choices=['russian', 'chinese'], required=True,
+                               help="russian (hoặc ru), chinese (hoặc zh)")
+    ingest_parser.add_argument('--max-words', type=int, default=DEFAULT_TRANSLATE_BUDGET,
+                               help="Số từ tối đa lấy từ mỗi file, theo tần suất")
+    ingest_parser.add_argument('--min-count', type=int, default=1, help="Số lần xuất hiện tối thiểu trong file")
+    ingest_parser.add_argument('--workers', type=int, default=MAX_PROCESSES, help="Số process đọc file song song")
+    ingest_parser.add_argument('--batch-files', type=int, default=INGEST_BATCH_FILES,
+                               help="Số file mỗi lô (mỗi lô ghi trong một giao dịch)")
+    ingest_parser.add_argument('--force', action='store_true', help="Nạp lại cả các file đã nạp trước đó")
+    ingest_parser.set_defaults(handler=cmd_ingest)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if st.runtime.exists():
+        run_app()
+    else:
+        sys.exit(run_cli())
\ No newline at end of file
@@ -0,0 +1,115 @@
+"""Các hàm chạy trong process con của nhóm process (tách từ, đọc trang PDF)
+
+Nhóm process dùng spawn nên hàm được gửi sang process con qua pickle theo tên module.
+Streamlit tạo module __main__ mới mỗi lần chạy lại script, nên hàm định nghĩa trong
+thuha.py không pickle được khi có nhiều session; các hàm ở đây được cả ứng dụng và
+process con import theo cùng một tên. Module không import streamlit để process con
+khởi động nhanh.
+"""
+import importlib
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+logger = logging.getLogger("thuha")
+
+CONTEXT_CHARS = 30  # Số ký tự mỗi bên quanh lần xuất hiện đầu tiên của từ
+
+# Tách từ tiếng Trung: file cache từ điển jieba dựng sẵn (dùng chung giữa các process),
+# từ điển người dùng cho thuật ngữ chuyên ngành
+JIEBA_CACHE_FILE = os.environ.get('THUHA_JIEBA_CACHE', os.path.join(tempfile.gettempdir(), 'thuha_jieba.cache'))
+JIEBA_USER_DICT = os.environ.get('THUHA_JIEBA_USER_DICT',
+                                 os.path.join(os.environ.get('THUHA_DICTIONARY_DIR', 'dictionaries'), 'jieba_user.txt'))
+
+_chinese_tokenizer = None
+_chinese_tokenizer_lock = threading.Lock()
+
+
+def load_chinese_tokenizer():
+    """Khởi tạo jieba một lần cho mỗi process từ file cache từ điển dựng sẵn, trả về (tokenizer, thông tin nạp)"""
+    global _chinese_tokenizer
+    with _chinese_tokenizer_lock:
+        if _chinese_tokenizer is not None:
+            return _chinese_tokenizer
+
+        jieba = importlib.import_module('jieba')
+        jieba.setLogLevel(logging.WARNING)
+
+        tokenizer = jieba.dt
+        cache_dir = os.path.dirname(os.path.abspath(JIEBA_CACHE_FILE))
+        os.makedirs(cache_dir, exist_ok=True)
+        tokenizer.cache_file = os.path.abspath(JIEBA_CACHE_FILE)
+        cache_hit = os.path.isfile(tokenizer.cache_file)
+
+        start = time.perf_counter()
+        tokenizer.initialize()
+        user_dict = JIEBA_USER_DICT if os.path.isfile(JIEBA_USER_DICT) else None
+        if user_dict:
+            tokenizer.load_userdict(user_dict)
+        elapsed = time.perf_counter() - start
+
+        info = {
+            'loaded_at': datetime.now().isoformat(timespec='seconds'),
+            'seconds': round(elapsed, 4),
+            'cache_file': tokenizer.cache_file,
+            'cache_hit': cache_hit,
+            'user_dict': user_dict,
+        }
+        logger.info("Đã nạp từ điển jieba trong %.3fs (cache: %s, từ điển người dùng: %s)",
+                    elapsed, "có" if cache_hit else "dựng mới", user_dict or "không")
+        _chinese_tokenizer = (tokenizer, info)
+        return _chinese_tokenizer
+
+
+def tokenize_text(language, text):
+    """Tách một đoạn văn bản thành danh sách (từ, vị trí bắt đầu) đã lọc theo ngôn ngữ"""
+    if language == "russian":
+        pattern = re.compile(r'[а-яА-ЯёЁ]{3,}')  # Ít nhất 3 ký tự cho tiếng Nga
+        words = [(match.group(), match.start()) for match in pattern.finditer(text)]
+        # Lọc từ phổ biến (tùy chọn)
+        common_words = ['и', 'в', 'на', 'с', 'по', 'у', 'о', 'к', 'но', 'а', 'из', 'от', 'до', 'для']
+        filtered_words = [(word, pos) for word, pos in words if word.lower() not in common_words]
+    elif language == "chinese":
+        # Sử dụng jieba để phân đoạn từ (từ điển được nạp một lần cho mỗi process)
+        tokenizer, _ = load_chinese_tokenizer()
+        words = [(word, start) for word, start, _ in tokenizer.tokenize(text)]
+        # Lọc chỉ giữ từ tiếng Trung, ít nhất 1 ký tự, và không phải từ phổ biến
+        chinese_pattern = re.compile(r'^[\u4e00-\u9fff]+$')
+        filtered_words = [(word, pos) for word, pos in words if chinese_pattern.match(word) and len(word) >= 1]
+        # Lọc từ phổ biến (tùy chọn)
+        common_words = ['的', '是', '在', '我', '有', '他', '这', '了', '你', '不', '和', '我们']
+        filtered_words = [(word, pos) for word, pos in filtered_words if word not in common_words]
+    else:
+        return []
+
+    return filtered_words
+
+
+def word_context(text, pos, length, width=CONTEXT_CHARS):
+    """Lấy đoạn văn bản ngắn quanh vị trí xuất hiện của từ"""
+    start = max(0, pos - width)
+    end = min(len(text), pos + length + width)
+    return ' '.join(text[start:end].split())
+
+
+def count_words(language, text):
+    """Đếm từ trong một khối văn bản, trả về (Counter, {từ: (vị trí, ngữ cảnh)}); chạy được trong process con"""
+    counts = Counter()
+    first_seen = {}
+    for word, pos in tokenize_text(language, text):
+        counts[word] += 1
+        if word not in first_seen:
+            first_seen[word] = (pos, word_context(text, pos, len(word)))
+    return counts, first_seen
+
+
+def extract_pdf_page_range(path, start, end):
+    """Trích xuất văn bản các trang [start, end) của file PDF; process con tự mở file theo đường dẫn"""
+    PyPDF2 = importlib.import_module('PyPDF2')
+    reader = PyPDF2.PdfReader(path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, end)]